@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+"""Generator of synthetic vkmz input
+
+Writes tabular and W4M-XCMS (sample metadata, variable metadata, and data
+matrix) input of a given number of intensities. Feature masses are drawn from a
+bundled database, charged by the input polarity, and shifted by a few ppm of
+noise, so most features have predictions like real data. A fraction of features
+have random masses instead.
+
+XCMS data matrices hold features by samples. Missing intensities are written as
+"NA" or "0", and some features are marked as isotopes by CAMERA.
+
+Usage:
+    python benchmarks/generate.py tabular --rows 1000000 -o big.tabular
+    python benchmarks/generate.py w4m-xcms --rows 1000000 -o big
+"""
+
+import argparse
+import math
+import numpy
+import os
+from vkmz import database
+from vkmz.config import PACKAGE_DIRECTORY
+from vkmz.predict import PROTON
+
+# rows written per write() call
+BLOCK_ROWS = 100000
+
+
+def syntheticFeatures(
+    features, database_file, polarity="negative", unknown=0.2, ppm=2, seed=0
+):
+    """Return mz, rt, and intensity arrays of synthetic features.
+
+    Arguments:
+        features (int): number of features
+        database_file (str): path to database to draw masses from
+        polarity (str): polarity of features, "positive" or "negative"
+        unknown (float): fraction of features with random masses
+        ppm (float): standard deviation of mass noise in parts-per-million
+        seed (int): random seed
+    """
+    rng = numpy.random.default_rng(seed)
+    known = database.load(database_file).mass
+    known = known[(known > 50) & (known < 1500)]
+    mass = known[rng.integers(0, len(known), features)]
+    mass *= 1 + rng.normal(0, ppm * 1e-6, features)
+    random = rng.random(features) < unknown
+    mass[random] = rng.uniform(50, 1500, random.sum())
+    if polarity == "positive":
+        mz = mass + PROTON
+    else:
+        mz = mass - PROTON
+    rt = rng.uniform(30, 1200, features)
+    intensity = rng.lognormal(14, 2, features)
+    return mz, rt, intensity
+
+
+def syntheticCells(rows, samples, present=0.7, seed=0):
+    """Return the feature count and (feature, sample) cells of rows intensities.
+
+    Each feature is observed in about the present fraction of samples.
+
+    Arguments:
+        rows (int): number of intensities
+        samples (int): number of samples
+        present (float): fraction of samples observing each feature
+        seed (int): random seed
+    """
+    rng = numpy.random.default_rng(seed + 1)
+    features = max(math.ceil(rows / (samples * present)), 1)
+    while True:
+        observed = rng.random((features, samples)) < present
+        if observed.sum() >= rows:
+            break
+        features += features // 10 + 1
+    feature, sample = numpy.nonzero(observed)
+    feature, sample = feature[:rows], sample[:rows]
+    return int(feature[-1]) + 1 if rows else 0, feature, sample
+
+
+def writeTabular(
+    output,
+    rows,
+    samples=40,
+    database_file=None,
+    polarity="negative",
+    seed=0,
+):
+    """Write a synthetic tabular input file.
+
+    Rows of a feature are consecutive, like tabular files converted from XCMS.
+
+    Arguments:
+        output (str): path to tabular file
+        rows (int): number of rows
+        samples (int): number of samples
+        database_file (str): path to database to draw masses from
+        polarity (str): polarity of features, "positive" or "negative"
+        seed (int): random seed
+    """
+    if database_file is None:
+        database_file = defaultDatabase()
+    features, feature, sample = syntheticCells(rows, samples, seed=seed)
+    mz, rt, intensity = syntheticFeatures(features, database_file, polarity, seed=seed)
+    rng = numpy.random.default_rng(seed + 2)
+    # intensities vary between samples
+    values = intensity[feature] * rng.lognormal(0, 0.3, rows)
+    names = [f"sample_{s}" for s in range(samples)]
+    with open(output, "w") as t_file:
+        t_file.write("sample_name\tpolarity\tmz\trt\tintensity\n")
+        for start in range(0, rows, BLOCK_ROWS):
+            end = min(start + BLOCK_ROWS, rows)
+            t_file.writelines(
+                f"{names[s]}\t{polarity}\t{mz[f]:.10g}\t{rt[f]:.10g}\t{v:.10g}\n"
+                for f, s, v in zip(
+                    feature[start:end].tolist(),
+                    sample[start:end].tolist(),
+                    values[start:end].tolist(),
+                )
+            )
+
+
+def writeXcms(
+    output,
+    rows,
+    samples=40,
+    database_file=None,
+    polarity="negative",
+    isotopes=0.15,
+    seed=0,
+):
+    """Write synthetic W4M-XCMS input files.
+
+    Writes output + "_sampleMetadata.tabular", "_variableMetadata.tabular", and
+    "_dataMatrix.tabular". The data matrix holds about rows intensities.
+
+    Arguments:
+        output (str): path prefix of files
+        rows (int): number of intensities
+        samples (int): number of samples
+        database_file (str): path to database to draw masses from
+        polarity (str): polarity of samples, "positive" or "negative"
+        isotopes (float): fraction of features marked as isotopes by CAMERA
+        seed (int): random seed
+    """
+    if database_file is None:
+        database_file = defaultDatabase()
+    features, feature, sample = syntheticCells(rows, samples, seed=seed)
+    mz, rt, intensity = syntheticFeatures(features, database_file, polarity, seed=seed)
+    rng = numpy.random.default_rng(seed + 2)
+    sign = "+" if polarity == "positive" else "-"
+    names = [f"sample_{s}" for s in range(samples)]
+    with open(output + "_sampleMetadata.tabular", "w") as s_file:
+        s_file.write("sampleMetadata\tclass\tpolarity\n")
+        for s, name in enumerate(names):
+            s_file.write(f"{name}\tclass_{s % 4}\t{polarity}\n")
+    isotope = rng.random(features) < isotopes
+    group = rng.integers(1, max(features // 3, 1) + 1, features)
+    with open(output + "_variableMetadata.tabular", "w") as v_file:
+        v_file.write("variableMetadata\tmz\trt\tisotopes\n")
+        for f in range(features):
+            label = (
+                f"[{group[f]}][M+1]{sign}" if isotope[f] else f"[{group[f]}][M]{sign}"
+            )
+            v_file.write(f"feature_{f}\t{mz[f]:.10g}\t{rt[f]:.10g}\t{label}\n")
+    values = intensity[feature] * rng.lognormal(0, 0.3, len(feature))
+    with open(output + "_dataMatrix.tabular", "w") as m_file:
+        m_file.write("name\t" + "\t".join(names) + "\n")
+        block_features = max(BLOCK_ROWS // samples, 1)
+        for first in range(0, features, block_features):
+            last = min(first + block_features, features)
+            cells = slice(*numpy.searchsorted(feature, [first, last]))
+            # missing intensities are "NA" or "0"
+            matrix = numpy.full((last - first, samples), "NA", dtype=object)
+            matrix[rng.random(matrix.shape) < 0.5] = "0"
+            matrix[feature[cells] - first, sample[cells]] = [
+                f"{v:.10g}" for v in values[cells].tolist()
+            ]
+            m_file.writelines(
+                f"feature_{f}\t" + "\t".join(row) + "\n"
+                for f, row in enumerate(matrix.tolist(), first)
+            )
+
+
+def defaultDatabase():
+    """Path to the default bundled database."""
+    return os.path.join(PACKAGE_DIRECTORY, "databases", "bmrb-light.tsv")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic vkmz input")
+    parser.add_argument("mode", choices=["tabular", "w4m-xcms"], help="Input mode")
+    parser.add_argument(
+        "--rows", type=int, required=True, help="Number of intensities to write"
+    )
+    parser.add_argument(
+        "--output",
+        "-o",
+        required=True,
+        help="Path of tabular file, or path prefix of XCMS files",
+    )
+    parser.add_argument("--samples", type=int, default=40, help="Number of samples")
+    parser.add_argument("--database", default=None, help="Database to draw masses from")
+    parser.add_argument(
+        "--polarity",
+        choices=["positive", "negative"],
+        default="negative",
+        help="Polarity of features",
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed")
+    args = parser.parse_args()
+    if args.mode == "tabular":
+        writeTabular(
+            args.output,
+            args.rows,
+            args.samples,
+            args.database,
+            args.polarity,
+            seed=args.seed,
+        )
+    else:
+        writeXcms(
+            args.output,
+            args.rows,
+            args.samples,
+            args.database,
+            args.polarity,
+            seed=args.seed,
+        )
+
+
+if __name__ == "__main__":
+    main()
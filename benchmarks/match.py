@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""Benchmark of mass matching strategies
+
+Matches random neutral masses against synthetic sorted known mass arrays with
+both strategies of vkmz.predict.Predictor.match(), checks that they agree, and
+reports their times. The "default" column is the strategy match() chooses.
+
+Usage:
+    python benchmarks/match.py [--known 3000 1000000] [--masses 10000 1000000]
+"""
+
+import argparse
+import numpy
+import time
+from vkmz.database import Database
+from vkmz.predict import Predictor
+
+
+class SyntheticPredictor(Predictor):
+    """Predictor of a synthetic database of random known masses.
+
+    Arguments:
+        known (int): number of known masses
+        seed (int): random seed
+    """
+
+    def __init__(self, known, seed=0):
+        super().__init__(None, 10)
+        rng = numpy.random.default_rng(seed)
+        self.synthetic = Database(
+            numpy.sort(rng.uniform(50, 1000, known)), [], None, None, None, None, []
+        )
+
+    def load(self):
+        return self.synthetic
+
+
+def timeMatch(predictor, masses, strategy):
+    """Return seconds taken to match masses, and the matches.
+
+    Arguments:
+        predictor (Predictor): predictor to match with
+        masses (array): neutral masses
+        strategy (str): match() strategy
+    """
+    start = time.perf_counter()
+    result = predictor.match(masses, strategy)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Predictor.match()")
+    parser.add_argument(
+        "--known",
+        type=int,
+        nargs="+",
+        default=[3000, 100000, 1000000],
+        help="Numbers of known masses",
+    )
+    parser.add_argument(
+        "--masses",
+        type=int,
+        nargs="+",
+        default=[10000, 100000, 1000000],
+        help="Numbers of masses to match",
+    )
+    args = parser.parse_args()
+    rng = numpy.random.default_rng(1)
+    print("known\tmasses\tsearch_seconds\tmerge_seconds\tdefault")
+    for known in args.known:
+        predictor = SyntheticPredictor(known)
+        for size in args.masses:
+            masses = rng.uniform(100, 900, size)
+            search, expected = timeMatch(predictor, masses, "search")
+            merge, result = timeMatch(predictor, masses, "merge")
+            if not all(numpy.array_equal(e, r) for e, r in zip(expected, result)):
+                raise AssertionError(f"strategies disagree at {known}, {size}")
+            default = predictor.matchStrategy(size)
+            print(f"{known}\t{size}\t{search:.3f}\t{merge:.3f}\t{default}")
+
+
+if __name__ == "__main__":
+    main()
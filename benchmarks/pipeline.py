@@ -0,0 +1,280 @@
+#!/usr/bin/env python
+"""Benchmark of the stages of a vkmz run
+
+Generates synthetic tabular and W4M-XCMS input of increasing size, see
+generate.py, and times each stage of vkmz.run(): reading input, predicting
+formulas, and writing tabular, JSON payload, html, and SQL output.
+
+Each stage reports wall and CPU seconds, and the peak memory it allocated as
+traced by tracemalloc, which includes numpy arrays but not sqlite3's own memory.
+Tracing slows Python down, so peaks are measured in a second, untimed pass.
+
+Results are printed as tab-separated values and can be saved as JSON. Given the
+JSON of an earlier run as --baseline, stages slower by more than --tolerance are
+listed and the exit status is 1.
+
+Usage:
+    python benchmarks/pipeline.py [--modes tabular w4m-xcms]
+        [--sizes 10000 100000 1000000] [--json results.json]
+        [--baseline baseline.json]
+"""
+
+import argparse
+import datetime
+import json
+import numpy
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from generate import writeTabular, writeXcms
+from vkmz.config import Config
+from vkmz.predict import Predictor
+from vkmz.read import TABULAR_READERS, xcmsTabularStore
+import vkmz.write as write
+
+# stages of a run, in order
+STAGES = ("read", "predict", "tabular", "generateJson", "html", "sql")
+
+
+def generateInput(mode, rows, directory, reader="columnar"):
+    """Write synthetic input and return the Config of a run on it.
+
+    Arguments:
+        mode (str): "tabular" or "w4m-xcms"
+        rows (int): number of intensities
+        directory (str): directory of input and output files
+        reader (str): reader of tabular input, see vkmz.read.TABULAR_READERS
+    """
+    prefix = os.path.join(directory, f"{mode}{rows}")
+    output = prefix + "_output"
+    if mode == "tabular":
+        writeTabular(prefix + ".tabular", rows)
+        return Config(
+            mode, output, input=prefix + ".tabular", mass_error=10, reader=reader
+        )
+    writeXcms(prefix, rows)
+    return Config(
+        mode,
+        output,
+        data_matrix=prefix + "_dataMatrix.tabular",
+        sample_metadata=prefix + "_sampleMetadata.tabular",
+        variable_metadata=prefix + "_variableMetadata.tabular",
+        mass_error=10,
+        impute=True,
+    )
+
+
+def stages(config):
+    """Yield the name and function of each stage of a run.
+
+    Each function takes the result of the previous stage.
+
+    Arguments:
+        config (Config): settings of run
+    """
+
+    def read(_):
+        if config.mode == "tabular":
+            readTabular = TABULAR_READERS[config.reader]
+            return readTabular(config.input, config.polarity, config.impute)
+        return xcmsTabularStore(
+            config.sample_metadata,
+            config.variable_metadata,
+            config.data_matrix,
+            config.polarity,
+            config.impute,
+        )
+
+    def predict(store):
+        predictor = Predictor(config.databasePath(), config.mass_error)
+        predicted = predictor.predictStore(store)
+        predictor.close()
+        return store.filter(predicted)
+
+    def tabular(store):
+        write.tabular(store, config)
+        return store
+
+    def generateJson(store):
+        return store, write.generateJson(store)
+
+    def html(result):
+        store, j_objs = result
+        write.html(j_objs, config)
+        return store
+
+    def sql(store):
+        # SqlWriter does not replace an existing database
+        if os.path.exists(config.output + ".db"):
+            os.remove(config.output + ".db")
+        write.sql(store, config)
+        return store
+
+    for function in (read, predict, tabular, generateJson, html, sql):
+        yield function.__name__, function
+
+
+def timeStages(config):
+    """Return wall and CPU seconds of each stage of a run.
+
+    Arguments:
+        config (Config): settings of run
+    """
+    times = {}
+    result = None
+    for stage, function in stages(config):
+        wall, cpu = time.perf_counter(), time.process_time()
+        result = function(result)
+        times[stage] = (time.perf_counter() - wall, time.process_time() - cpu)
+    return times
+
+
+def traceStages(config):
+    """Return peak bytes allocated by each stage of a run.
+
+    Arguments:
+        config (Config): settings of run
+    """
+    peaks = {}
+    result = None
+    for stage, function in stages(config):
+        tracemalloc.start()
+        result = function(result)
+        peaks[stage] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return peaks
+
+
+def environment():
+    """Return a description of the benchmark environment."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "date": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "numpy": numpy.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "cpus": os.cpu_count(),
+        "commit": commit or None,
+    }
+
+
+def regressions(results, baseline, tolerance):
+    """Return results slower than baseline results by more than tolerance.
+
+    Returns a list of (result, baseline seconds) pairs.
+
+    Arguments:
+        results (list): results of this run
+        baseline (list): results of an earlier run
+        tolerance (float): allowed fraction of extra time
+    """
+    earlier = {(r["mode"], r["rows"], r["stage"]): r["seconds"] for r in baseline}
+    slower = []
+    for result in results:
+        seconds = earlier.get((result["mode"], result["rows"], result["stage"]))
+        if seconds is not None and result["seconds"] > seconds * (1 + tolerance):
+            slower.append((result, seconds))
+    return slower
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stages of vkmz")
+    parser.add_argument(
+        "--modes",
+        nargs="+",
+        choices=["tabular", "w4m-xcms"],
+        default=["tabular", "w4m-xcms"],
+        help="Input modes",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10000, 100000, 1000000],
+        help="Numbers of intensities, up to 10000000",
+    )
+    parser.add_argument(
+        "--reader",
+        choices=list(TABULAR_READERS),
+        default="columnar",
+        help="Reader of tabular input",
+    )
+    parser.add_argument(
+        "--no-memory",
+        dest="memory",
+        action="store_false",
+        help="Skip the traced pass which measures peak memory",
+    )
+    parser.add_argument("--json", help="Save results to a JSON file")
+    parser.add_argument("--baseline", help="JSON results to compare against")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="Fraction of extra time over --baseline reported as a regression",
+    )
+    parser.add_argument(
+        "--directory", help="Directory of generated files, defaults to a temporary one"
+    )
+    args = parser.parse_args()
+    results = []
+    print("mode\trows\tstage\tseconds\tcpu_seconds\tpeak_mib")
+    with tempfile.TemporaryDirectory(dir=args.directory) as directory:
+        for mode in args.modes:
+            for rows in args.sizes:
+                config = generateInput(mode, rows, directory, args.reader)
+                times = timeStages(config)
+                peaks = traceStages(config) if args.memory else {}
+                for stage in STAGES:
+                    seconds, cpu_seconds = times[stage]
+                    peak = peaks.get(stage)
+                    results.append(
+                        {
+                            "mode": mode,
+                            "rows": rows,
+                            "stage": stage,
+                            "seconds": seconds,
+                            "cpu_seconds": cpu_seconds,
+                            "peak_bytes": peak,
+                        }
+                    )
+                    peak_mib = "NA" if peak is None else f"{peak / 2**20:.1f}"
+                    print(
+                        f"{mode}\t{rows}\t{stage}\t{seconds:.3f}\t"
+                        f"{cpu_seconds:.3f}\t{peak_mib}",
+                        flush=True,
+                    )
+                for name in os.listdir(directory):
+                    os.remove(os.path.join(directory, name))
+    if args.json:
+        with open(args.json, "w") as j_file:
+            json.dump({"environment": environment(), "results": results}, j_file)
+    if args.baseline:
+        with open(args.baseline) as b_file:
+            baseline = json.load(b_file)["results"]
+        slower = regressions(results, baseline, args.tolerance)
+        for result, seconds in slower:
+            print(
+                f"regression: {result['mode']} {result['rows']} {result['stage']} "
+                f"{result['seconds']:.3f}s, was {seconds:.3f}s",
+                file=sys.stderr,
+            )
+        if slower:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
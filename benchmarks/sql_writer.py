@@ -0,0 +1,71 @@
+#!/usr/bin/env python
+"""Benchmark of the SQL writer
+
+Writes synthetic FeatureStores of increasing size with vkmz.write.SqlWriter and
+reports the time per sample-feature intensity. Time per intensity should stay
+roughly constant as the number of intensities grows.
+
+Usage:
+    python benchmarks/sql_writer.py [--sizes 10000 100000 1000000]
+"""
+
+import argparse
+import os
+import random
+import tempfile
+import time
+from vkmz.config import Config
+from vkmz.objects import FeatureStore, Prediction
+from vkmz.write import SqlWriter
+
+
+def syntheticStore(intensities, samples=20, seed=0):
+    """Return a FeatureStore with one prediction per feature.
+
+    Arguments:
+        intensities (int): number of sample-feature intensities
+        samples (int): number of samples
+        seed (int): random seed
+    """
+    rng = random.Random(seed)
+    store = FeatureStore()
+    features = max(intensities // samples, 1)
+    for s in range(samples):
+        store.addSample(f"sample{s}")
+    for f in range(features):
+        mz = rng.uniform(100, 1000)
+        index = store.addFeature(f"feature{f}", "positive", mz, rng.uniform(0, 1200))
+        store.predictions[index] = [
+            Prediction(mz, "C6H12O6", 0.1, {"C": 6, "H": 12, "O": 6}, 2.0, 1.0, 0.0)
+        ]
+    for i in range(intensities):
+        store.addIntensity(i % samples, i // samples % features, rng.uniform(1, 1e6))
+    store.freeze()
+    return store
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vkmz.write.SqlWriter")
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[10000, 100000, 1000000],
+        help="Numbers of sample-feature intensities to write",
+    )
+    args = parser.parse_args()
+    print("intensities\tseconds\tmicroseconds_per_intensity")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            store = syntheticStore(size)
+            output = os.path.join(directory, f"bench{size}")
+            start = time.perf_counter()
+            writer = SqlWriter(Config("tabular", output, sql=True))
+            writer.write(store)
+            writer.close()
+            seconds = time.perf_counter() - start
+            print(f"{size}\t{seconds:.3f}\t{seconds / size * 1e6:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+#!/usr/bin/env python
+"""Benchmark of predicting features with worker processes
+
+Predicts random neutral masses against a synthetic compiled database with
+vkmz.predict.Predictor.predictStore() and increasing numbers of workers, checks
+that predictions do not change, and reports their times.
+
+Workers search and select matches, and the calling process makes Prediction
+objects of selected matches. "parent_cpu" is the CPU time of the calling
+process, which workers do not reduce below the time taken to make Prediction
+objects. Wall time only improves with as many free cores as workers.
+
+Usage:
+    python benchmarks/workers.py [--known 1000000] [--features 1000000]
+        [--workers 1 2 4]
+"""
+
+import argparse
+import numpy
+import os
+import tempfile
+import time
+from vkmz.database import Database, writeCompiled
+from vkmz.objects import FeatureStore
+from vkmz.predict import Predictor
+
+
+def writeDatabase(path, known, seed=0):
+    """Write a compiled database of random known masses.
+
+    Arguments:
+        path (str): path to write compiled database to
+        known (int): number of known masses
+        seed (int): random seed
+    """
+    rng = numpy.random.default_rng(seed)
+    database = Database(
+        numpy.sort(rng.uniform(50, 1000, known)),
+        [f"C{i % 50 + 1}H{i % 97 + 1}O{i % 13 + 1}" for i in range(known)],
+        rng.uniform(0, 2, (known, 3)),
+        numpy.zeros(known + 1, dtype=numpy.uint64),
+        numpy.zeros(0, dtype=numpy.uint32),
+        numpy.zeros(0, dtype=numpy.uint8),
+        [],
+    )
+    writeCompiled(database, path)
+
+
+def createStore(features, seed=1):
+    """Return a FeatureStore of features with random neutral masses.
+
+    Arguments:
+        features (int): number of features
+        seed (int): random seed
+    """
+    rng = numpy.random.default_rng(seed)
+    store = FeatureStore()
+    store.feature_names = [str(i) for i in range(features)]
+    store.polarity = numpy.zeros(features, dtype=numpy.int8)
+    store.mz = rng.uniform(100, 900, features)
+    store.rt = numpy.zeros(features)
+    store.charge = numpy.ones(features)
+    store.predictions = [[] for _ in range(features)]
+    return store.freeze()
+
+
+def timePredict(database_file, mass_error, alternate, workers, features):
+    """Return wall and parent CPU seconds taken to predict features, and results.
+
+    Worker processes are started before timing.
+
+    Arguments:
+        database_file (str): path to compiled database
+        mass_error (float): mass error in parts-per-million
+        alternate (bool): keep features with multiple predictions
+        workers (int): number of worker processes
+        features (int): number of features
+    """
+    store = createStore(features)
+    predictor = Predictor(
+        database_file, mass_error, neutral=True, alternate=alternate, workers=workers
+    )
+    predictor.load()
+    if workers > 1:
+        predictor.pool().submit(int).result()
+    try:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        predicted = predictor.predictStore(store)
+        cpu = time.process_time() - cpu
+        wall = time.perf_counter() - wall
+    finally:
+        predictor.close()
+    results = [
+        [(p.formula, p.mass, p.delta) for p in store.predictions[i]]
+        for i in numpy.flatnonzero(predicted).tolist()
+    ]
+    return wall, cpu, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark --workers")
+    parser.add_argument(
+        "--known", type=int, default=1000000, help="Number of known masses"
+    )
+    parser.add_argument(
+        "--features", type=int, default=1000000, help="Number of features"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        nargs="+",
+        default=[1, 2, 4],
+        help="Numbers of worker processes",
+    )
+    parser.add_argument(
+        "--error", type=float, default=1, help="Mass error in parts-per-million"
+    )
+    parser.add_argument(
+        "--alternate", action="store_true", help="Keep multiple predictions"
+    )
+    args = parser.parse_args()
+    print(f"cores\t{len(os.sched_getaffinity(0))}")
+    print("workers\twall_seconds\tparent_cpu_seconds\tspeedup\tpredicted")
+    with tempfile.TemporaryDirectory() as directory:
+        database_file = os.path.join(directory, "synthetic.vkdb")
+        writeDatabase(database_file, args.known)
+        expected = None
+        for workers in args.workers:
+            wall, cpu, results = timePredict(
+                database_file, args.error, args.alternate, workers, args.features
+            )
+            if expected is None:
+                expected, single = results, wall
+            elif results != expected:
+                raise AssertionError(f"predictions differ with {workers} workers")
+            print(
+                f"{workers}\t{wall:.3f}\t{cpu:.3f}\t{single / wall:.2f}\t{len(results)}"
+            )
+
+
+if __name__ == "__main__":
+    main()
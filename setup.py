@@ -9,6 +9,13 @@ setuptools.setup(
     author_email="eslerm@umn.edu",
     url="https://github.com/HegemanLab/vkmz",
     packages=setuptools.find_packages(),
-    entry_points={"console_scripts": ["vkmz = vkmz.__main__:main"]},
+    install_requires=["numpy"],
+    extras_require={"parquet": ["pyarrow"], "zstd": ["zstandard"]},
+    entry_points={
+        "console_scripts": [
+            "vkmz = vkmz.__main__:main",
+            "vkmz-compile-database = vkmz.database:main",
+        ]
+    },
     package_data={"vkmz": ["d3.html", "overlay.png", "databases/*"]},
 )
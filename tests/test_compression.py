@@ -0,0 +1,99 @@
+"""Compressed input and output compared with uncompressed files"""
+
+import gzip
+import os
+import pytest
+from vkmz import compression, run
+from vkmz.config import Config
+
+TABULAR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "test-data", "tabular.tabular"
+)
+
+
+@pytest.fixture(params=["gzip", "zstd"])
+def method(request):
+    if request.param == "zstd":
+        pytest.importorskip("zstandard")
+    return request.param
+
+
+def compress(data, method):
+    """Compress bytes without vkmz.compression."""
+    if method == "gzip":
+        return gzip.compress(data)
+    import zstandard
+
+    return zstandard.ZstdCompressor().compress(data)
+
+
+def decompress(path, method):
+    """Decompress a file without vkmz.compression."""
+    with open(path, "rb") as h_file:
+        data = h_file.read()
+    if method == "gzip":
+        return gzip.decompress(data)
+    import zstandard
+
+    return zstandard.ZstdDecompressor().decompressobj().decompress(data)
+
+
+def readBytes(path):
+    with open(path, "rb") as h_file:
+        return h_file.read()
+
+
+@pytest.mark.parametrize("block_size", [compression.BLOCK_SIZE, 7])
+def test_round_trip(tmp_path, monkeypatch, method, block_size):
+    # blocks smaller than lines are passed through the queue in order
+    monkeypatch.setattr(compression, "BLOCK_SIZE", block_size)
+    monkeypatch.setattr(compression, "QUEUE_BLOCKS", 2)
+    text = "".join(f"line {i}\tü\n" for i in range(10000))
+    path = compression.outputPath(str(tmp_path / "out.txt"), method)
+    assert path.endswith(compression.COMPRESSIONS[method][1])
+    with compression.openOutput(path, method, encoding="utf-8") as h_file:
+        h_file.write(text)
+    assert decompress(path, method) == text.encode("utf-8")
+    assert compression.detectCompression(path) == method
+    with compression.openInput(path, encoding="utf-8") as h_file:
+        assert h_file.read() == text
+
+
+def test_detect_suffix(tmp_path, method):
+    # files without magic bytes are detected by their suffix
+    path = tmp_path / ("empty" + compression.COMPRESSIONS[method][1])
+    path.write_bytes(b"")
+    assert compression.detectCompression(str(path)) == method
+    plain = tmp_path / "plain.tabular"
+    plain.write_bytes(b"sample_name\n")
+    assert compression.detectCompression(str(plain)) is None
+
+
+@pytest.fixture(scope="module")
+def full(tmp_path_factory):
+    output = str(tmp_path_factory.mktemp("full") / "full")
+    run(Config("tabular", output, input=TABULAR, mass_error=10, json=True))
+    return output
+
+
+@pytest.mark.parametrize("reader", ["columnar", "parallel", "csv"])
+def test_compressed_run(tmp_path, full, method, reader):
+    input_file = tmp_path / "input.tabular"
+    input_file.write_bytes(compress(readBytes(TABULAR), method))
+    output = str(tmp_path / "out")
+    run(
+        Config(
+            "tabular",
+            output,
+            input=str(input_file),
+            mass_error=10,
+            json=True,
+            compress=method,
+            reader=reader,
+        )
+    )
+    suffix = compression.COMPRESSIONS[method][1]
+    for extension in (".tabular", ".json"):
+        decompressed = decompress(output + extension + suffix, method)
+        assert decompressed == readBytes(full + extension)
+    assert readBytes(output + ".html") == readBytes(full + ".html")
@@ -0,0 +1,45 @@
+"""Settings implied by other settings, from the library and the command line"""
+
+import pytest
+from vkmz import arguments
+from vkmz.config import Config
+
+
+def test_implied():
+    assert Config("tabular", "foo", normalized_sql=True).sql
+    assert Config("tabular", "foo", append=True).sql
+    assert Config("tabular", "foo", cprofile=True).profile
+    assert not Config("tabular", "foo").sql
+
+
+def test_append_stream():
+    with pytest.raises(ValueError):
+        Config("tabular", "foo", append=True, stream=True)
+
+
+@pytest.mark.parametrize("mode", ["w4m-xcms", "formula", "sql"])
+def test_stream_modes(mode):
+    with pytest.raises(ValueError):
+        Config(mode, "foo", stream=True)
+    assert Config("tabular", "foo", stream=True).stream
+
+
+def test_arguments():
+    config = arguments.parse(
+        ["tabular", "-i", "in.tabular", "-o", "foo", "-e", "5", "--append"]
+    )
+    assert config.sql and config.append
+    with pytest.raises(SystemExit):
+        arguments.parse(
+            [
+                "tabular",
+                "-i",
+                "in.tabular",
+                "-o",
+                "foo",
+                "-e",
+                "5",
+                "--append",
+                "--stream",
+            ]
+        )
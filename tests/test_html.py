@@ -0,0 +1,153 @@
+"""Binary html payloads and density grids compared with the JSON payload"""
+
+import base64
+import json
+import os
+import numpy
+import pytest
+from vkmz import run
+from vkmz.config import Config
+from vkmz.write import TYPED_ARRAYS
+
+TABULAR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "test-data", "tabular.tabular"
+)
+
+# numpy dtype of each JavaScript typed array
+DTYPES = {typed_array: dtype for dtype, typed_array in TYPED_ARRAYS.items()}
+
+
+def runTabular(directory, name, **settings):
+    """Run vkmz on test-data/tabular.tabular and return the output path."""
+    output = str(directory / name)
+    run(Config("tabular", output, input=TABULAR, mass_error=10, **settings))
+    return output
+
+
+def readJson(path):
+    with open(path) as j_file:
+        return json.load(j_file)
+
+
+def readPayload(path):
+    """Return the payload of an html output file."""
+    with open(path, encoding="utf-8") as h_file:
+        for line in h_file:
+            if line.startswith("var payload = "):
+                return json.loads(line[len("var payload = ") :])
+
+
+def decodeArray(array):
+    """Decode a typed array, as decodeArray() of d3.html does."""
+    return numpy.frombuffer(base64.b64decode(array["data"]), DTYPES[array["type"]])
+
+
+def decodePayload(payload):
+    """Convert a binary payload to a JSON payload, as decodePayload() of d3.html
+    does."""
+    strings = payload["strings"]
+
+    def decodeStrings(array):
+        return [strings[i] for i in decodeArray(array)]
+
+    f = payload["features"]
+    p = payload["predictions"]
+    offset = decodeArray(f["prediction_offset"])
+    columns = {
+        "formula": decodeStrings(p["formula"]),
+        "mass": decodeArray(p["mass"]).tolist(),
+        "delta": decodeArray(p["delta"]).tolist(),
+        "hc": decodeArray(p["hc"]).tolist(),
+        "oc": decodeArray(p["oc"]).tolist(),
+        "nc": decodeArray(p["nc"]).tolist(),
+    }
+    prediction = [
+        [{key: column[j] for key, column in columns.items()} for j in range(a, b)]
+        for a, b in zip(offset[:-1].tolist(), offset[1:].tolist())
+    ]
+    intensities = payload["intensities"]
+    return {
+        "samples": decodeStrings(payload["samples"]),
+        "features": {
+            "name": decodeStrings(f["name"]),
+            "polarity": decodeStrings(f["polarity"]),
+            "mz": decodeArray(f["mz"]).tolist(),
+            "rt": decodeArray(f["rt"]).tolist(),
+            "prediction": prediction,
+        },
+        "intensities": {
+            key: decodeArray(intensities[key]).tolist()
+            for key in ("sample", "feature", "intensity")
+        },
+    }
+
+
+def intensityRows(payload):
+    """Return the sorted (sample, feature, intensity) rows of a payload."""
+    intensities = payload["intensities"]
+    return sorted(
+        zip(intensities["sample"], intensities["feature"], intensities["intensity"])
+    )
+
+
+@pytest.fixture(scope="module")
+def full(tmp_path_factory):
+    return runTabular(tmp_path_factory.mktemp("full"), "full", json=True)
+
+
+def test_binary_payload(tmp_path, full):
+    output = runTabular(tmp_path, "binary", html_payload="binary")
+    payload = readPayload(output + ".html")
+    assert payload["format"] == "binary"
+    decoded = decodePayload(payload)
+    expected = readJson(full + ".json")
+    assert decoded["samples"] == expected["samples"]
+    for key in ("name", "polarity", "mz", "rt"):
+        assert decoded["features"][key] == expected["features"][key]
+    for predictions, expected_predictions in zip(
+        decoded["features"]["prediction"], expected["features"]["prediction"]
+    ):
+        assert len(predictions) == len(expected_predictions)
+        for p, expected_p in zip(predictions, expected_predictions):
+            for key in ("formula", "mass", "delta"):
+                assert p[key] == expected_p[key]
+            # ratios are 32-bit floats
+            for key in ("hc", "oc", "nc"):
+                assert p[key] == float(numpy.float32(expected_p[key]))
+    assert intensityRows(decoded) == intensityRows(expected)
+    # intensities are in drawing order, largest first
+    intensity = decoded["intensities"]["intensity"]
+    assert intensity == sorted(intensity, reverse=True)
+
+
+def test_json_payload(full):
+    assert readPayload(full + ".html") == readJson(full + ".json")
+
+
+def test_density_sidecar(tmp_path, full):
+    output = runTabular(tmp_path, "sidecar", density="sidecar")
+    assert "density" not in readPayload(output + ".html")
+    density = readJson(output + "_density.json")
+    # each grid holds the intensities of its sample and polarity
+    expected = readJson(full + ".json")
+    polarity = expected["features"]["polarity"]
+    totals = {}
+    for sample, feature, intensity in intensityRows(expected):
+        key = (expected["samples"][sample], polarity[feature])
+        totals[key] = totals.get(key, 0.0) + intensity
+    assert density["grids"]
+    for grid in density["grids"]:
+        cells = decodeArray(grid["cells"])
+        assert (cells < grid["resolution"] ** 2).all()
+        total = totals[(grid["sample"], grid["polarity"])]
+        assert decodeArray(grid["values"]).sum(dtype=numpy.float64) == pytest.approx(
+            total, rel=1e-6
+        )
+
+
+def test_density_embed(tmp_path):
+    sidecar = runTabular(tmp_path, "sidecar", density="sidecar")
+    embed = runTabular(tmp_path, "embed", density="embed")
+    payload = readPayload(embed + ".html")
+    assert payload.pop("density") == readJson(sidecar + "_density.json")
+    assert payload == readPayload(sidecar + ".html")
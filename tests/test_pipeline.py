@@ -0,0 +1,147 @@
+"""Streamed and appended runs make the same output as a full run"""
+
+import json
+import os
+import pytest
+from vkmz import run
+from vkmz.config import Config
+
+TABULAR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "test-data", "tabular.tabular"
+)
+
+
+def runTabular(directory, name, **settings):
+    """Run vkmz on test-data/tabular.tabular and return the output path."""
+    output = str(directory / name)
+    run(Config("tabular", output, input=TABULAR, mass_error=10, **settings))
+    return output
+
+
+def readText(path):
+    with open(path) as r_file:
+        return r_file.read()
+
+
+@pytest.fixture(scope="module")
+def full(tmp_path_factory):
+    return runTabular(tmp_path_factory.mktemp("full"), "full", json=True)
+
+
+@pytest.mark.parametrize("chunk_size", [333, 1000, 5000, 100000])
+def test_stream(tmp_path, full, chunk_size):
+    output = runTabular(
+        tmp_path, "stream", json=True, stream=True, chunk_size=chunk_size
+    )
+    assert readText(output + ".json") == readText(full + ".json")
+    assert readText(output + ".html") == readText(full + ".html")
+    # streamed tabular rows are in input order instead of grouped by sample
+    full_lines = readText(full + ".tabular").splitlines()
+    stream_lines = readText(output + ".tabular").splitlines()
+    assert stream_lines[0] == full_lines[0]
+    assert sorted(stream_lines) == sorted(full_lines)
+
+
+def writeSamples(path, lines, samples):
+    """Write the header and the rows of samples, grouped by sample."""
+    with open(path, "w") as t_file:
+        t_file.write(lines[0])
+        for sample in samples:
+            t_file.writelines(l for l in lines[1:] if l.split("\t", 1)[0] == sample)
+    return str(path)
+
+
+@pytest.fixture(scope="module")
+def batches(tmp_path_factory):
+    """Return input of all samples, and of two overlapping batches of samples."""
+    directory = tmp_path_factory.mktemp("batches")
+    with open(TABULAR) as t_file:
+        lines = t_file.readlines()
+    samples = list(dict.fromkeys(l.split("\t", 1)[0] for l in lines[1:]))
+    return (
+        writeSamples(directory / "all.tabular", lines, samples),
+        writeSamples(directory / "first.tabular", lines, samples[:30]),
+        writeSamples(directory / "last.tabular", lines, samples[20:]),
+    )
+
+
+@pytest.mark.parametrize(
+    "settings",
+    [
+        {},
+        {"normalized_sql": True},
+        {"adducts": ["[M+H]+", "[M+Na]+", "[M-H]-"], "alternate": True},
+    ],
+)
+def test_append(tmp_path, batches, settings):
+    all_samples, first, last = batches
+    if "adducts" in settings:
+        settings = dict(settings, parquet=True)
+        pytest.importorskip("pyarrow")
+    full = str(tmp_path / "full")
+    run(
+        Config(
+            "tabular",
+            full,
+            input=all_samples,
+            mass_error=10,
+            json=True,
+            sql=True,
+            **settings,
+        )
+    )
+    output = str(tmp_path / "append")
+    for batch in (first, last):
+        run(
+            Config(
+                "tabular",
+                output,
+                input=batch,
+                mass_error=10,
+                json=True,
+                append=True,
+                **settings,
+            )
+        )
+    for extension in (".tabular", ".json", ".html"):
+        assert readText(output + extension) == readText(full + extension)
+    if "parquet" in settings:
+        import pyarrow.parquet
+
+        assert pyarrow.parquet.read_table(output + ".parquet").equals(
+            pyarrow.parquet.read_table(full + ".parquet")
+        )
+
+
+def test_append_adducts(tmp_path, batches):
+    all_samples, first, last = batches
+    output = str(tmp_path / "append")
+    adducts = ["[M+H]+", "[M-H]-"]
+    run(
+        Config(
+            "tabular", output, input=first, mass_error=10, adducts=adducts, append=True
+        )
+    )
+    for other in (None, ["[M+H]+", "[M+Na]+", "[M-H]-"]):
+        with pytest.raises(ValueError):
+            run(
+                Config(
+                    "tabular",
+                    output,
+                    input=last,
+                    mass_error=10,
+                    adducts=other,
+                    append=True,
+                )
+            )
+    # the order of adducts does not matter
+    run(
+        Config(
+            "tabular",
+            output,
+            input=last,
+            mass_error=10,
+            adducts=adducts[::-1],
+            append=True,
+        )
+    )
@@ -0,0 +1,135 @@
+"""Equivalence of batch and per-feature predictions with vkmz 1.x
+
+Every prediction path of vkmz.predict.Predictor must make the same predictions
+as the recursive binary search and neighbour walk of vkmz before the batch API
+was added. Those predictions, for the features of test-data/tabular.tabular, are
+frozen in data/baseline_predictions.json, in the order the search found them.
+
+Since 1.5.0, alternate predictions are sorted by absolute delta, see
+CHANGELOG.md. Expected predictions are the baseline predictions stably sorted
+by absolute delta, so ties keep the baseline order.
+"""
+
+import json
+import os
+import pytest
+from vkmz import database, predict
+from vkmz.config import PACKAGE_DIRECTORY
+from vkmz.predict import Predictor
+from vkmz.read import tabularStore
+
+TESTS = os.path.dirname(os.path.abspath(__file__))
+TABULAR = os.path.join(TESTS, "..", "test-data", "tabular.tabular")
+BASELINE = os.path.join(TESTS, "data", "baseline_predictions.json")
+DATABASE = os.path.join(PACKAGE_DIRECTORY, "databases", "bmrb-light.tsv")
+MASS_ERRORS = [2, 5, 10, 50]
+# options of each set of baseline predictions
+OPTIONS = {
+    "default": {"neutral": False, "alternate": False},
+    "alternate": {"neutral": False, "alternate": True},
+    "neutral": {"neutral": True, "alternate": False},
+    "neutral-alternate": {"neutral": True, "alternate": True},
+}
+
+with open(BASELINE) as b_file:
+    baseline = json.load(b_file)
+
+
+def summarize(predictions):
+    """Return the formula, mass, and delta of each prediction, in order."""
+    return [[p.formula, p.mass, p.delta] for p in predictions]
+
+
+def storePredictions(predictor):
+    """Return the predictions made by Predictor.predictStore() by feature name."""
+    store = tabularStore(TABULAR)
+    try:
+        predicted = predictor.predictStore(store)
+    finally:
+        predictor.close()
+    return {
+        store.feature_names[i]: summarize(store.predictions[i])
+        for i in range(len(store.feature_names))
+        if predicted[i]
+    }
+
+
+@pytest.fixture(scope="module", params=MASS_ERRORS)
+def mass_error(request):
+    return request.param
+
+
+@pytest.fixture(scope="module", params=list(OPTIONS))
+def options(request):
+    return request.param
+
+
+@pytest.fixture(scope="module")
+def expected(mass_error, options):
+    return {
+        name: sorted(predictions, key=lambda p: abs(p[2]))
+        for name, predictions in baseline[str(mass_error)][options].items()
+    }
+
+
+def createPredictor(mass_error, options, **kwargs):
+    return Predictor(DATABASE, mass_error, **OPTIONS[options], **kwargs)
+
+
+def test_baseline_predicts():
+    assert baseline["50"]["alternate"]
+    # some features have several predictions, so their order is checked
+    assert any(len(p) > 2 for p in baseline["50"]["alternate"].values())
+
+
+def test_predict(mass_error, options, expected):
+    store = tabularStore(TABULAR)
+    predictor = createPredictor(mass_error, options)
+    results = {}
+    for i in range(len(store.feature_names)):
+        feature = store.feature(i)
+        if predictor.predict(feature):
+            results[feature.name] = summarize(feature.predictions)
+    assert results == expected
+
+
+def test_predictBatch(mass_error, options, expected):
+    store = tabularStore(TABULAR)
+    features = [store.feature(i) for i in range(len(store.feature_names))]
+    predictor = createPredictor(mass_error, options)
+    results = predictor.predictBatch(features, predictor.neutralMasses(features))
+    assert {f.name: summarize(f.predictions) for f in results if f} == expected
+
+
+def test_predictStore(mass_error, options, expected):
+    assert storePredictions(createPredictor(mass_error, options)) == expected
+
+
+@pytest.mark.parametrize("strategy", ["search", "merge"])
+def test_strategies(monkeypatch, mass_error, options, expected, strategy):
+    predictor = createPredictor(mass_error, options)
+    monkeypatch.setattr(predictor, "matchStrategy", lambda count: strategy)
+    assert storePredictions(predictor) == expected
+
+
+def test_compiled(tmp_path, mass_error, options, expected):
+    compiled = str(tmp_path / "bmrb-light.vkdb")
+    database.compileDatabase(DATABASE, compiled)
+    predictor = Predictor(compiled, mass_error, **OPTIONS[options])
+    assert storePredictions(predictor) == expected
+
+
+def test_workers(monkeypatch, mass_error, options, expected):
+    monkeypatch.setattr(predict, "WORKER_CHUNK_SIZE", 1)
+    predictor = createPredictor(mass_error, options, workers=2)
+    pools = []
+    pool = predictor.pool
+    monkeypatch.setattr(predictor, "pool", lambda: pools.append(True) or pool())
+    assert storePredictions(predictor) == expected
+    assert pools
+
+
+def test_adducts(mass_error, options, expected):
+    # protonation and deprotonation are the default neutral masses
+    predictor = createPredictor(mass_error, options, adducts=["[M+H]+", "[M-H]-"])
+    assert storePredictions(predictor) == expected
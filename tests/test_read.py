@@ -0,0 +1,181 @@
+"""Columnar readers make the same FeatureStore as the row readers"""
+
+import csv
+import numpy
+import os
+import pytest
+from vkmz import read
+from vkmz.objects import FeatureStore
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "test-data")
+
+TABULAR = (
+    "sample_name\tpolarity\tmz\trt\tintensity\tcharge\n"
+    "s1\tpositive\t100.5\t1.0\t10\t1\n"
+    "s1\tpositive\tNA\t2.0\t20\t\n"
+    "s2\tnegative\t200.5\t3.0\t30\t1\n"
+)
+
+
+def summarize(store):
+    """Return the samples, features, and intensities of a FeatureStore."""
+    store.freeze()
+    return (
+        store.sample_names,
+        store.feature_names,
+        # missing charges are NaN, which is not equal to itself
+        [None if numpy.isnan(c) else c for c in store.charge.tolist()],
+        list(store.intensities()),
+    )
+
+
+@pytest.mark.parametrize("parser", [read.csvColumns, read.arrowColumns])
+def test_dropped_rows_not_parsed(tmp_path, monkeypatch, parser):
+    # the unparsable mz is in a row without charge, which the row reader drops
+    if parser is read.arrowColumns:
+        pytest.importorskip("pyarrow")
+    monkeypatch.setattr(read, "defaultColumnParser", lambda: parser)
+    tabular_file = tmp_path / "input.tabular"
+    tabular_file.write_text(TABULAR)
+    expected = summarize(read.tabularStore(str(tabular_file)))
+    assert len(expected[1]) == 2
+    assert summarize(read.columnarTabularStore(str(tabular_file))) == expected
+
+
+@pytest.mark.parametrize("parser", [read.csvColumns, read.arrowColumns])
+def test_blank_rows(tmp_path, monkeypatch, parser):
+    # blank rows are too short for both parsers and for the row reader
+    if parser is read.arrowColumns:
+        pytest.importorskip("pyarrow")
+    tabular_file = tmp_path / "input.tabular"
+    lines = TABULAR.splitlines(True)
+    tabular_file.write_text("".join(lines[:2]) + "\n" + lines[3])
+    with pytest.raises(read.ColumnParseError):
+        read.tabularColumns(str(tabular_file), parser=parser)
+    monkeypatch.setattr(read, "defaultColumnParser", lambda: parser)
+    with pytest.raises(IndexError):
+        read.tabularStore(str(tabular_file))
+    with pytest.raises(IndexError):
+        read.columnarTabularStore(str(tabular_file))
+
+
+@pytest.mark.parametrize("parser", [read.csvColumns, read.arrowColumns])
+def test_parallel(monkeypatch, parser):
+    # ranges of a few rows are parsed by two processes
+    if parser is read.arrowColumns:
+        pytest.importorskip("pyarrow")
+    monkeypatch.setattr(read, "defaultColumnParser", lambda: parser)
+    monkeypatch.setattr(read, "PARALLEL_RANGE_BYTES", 1000)
+    tabular_file = os.path.join(TEST_DATA, "tabular.tabular")
+    with open(tabular_file, "rb") as h_file:
+        assert len(read.tabularRanges(h_file, 2)) == 2
+    expected = summarize(read.tabularStore(tabular_file))
+    store = read.parallelTabularStore(tabular_file, workers=2)
+    assert summarize(store) == expected
+
+
+def test_parallel_fallback(tmp_path, monkeypatch):
+    # a range which cannot be parsed is left to the row reader
+    monkeypatch.setattr(read, "PARALLEL_RANGE_BYTES", 10)
+    tabular_file = tmp_path / "input.tabular"
+    tabular_file.write_text(TABULAR)
+    expected = summarize(read.tabularStore(str(tabular_file)))
+    store = read.parallelTabularStore(str(tabular_file), workers=2)
+    assert summarize(store) == expected
+
+
+def summarizeAll(store):
+    """Return every column of a FeatureStore."""
+    return summarize(store) + (
+        store.polarity.tolist(),
+        store.mz.tolist(),
+        store.rt.tolist(),
+    )
+
+
+def rowMatrixStore(matrix_file, polarity, mz_rt, charges):
+    """Read a W4M-XCMS data matrix cell by cell, as vkmz 1.x did."""
+    store = FeatureStore()
+    with open(matrix_file) as f:
+        matrix_data = csv.reader(f, delimiter="\t")
+        header = [x for x in next(matrix_data) if x != ""]
+        for row in matrix_data:
+            row = [x for x in row if x != ""]
+            for i in range(1, len(row)):
+                if row[i] in read.MISSING_INTENSITIES:
+                    continue
+                charge = charges[row[0]]
+                if charge == "remove":
+                    break
+                sample = store.addSample(header[i])
+                feature = store.addFeature(
+                    row[0], polarity[header[i]], *mz_rt[row[0]], charge
+                )
+                store.addIntensity(sample, feature, float(row[i]))
+    return store.freeze()
+
+
+@pytest.mark.parametrize("impute", [False, True])
+@pytest.mark.parametrize("block_cells", [read.MATRIX_BLOCK_CELLS, 100])
+def test_data_matrix(monkeypatch, impute, block_cells):
+    monkeypatch.setattr(read, "MATRIX_BLOCK_CELLS", block_cells)
+    arguments = []
+    dataMatrixStore = read.dataMatrixStore
+    monkeypatch.setattr(
+        read,
+        "dataMatrixStore",
+        lambda *args: arguments.append(args) or dataMatrixStore(*args),
+    )
+    store = read.xcmsTabularStore(
+        os.path.join(TEST_DATA, "sampleMetadata.tabular"),
+        os.path.join(TEST_DATA, "variableMetadata.tabular"),
+        os.path.join(TEST_DATA, "datamatrix.tabular"),
+        impute=impute,
+    )
+    matrix_file, polarity, mz_rt, charges = arguments[0][:4]
+    expected = rowMatrixStore(matrix_file, polarity, mz_rt, charges)
+    assert len(expected.feature_names) > 0
+    assert summarizeAll(store) == summarizeAll(expected)
+
+
+MATRIX = (
+    "name\ts1\ts2\ts3\n"
+    "f1\t10\tNA\t0\n"
+    # removed by CAMERA
+    "f2\t20\t30\t40\n"
+    # empty cells are dropped and short rows are missing intensities
+    "f3\t\t50\n"
+    # no intensities, and no variable metadata
+    "f4\tNA\t#DIV/0!\t0\n"
+    "f5\t0\t60\t70\tNA\n"
+    # removed by CAMERA, with more intensities than samples
+    "f6\t1\t2\t3\t4\n"
+    "f1\t80\t90\tNA\n"
+)
+POLARITY = {"s1": "positive", "s2": "negative", "s3": "positive"}
+MZ_RT = {name: (100.0 + i, float(i)) for i, name in enumerate("f1 f2 f3 f5 f6".split())}
+CHARGES = {"f1": 1, "f2": "remove", "f3": 1, "f5": 1, "f6": "remove"}
+
+
+@pytest.mark.parametrize("block_cells", [read.MATRIX_BLOCK_CELLS, 1, 8])
+def test_data_matrix_rows(tmp_path, monkeypatch, block_cells):
+    monkeypatch.setattr(read, "MATRIX_BLOCK_CELLS", block_cells)
+    matrix_file = str(tmp_path / "matrix.tabular")
+    with open(matrix_file, "w") as f:
+        f.write(MATRIX)
+    expected = rowMatrixStore(matrix_file, POLARITY, MZ_RT, CHARGES)
+    assert expected.feature_names == ["f1", "f3", "f5"]
+    store = read.dataMatrixStore(matrix_file, POLARITY, MZ_RT, CHARGES)
+    assert summarizeAll(store) == summarizeAll(expected)
+
+
+@pytest.mark.parametrize("reader", [rowMatrixStore, read.dataMatrixStore])
+def test_data_matrix_empty_header(tmp_path, reader):
+    matrix_file = str(tmp_path / "matrix.tabular")
+    with open(matrix_file, "w") as f:
+        f.write("\nf1\tNA\n")
+    assert reader(matrix_file, POLARITY, MZ_RT, CHARGES).feature_names == []
+    with open(matrix_file, "a") as f:
+        f.write("f1\t10\n")
+    with pytest.raises(IndexError):
+        reader(matrix_file, POLARITY, MZ_RT, CHARGES)
@@ -0,0 +1,142 @@
+"""SQL and Parquet output read back and compared with plain output"""
+
+import os
+import sqlite3
+import pytest
+from vkmz import run
+from vkmz.config import Config
+from vkmz.read import sqlStore
+from vkmz.write import SqlWriter
+
+ANNOTATION = "sample_name\tpolarity\tmz\trt\tintensity\tformula\n"
+TABULAR = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "..", "test-data", "tabular.tabular"
+)
+
+
+def predictions(store):
+    """Return each feature's predictions as (formula, mass, delta) tuples."""
+    return {
+        store.feature_names[i]: [(p.formula, p.mass, p.delta) for p in predictions]
+        for i, predictions in enumerate(store.predictions)
+    }
+
+
+@pytest.mark.parametrize("normalized", [False, True])
+def test_formula_masses(tmp_path, normalized):
+    # in formula mode, the mass of a prediction is its feature's mz
+    input_file = tmp_path / "annotation.tabular"
+    input_file.write_text(
+        ANNOTATION
+        + "s1\tpositive\t100.0\t1.0\t10\tCH4O\n"
+        + "s1\tpositive\t200.0\t2.0\t20\tCH4O\n"
+    )
+    output = str(tmp_path / "out")
+    run(
+        Config(
+            "formula",
+            output,
+            input=str(input_file),
+            sql=True,
+            normalized_sql=normalized,
+        )
+    )
+    store = sqlStore(output + ".db")
+    assert [p.mass for predictions in store.predictions for p in predictions] == [
+        100.0,
+        200.0,
+    ]
+
+
+def test_failed_append_rolled_back(tmp_path, monkeypatch):
+    # an append which fails leaves the database as it was
+    input_file = tmp_path / "annotation.tabular"
+    input_file.write_text(ANNOTATION + "s1\tpositive\t100.0\t1.0\t10\tCH4O\n")
+    output = str(tmp_path / "out")
+    run(Config("formula", output, input=str(input_file), sql=True))
+    input_file.write_text(ANNOTATION + "s2\tpositive\t200.0\t2.0\t20\tCH4O\n")
+
+    def fail(writer):
+        raise RuntimeError("failed")
+
+    monkeypatch.setattr(SqlWriter, "createIndexes", fail)
+    with pytest.raises(RuntimeError):
+        run(Config("formula", output, input=str(input_file), append=True))
+    assert sqlStore(output + ".db").sample_names == ["s1"]
+    # and unlocked
+    monkeypatch.undo()
+    run(Config("formula", output, input=str(input_file), append=True))
+    assert sqlStore(output + ".db").sample_names == ["s1", "s2"]
+
+
+def test_normalized(tmp_path):
+    # the normalized schema reads back as the plain schema
+    plain = str(tmp_path / "plain")
+    normalized = str(tmp_path / "normalized")
+    run(Config("tabular", plain, input=TABULAR, mass_error=10, sql=True))
+    run(
+        Config("tabular", normalized, input=TABULAR, mass_error=10, normalized_sql=True)
+    )
+    plain_store = sqlStore(plain + ".db")
+    normalized_store = sqlStore(normalized + ".db")
+    assert normalized_store.sample_names == plain_store.sample_names
+    assert predictions(normalized_store) == predictions(plain_store)
+    # the R-tree finds the formulas of a van Krevelen region
+    con = sqlite3.connect(normalized + ".db")
+    region = "Oc BETWEEN 0.2 AND 0.6 AND Hc BETWEEN 1.0 AND 2.0"
+    expected = con.execute(f"SELECT Id FROM Formula WHERE {region}").fetchall()
+    found = con.execute(
+        "SELECT Formula.Id FROM FormulaRegion JOIN Formula USING (Id) "
+        "WHERE MaxOc >= 0.2 AND MinOc <= 0.6 AND MaxHc >= 1.0 AND MinHc <= 2.0 "
+        f"AND {region}"
+    ).fetchall()
+    con.close()
+    assert expected
+    assert sorted(found) == sorted(expected)
+
+
+@pytest.mark.parametrize("alternate", [False, True])
+def test_parquet(tmp_path, alternate):
+    # Parquet rows are the rows of tabular output
+    parquet = pytest.importorskip("pyarrow.parquet")
+    output = str(tmp_path / "out")
+    run(
+        Config(
+            "tabular",
+            output,
+            input=TABULAR,
+            mass_error=10,
+            parquet=True,
+            alternate=alternate,
+        )
+    )
+    with open(output + ".tabular") as t_file:
+        lines = t_file.read().splitlines()[1:]
+    expected = []
+    for line in lines:
+        row = line.split("\t")
+        alternates = row[13] if len(row) > 13 else None
+        expected.append(
+            (row[0], row[1], float(row[5]), row[8], float(row[6]), alternates)
+        )
+    rows = []
+    for row in parquet.read_table(output + ".parquet").to_pylist():
+        alternates = None
+        if row.get("alternate_predictions"):
+            alternates = str(
+                [
+                    (a["mass"], a["formula"], a["delta"])
+                    for a in row["alternate_predictions"]
+                ]
+            )
+        rows.append(
+            (
+                row["sample_name"],
+                row["feature_name"],
+                row["intensity"],
+                row["predicted_formula"],
+                row["predicted_mass"],
+                alternates,
+            )
+        )
+    assert rows == expected
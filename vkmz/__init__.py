@@ -8,10 +8,22 @@ van Krevelen Diagram (VKD). VKD's are a convenient visualization tool for
 briefly conveying the constituents of a complex MS mixture (e.g., untargeted
 plant metabolomics). As output predicted-feature are saved to a tabular file,
 an interactive VKD web page, and other optional formats.
+
+vkmz can be used as a library as well as from the command line:
+
+    import vkmz
+
+    config = vkmz.Config("tabular", "foo", input="data.tabular", mass_error=10)
+    store = vkmz.run(config)
+    samples, features = store.toObjects()
+
+Importing vkmz does not parse command line arguments or load a database.
+Databases are loaded once, the first time a Predictor needs them.
 """
 
-# NOTE: reviewers with Python Packaging experience
-#       How do I clean my namespace so that pydoc works on all modules and so
-#       that vkmz is ready for API importation (__all__)?
-#       Wrapping things with if __name__ == __main__ has consequences that may
-#       need to be avoided.
+from vkmz.config import Config
+from vkmz.objects import FeatureStore
+from vkmz.predict import Predictor
+from vkmz.pipeline import run
+
+__all__ = ["Config", "FeatureStore", "Predictor", "run"]
@@ -1,7 +1,15 @@
 #!/usr/bin/env python
+"""Command line arguments
+
+Defines the vkmz argument parser. Arguments are only parsed when parse() is
+called, so importing vkmz does not read sys.argv.
+"""
 
 import argparse
-import os
+from vkmz.compression import COMPRESSIONS
+from vkmz.config import Config
+from vkmz.predict import ADDUCTS
+from vkmz.read import TABULAR_READERS
 
 parser = argparse.ArgumentParser()
 sub_parser = parser.add_subparsers(help="Select mode:", dest="mode")
@@ -10,6 +18,24 @@ sub_parser.required = True
 # Tabular mode arguments
 parse_tabular = sub_parser.add_parser("tabular", help="Tabular data mode")
 parse_tabular.add_argument("--input", "-i", required=True, help="Path to tabular file.")
+parse_tabular.add_argument(
+    "--reader",
+    choices=list(TABULAR_READERS),
+    default="columnar",
+    help="Reader of tabular input, columnar is faster, parallel reads with "
+    "--workers processes, and csv reads row by row",
+)
+parse_tabular.add_argument(
+    "--stream",
+    action="store_true",
+    help="Set flag to read, predict, and write input in chunks of rows",
+)
+parse_tabular.add_argument(
+    "--chunk-size",
+    type=int,
+    default=100000,
+    help="Number of rows per chunk when streaming",
+)
 
 # XCMS-tabular mode arguments
 parse_xcms = sub_parser.add_parser("w4m-xcms", help="W4M-XCMS data mode")
@@ -48,6 +74,22 @@ for mode in [parse_tabular, parse_xcms]:
         type=float,
         help="Mass error of MS data in parts-per-million",
     )
+    mode.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of processes to make predictions with, and to read tabular "
+        "input with --reader parallel",
+    )
+    mode.add_argument(
+        "--adducts",
+        nargs="+",
+        choices=list(ADDUCTS),
+        metavar="ADDUCT",
+        help="Adducts to search for each feature of the adduct's polarity, from: "
+        + ", ".join(ADDUCTS)
+        + ". Defaults to [M+H]+ and [M-H]- without labeling predictions",
+    )
 
 # Annotated molecular formula mode
 parse_formula = sub_parser.add_parser(
@@ -57,8 +99,23 @@ parse_formula.add_argument(
     "--input", "-i", required=True, help="Path to tabular formula file."
 )
 
-# all modes
+# SQL output mode, writes output of an earlier run from its SQL output
+parse_sql = sub_parser.add_parser("sql", help="vkmz SQL output mode")
+parse_sql.add_argument(
+    "--input", "-i", required=True, help="Path to SQL output of an earlier run."
+)
+
+# input modes
 for mode in [parse_formula, parse_tabular, parse_xcms]:
+    mode.add_argument(
+        "--append",
+        action="store_true",
+        help="Set flag to add new samples to existing SQL output and write other "
+        "output from the whole database (implies --sql)",
+    )
+
+# all modes
+for mode in [parse_formula, parse_tabular, parse_xcms, parse_sql]:
     mode.add_argument(
         "--output",
         "-o",
@@ -73,12 +130,52 @@ for mode in [parse_formula, parse_tabular, parse_xcms]:
     mode.add_argument(
         "--sql", "-s", action="store_true", help="Set SQL flag to save SQL output"
     )
+    mode.add_argument(
+        "--normalized-sql",
+        action="store_true",
+        help="Set flag to save SQL output in a normalized schema with indexes and "
+        "an R-tree of van Krevelen coordinates (implies --sql)",
+    )
+    mode.add_argument(
+        "--parquet",
+        action="store_true",
+        help="Set flag to save Parquet output, requires pyarrow",
+    )
+    mode.add_argument(
+        "--html-payload",
+        choices=["json", "binary"],
+        default="json",
+        help="Format of data in html output, binary is smaller and faster to load",
+    )
+    mode.add_argument(
+        "--density",
+        choices=["embed", "sidecar"],
+        help="Compute density grids and embed them in html output or save them to "
+        "a sidecar JSON file",
+    )
     mode.add_argument(
         "--metadata",
         "-m",
         action="store_true",
         help="Set metadata flag to save argument metadata",
     )
+    mode.add_argument(
+        "--compress",
+        choices=list(COMPRESSIONS),
+        help="Compress tabular and JSON output, requires zstandard for zstd",
+    )
+    mode.add_argument(
+        "--profile",
+        action="store_true",
+        help="Set flag to save times, memory use, and counters of each stage to a "
+        "JSON file",
+    )
+    mode.add_argument(
+        "--cprofile",
+        action="store_true",
+        help="Set flag to also save a cProfile dump of each stage (implies "
+        "--profile)",
+    )
     mode.add_argument(
         "--database",
         "-db",
@@ -117,36 +214,45 @@ for mode in [parse_formula, parse_tabular, parse_xcms]:
         help='Set flag to impute "1" for missing charge information',
     )
 
-# create constants
-args = parser.parse_args()
-JSON = getattr(args, "json")
-METADATA = getattr(args, "metadata")
-MODE = getattr(args, "mode")
-SQL = getattr(args, "sql")
-IMPUTE = getattr(args, "impute_charge")
-POLARITY = getattr(args, "polarity")
-ALTERNATE = getattr(args, "alternate")
-DATABASE = getattr(args, "database")
-if "error" in args:
-    MASS_ERROR = getattr(args, "error")
-else:
-    MASS_ERROR = "NA"
-NEUTRAL = getattr(args, "neutral")
-OUTPUT = getattr(args, "output")
-PREFIX = getattr(args, "prefix")
-if not PREFIX:
-    PREFIX = os.path.abspath(os.path.dirname(__file__))
-# MASS and FORMULA are used as indexable dictionaries
-MASS = []
-FORMULA = []
-try:
-    with open(os.path.join(PREFIX, DATABASE), "r") as tabular:
-        next(tabular)  # skip header
-        for row in tabular:
-            mass, formula = row.split()
-            MASS.append(float(mass))
-            FORMULA.append(formula)
-except:
-    print(f"An error occurred while reading the {DATABASE} database.")
-    raise
-MAX_MASS_INDEX = len(MASS) - 1
+
+def parse(argv=None):
+    """Parse command line arguments into a Config.
+
+    Arguments:
+        argv (list): arguments to parse, defaults to sys.argv
+    """
+    args = parser.parse_args(argv)
+    try:
+        return Config(
+            getattr(args, "mode"),
+            getattr(args, "output"),
+            input=getattr(args, "input", None),
+            data_matrix=getattr(args, "data_matrix", None),
+            sample_metadata=getattr(args, "sample_metadata", None),
+            variable_metadata=getattr(args, "variable_metadata", None),
+            mass_error=getattr(args, "error", "NA"),
+            json=getattr(args, "json"),
+            sql=getattr(args, "sql"),
+            normalized_sql=getattr(args, "normalized_sql"),
+            append=getattr(args, "append", False),
+            parquet=getattr(args, "parquet"),
+            html_payload=getattr(args, "html_payload"),
+            density=getattr(args, "density"),
+            metadata=getattr(args, "metadata"),
+            compress=getattr(args, "compress"),
+            database=getattr(args, "database"),
+            prefix=getattr(args, "prefix"),
+            polarity=getattr(args, "polarity"),
+            neutral=getattr(args, "neutral"),
+            alternate=getattr(args, "alternate"),
+            impute=getattr(args, "impute_charge"),
+            reader=getattr(args, "reader", "columnar"),
+            stream=getattr(args, "stream", False),
+            chunk_size=getattr(args, "chunk_size", 100000),
+            workers=getattr(args, "workers", 1),
+            adducts=getattr(args, "adducts", None),
+            profile=getattr(args, "profile"),
+            cprofile=getattr(args, "cprofile"),
+        )
+    except ValueError as error:
+        parser.error(str(error))
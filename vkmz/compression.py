@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+"""Compressed input and output files
+
+vkmz reads gzip- and zstd-compressed input as if it were uncompressed, so
+compressed files do not need to be decompressed to disk before a run. Input
+files are detected by their magic bytes or, failing that, by their suffix
+(".gz" or ".zst"). With --compress, tabular and JSON output is written
+compressed, with the suffix of its compression appended, see outputPath().
+
+Compressed files are decompressed and compressed in a background thread, which
+passes blocks of data to and from the caller through a queue. zlib and
+zstandard release the GIL while they work, so compression overlaps with parsing
+input and formatting output instead of adding a separate pass.
+
+zstd compression requires the zstandard package.
+"""
+
+import gzip
+import io
+import os
+import queue
+import threading
+
+# name to (magic bytes, file suffix) of supported compressions
+COMPRESSIONS = {
+    "gzip": (b"\x1f\x8b", ".gz"),
+    "zstd": (b"\x28\xb5\x2f\xfd", ".zst"),
+}
+# compression levels, the defaults of the gzip and zstd commands
+COMPRESSION_LEVELS = {"gzip": 6, "zstd": 3}
+# bytes passed to or from the background thread at once
+BLOCK_SIZE = 1 << 20
+# number of blocks queued between the background thread and the caller
+QUEUE_BLOCKS = 8
+
+
+def detectCompression(path):
+    """Return the compression of a file, or None if it is not compressed.
+
+    Arguments:
+        path (str): path to file
+    """
+    path = os.fspath(path)
+    with open(path, "rb") as h_file:
+        head = h_file.read(4)
+    for name, (magic, suffix) in COMPRESSIONS.items():
+        if head.startswith(magic):
+            return name
+    for name, (magic, suffix) in COMPRESSIONS.items():
+        if path.endswith(suffix):
+            return name
+    return None
+
+
+def outputPath(path, compression=None):
+    """Return the path of an output file written with a compression.
+
+    Arguments:
+        path (str): path to uncompressed output file
+        compression (str): "gzip", "zstd", or None
+    """
+    if compression is None:
+        return path
+    return path + COMPRESSIONS[compression][1]
+
+
+def openInput(path, mode="r", encoding=None):
+    """Open an input file, decompressing it if it is compressed.
+
+    Uncompressed files are opened with open().
+
+    Arguments:
+        path (str): path to input file
+        mode (str): "r" to read text or "rb" to read bytes
+        encoding (str): encoding of text, defaults to that of open()
+    """
+    compression = detectCompression(path)
+    if compression is None:
+        return open(path, mode, encoding=encoding)
+    h_file = io.BufferedReader(
+        ThreadedReader(decompressor(compression, path)), BLOCK_SIZE
+    )
+    if "b" in mode:
+        return h_file
+    return io.TextIOWrapper(h_file, encoding=encoding)
+
+
+def openOutput(path, compression=None, mode="w", encoding=None):
+    """Open an output file, compressing it if a compression is given.
+
+    The path is not changed, see outputPath().
+
+    Arguments:
+        path (str): path to output file
+        compression (str): "gzip", "zstd", or None
+        mode (str): "w" to write text or "wb" to write bytes
+        encoding (str): encoding of text, defaults to that of open()
+    """
+    if compression is None:
+        return open(path, mode, encoding=encoding)
+    h_file = io.BufferedWriter(
+        ThreadedWriter(compressor(compression, path)), BLOCK_SIZE
+    )
+    if "b" in mode:
+        return h_file
+    return io.TextIOWrapper(h_file, encoding=encoding)
+
+
+def decompressor(compression, path):
+    """Return a binary stream of a compressed file's decompressed bytes.
+
+    Arguments:
+        compression (str): "gzip" or "zstd"
+        path (str): path to compressed file
+    """
+    if compression == "gzip":
+        return gzip.open(path, "rb")
+    zstandard = importZstandard()
+    return zstandard.ZstdDecompressor().stream_reader(
+        open(path, "rb"), read_across_frames=True, closefd=True
+    )
+
+
+def compressor(compression, path):
+    """Return a binary stream which compresses bytes written to a file.
+
+    Arguments:
+        compression (str): "gzip" or "zstd"
+        path (str): path to compressed file
+    """
+    level = COMPRESSION_LEVELS[compression]
+    if compression == "gzip":
+        return gzip.open(path, "wb", compresslevel=level)
+    zstandard = importZstandard()
+    return zstandard.ZstdCompressor(level=level).stream_writer(
+        open(path, "wb"), closefd=True
+    )
+
+
+def importZstandard():
+    """Return the zstandard module."""
+    try:
+        import zstandard
+    except ImportError:
+        print("zstd compression requires zstandard: pip install zstandard")
+        raise
+    return zstandard
+
+
+class ThreadedReader(io.RawIOBase):
+    """Read a binary stream in a background thread.
+
+    Attributes:
+        stream (file): binary stream read by the background thread
+        blocks (Queue): blocks read, then None at the end of the stream, or the
+                        exception raised while reading
+        block (memoryview): unread part of the current block
+        finished (bool): the end of the stream, or an exception, was read
+        stopping (Event): set when closed to stop the background thread
+        thread (Thread): background thread
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.blocks = queue.Queue(QUEUE_BLOCKS)
+        self.block = memoryview(b"")
+        self.finished = False
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self.fill, daemon=True)
+        self.thread.start()
+
+    def fill(self):
+        """Read blocks of the stream into the queue, in the background thread."""
+        try:
+            while not self.stopping.is_set():
+                block = self.stream.read(BLOCK_SIZE)
+                if not block:
+                    break
+                self.blocks.put(block)
+        except Exception as error:
+            self.blocks.put(error)
+            return
+        self.blocks.put(None)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.block:
+            if self.finished:
+                return 0
+            block = self.blocks.get()
+            if block is None:
+                self.finished = True
+            elif isinstance(block, Exception):
+                self.finished = True
+                raise block
+            else:
+                self.block = memoryview(block)
+        size = min(len(buffer), len(self.block))
+        buffer[:size] = self.block[:size]
+        self.block = self.block[size:]
+        return size
+
+    def close(self):
+        if not self.closed:
+            self.stopping.set()
+            # empty the queue until the background thread is not blocked on it
+            while self.thread.is_alive():
+                try:
+                    self.blocks.get(timeout=0.01)
+                except queue.Empty:
+                    pass
+            self.stream.close()
+        super().close()
+
+
+class ThreadedWriter(io.RawIOBase):
+    """Write to a binary stream in a background thread.
+
+    Errors of the background thread are raised by the next write() or by close().
+
+    Attributes:
+        stream (file): binary stream written by the background thread
+        blocks (Queue): blocks to write, then None when closed
+        error (Exception): exception raised while writing, or None
+        thread (Thread): background thread
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.blocks = queue.Queue(QUEUE_BLOCKS)
+        self.error = None
+        self.thread = threading.Thread(target=self.drain, daemon=True)
+        self.thread.start()
+
+    def drain(self):
+        """Write blocks from the queue to the stream, in the background thread."""
+        while True:
+            block = self.blocks.get()
+            if block is None:
+                break
+            # after an error, blocks are discarded so the caller is not blocked
+            if self.error is None:
+                try:
+                    self.stream.write(block)
+                except Exception as error:
+                    self.error = error
+
+    def writable(self):
+        return True
+
+    def write(self, buffer):
+        if self.error is not None:
+            raise self.error
+        block = bytes(buffer)
+        self.blocks.put(block)
+        return len(block)
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            self.blocks.put(None)
+            self.thread.join()
+            # writes the end of the compressed stream
+            self.stream.close()
+        finally:
+            super().close()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+"""Configuration of a vkmz run
+
+A Config holds every setting of a run. vkmz.arguments builds one from the
+command line. Library users can build one directly and pass it to vkmz.run().
+"""
+
+import os
+
+# directory of support files ("d3.html" and the databases directory)
+PACKAGE_DIRECTORY = os.path.abspath(os.path.dirname(__file__))
+
+
+class Config(object):
+    """Settings of a vkmz run.
+
+    Attributes:
+        mode (str): input mode, "tabular", "w4m-xcms", "formula", or "sql"
+        output (str): output file path, without extension
+        input (str): path to tabular or formula file, or SQL output of vkmz
+        data_matrix (str): path to XCMS data matrix file
+        sample_metadata (str): path to XCMS sample metadata file
+        variable_metadata (str): path to XCMS variable metadata file
+        mass_error (float): mass error of MS data in parts-per-million
+        json (bool): save JSON output
+        sql (bool): save SQL output, implied by normalized_sql and append
+        normalized_sql (bool): save SQL output in a normalized, indexed schema
+        append (bool): add results to existing SQL output, or create it, see
+                       vkmz.pipeline.runAppend(). Cannot be used with stream.
+        parquet (bool): save Parquet output
+        html_payload (str): format of data in html output, "json" or "binary"
+        density (str): "embed" density grids in html output, save them to a
+                       "sidecar" file, or None
+        metadata (bool): save argument metadata
+        compress (str): compress tabular and JSON output with "gzip" or "zstd",
+                        or None, see vkmz.compression
+        database (str): path to database of known formula-mass pairs, relative
+                        to prefix
+        prefix (str): path prefix to support files
+        polarity (str): force polarity of all features
+        neutral (bool): input data contains neutral feature mass instead of mz
+        alternate (bool): keep features with multiple predictions
+        impute (bool): impute "1" for missing charge information
+        reader (str): reader of tabular input, "columnar", "parallel", or "csv",
+                      see vkmz.read.TABULAR_READERS
+        stream (bool): read, predict, and write tabular input in chunks, only in
+                       tabular mode
+        chunk_size (int): number of rows per chunk when streaming
+        workers (int): number of processes to make predictions with, and to
+                       read tabular input with the "parallel" reader
+        adducts (list): adducts to search, see vkmz.predict.ADDUCTS, or None to
+                        only protonate and deprotonate features
+        profile (bool): save times, memory, and counters of each stage, implied
+                        by cprofile
+        cprofile (bool): save a cProfile dump of each stage, with profile
+    """
+
+    def __init__(
+        self,
+        mode,
+        output,
+        input=None,
+        data_matrix=None,
+        sample_metadata=None,
+        variable_metadata=None,
+        mass_error="NA",
+        json=False,
+        sql=False,
+        normalized_sql=False,
+        append=False,
+        parquet=False,
+        html_payload="json",
+        density=None,
+        metadata=False,
+        compress=None,
+        database="databases/bmrb-light.tsv",
+        prefix=None,
+        polarity=None,
+        neutral=False,
+        alternate=False,
+        impute=False,
+        reader="columnar",
+        stream=False,
+        chunk_size=100000,
+        workers=1,
+        adducts=None,
+        profile=False,
+        cprofile=False,
+    ):
+        if append and stream:
+            raise ValueError("append cannot be used with stream")
+        if stream and mode != "tabular":
+            raise ValueError("stream can only be used in tabular mode")
+        self.mode = mode
+        self.output = output
+        self.input = input
+        self.data_matrix = data_matrix
+        self.sample_metadata = sample_metadata
+        self.variable_metadata = variable_metadata
+        self.mass_error = mass_error
+        self.json = json
+        self.sql = sql or normalized_sql or append
+        self.normalized_sql = normalized_sql
+        self.append = append
+        self.parquet = parquet
+        self.html_payload = html_payload
+        self.density = density
+        self.metadata = metadata
+        self.compress = compress
+        self.database = database
+        if not prefix:
+            prefix = PACKAGE_DIRECTORY
+        self.prefix = prefix
+        self.polarity = polarity
+        self.neutral = neutral
+        self.alternate = alternate
+        self.impute = impute
+        self.reader = reader
+        self.stream = stream
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.adducts = adducts
+        self.profile = profile or cprofile
+        self.cprofile = cprofile
+
+    def databasePath(self):
+        """Path to database of known formula-mass pairs."""
+        return os.path.join(self.prefix, self.database)
@@ -0,0 +1,318 @@
+#!/usr/bin/env python
+"""Known formula-mass databases
+
+A database is a tabular file of known masses and molecular formulas, with a
+header row, sorted by mass. Reading the tabular file requires parsing every row
+each time vkmz is run.
+
+A database can instead be compiled into a sorted binary file. Compiled files are
+memory-mapped when loaded, so loading takes near-constant time and concurrent
+vkmz jobs share the same page-cache pages.
+
+Compiled file layout (little-endian):
+    magic (8 bytes): b"VKMZDB02"
+    count (uint64): number of entries, n
+    element total (uint64): number of element symbol-count pairs, e
+    symbol total (uint64): number of distinct element symbols, k
+    masses (n float64): known masses, sorted
+    ratios (n x 3 float64): H:C, O:C, and N:C ratios of each formula
+    offsets (n + 1 uint64): start of each formula in the formula table
+    element offsets (n + 1 uint64): start of each formula's element pairs
+    element counts (e uint32): count of each element pair
+    element symbols (e uint8): symbol index of each element pair
+    symbols (k x 2 bytes): ASCII element symbols, space padded
+    formulas (bytes): concatenated ASCII formulas
+
+Element counts and ratios are precomputed with vkmz.predict.parseFormula() so
+predictions only look them up by index. Element pairs keep the order in which
+symbols appear in each formula.
+
+Tabular and compiled databases may be gzip- or zstd-compressed, see
+vkmz.compression. Compressed compiled databases are read into memory instead of
+being memory-mapped.
+"""
+
+import argparse
+import functools
+import mmap
+import numpy
+import struct
+from vkmz.compression import detectCompression, openInput
+
+MAGIC = b"VKMZDB02"
+HEADER = struct.Struct("<8sQQQ")
+
+
+class Database(object):
+    """Known masses and formulas with precomputed element counts and ratios.
+
+    Attributes:
+        mass (array): known masses, sorted
+        formula (list): formulas of known masses
+        ratios (array): H:C, O:C, and N:C ratios of each formula, n x 3
+        element_offsets (array): start of each formula's element pairs
+        element_counts (array): count of each element pair
+        element_symbols (array): symbol index of each element pair
+        symbols (list): element symbols
+    """
+
+    def __init__(
+        self,
+        mass,
+        formula,
+        ratios,
+        element_offsets,
+        element_counts,
+        element_symbols,
+        symbols,
+    ):
+        self.mass = mass
+        self.formula = formula
+        self.ratios = ratios
+        self.element_offsets = element_offsets
+        self.element_counts = element_counts
+        self.element_symbols = element_symbols
+        self.symbols = symbols
+
+    def __len__(self):
+        return len(self.mass)
+
+    def elementCount(self, index):
+        """Return the element_count dictionary of an entry.
+
+        Arguments:
+            index (int): index of entry
+        """
+        start = int(self.element_offsets[index])
+        end = int(self.element_offsets[index + 1])
+        symbols = self.symbols
+        return {
+            symbols[s]: c
+            for s, c in zip(
+                self.element_symbols[start:end].tolist(),
+                self.element_counts[start:end].tolist(),
+            )
+        }
+
+
+class FormulaTable(object):
+    """Indexable sequence of formulas backed by a compiled database.
+
+    Formulas are decoded from the formula table only when indexed.
+
+    Attributes:
+        offsets (array): start of each formula in table, plus the table's end
+        buffer (mmap): compiled database
+        start (int): position of the formula table in buffer
+    """
+
+    def __init__(self, offsets, buffer, start):
+        self.offsets = offsets
+        self.buffer = buffer
+        self.start = start
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("formula index out of range")
+        start = self.start + int(self.offsets[index])
+        end = self.start + int(self.offsets[index + 1])
+        return self.buffer[start:end].decode("ascii")
+
+
+def readTabular(database_file):
+    """Read a tabular database.
+
+    Returns a list of masses and a list of formulas.
+
+    Arguments:
+        database_file (str): path to tabular database
+    """
+    masses = []
+    formulas = []
+    with openInput(database_file, "r") as tabular:
+        next(tabular)  # skip header
+        for row in tabular:
+            mass, formula = row.split()
+            masses.append(float(mass))
+            formulas.append(formula)
+    return masses, formulas
+
+
+def parseFormulas(formulas):
+    """Precompute element counts and ratios of formulas.
+
+    Returns ratios, element offsets, element counts, element symbol indexes, and
+    element symbols as used by Database.
+
+    Arguments:
+        formulas (list): molecular formulas
+    """
+    from vkmz.predict import parseFormula
+
+    ratios = numpy.zeros((len(formulas), 3), dtype="<f8")
+    element_offsets = numpy.zeros(len(formulas) + 1, dtype="<u8")
+    element_counts = []
+    element_symbols = []
+    symbols = []
+    symbol_index = {}
+    for i, formula in enumerate(formulas):
+        element_count, hc, oc, nc = parseFormula(formula)
+        ratios[i] = (hc, oc, nc)
+        for symbol, count in element_count.items():
+            if symbol not in symbol_index:
+                symbol_index[symbol] = len(symbols)
+                symbols.append(symbol)
+            element_symbols.append(symbol_index[symbol])
+            element_counts.append(count)
+        element_offsets[i + 1] = len(element_counts)
+    return (
+        ratios,
+        element_offsets,
+        numpy.array(element_counts, dtype="<u4"),
+        numpy.array(element_symbols, dtype="u1"),
+        symbols,
+    )
+
+
+def compileDatabase(database_file, compiled_file):
+    """Compile a tabular database into a binary file.
+
+    Entries are sorted by mass. Entries with equal masses keep their order.
+
+    Arguments:
+        database_file (str): path to tabular database
+        compiled_file (str): path to write compiled database to
+    """
+    masses, formulas = readTabular(database_file)
+    order = sorted(range(len(masses)), key=lambda i: masses[i])
+    mass = numpy.array([masses[i] for i in order], dtype="<f8")
+    formulas = [formulas[i] for i in order]
+    writeCompiled(Database(mass, formulas, *parseFormulas(formulas)), compiled_file)
+
+
+def writeCompiled(database, compiled_file):
+    """Write a Database, sorted by mass, to a compiled file.
+
+    Arguments:
+        database (Database): database to write
+        compiled_file (str): path to write compiled database to
+    """
+    encoded = [database.formula[i].encode("ascii") for i in range(len(database))]
+    offsets = numpy.zeros(len(encoded) + 1, dtype="<u8")
+    numpy.cumsum([len(e) for e in encoded], out=offsets[1:])
+    with open(compiled_file, "wb") as c_file:
+        c_file.write(
+            HEADER.pack(
+                MAGIC,
+                len(encoded),
+                len(database.element_counts),
+                len(database.symbols),
+            )
+        )
+        c_file.write(numpy.asarray(database.mass, dtype="<f8").tobytes())
+        c_file.write(numpy.asarray(database.ratios, dtype="<f8").tobytes())
+        c_file.write(offsets.tobytes())
+        c_file.write(numpy.asarray(database.element_offsets, dtype="<u8").tobytes())
+        c_file.write(numpy.asarray(database.element_counts, dtype="<u4").tobytes())
+        c_file.write(numpy.asarray(database.element_symbols, dtype="u1").tobytes())
+        c_file.write(b"".join(s.ljust(2).encode("ascii") for s in database.symbols))
+        c_file.write(b"".join(encoded))
+
+
+def isCompiled(database_file):
+    """Check if a database file is compiled.
+
+    Arguments:
+        database_file (str): path to a database
+    """
+    with openInput(database_file, "rb") as d_file:
+        return d_file.read(6) == MAGIC[:6]
+
+
+def readCompiled(compiled_file):
+    """Memory-map a compiled database.
+
+    Returns a Database of read-only arrays and a FormulaTable. Compressed files
+    are decompressed into memory.
+
+    Arguments:
+        compiled_file (str): path to compiled database
+    """
+    if detectCompression(compiled_file) is None:
+        with open(compiled_file, "rb") as c_file:
+            buffer = mmap.mmap(c_file.fileno(), 0, access=mmap.ACCESS_READ)
+    else:
+        with openInput(compiled_file, "rb") as c_file:
+            buffer = c_file.read()
+    magic, count, element_total, symbol_total = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(
+            f"{compiled_file} is not a compiled vkmz database of this version. "
+            "Compile it again with vkmz-compile-database."
+        )
+    position = HEADER.size
+
+    def section(dtype, length):
+        nonlocal position
+        array = numpy.frombuffer(buffer, dtype=dtype, count=length, offset=position)
+        position += array.nbytes
+        return array
+
+    mass = section("<f8", count)
+    ratios = section("<f8", count * 3).reshape(count, 3)
+    offsets = section("<u8", count + 1)
+    element_offsets = section("<u8", count + 1)
+    element_counts = section("<u4", element_total)
+    element_symbols = section("u1", element_total)
+    symbols = section("S2", symbol_total)
+    symbols = [s.decode("ascii").strip() for s in symbols.tolist()]
+    formula = FormulaTable(offsets, buffer, position)
+    return Database(
+        mass,
+        formula,
+        ratios,
+        element_offsets,
+        element_counts,
+        element_symbols,
+        symbols,
+    )
+
+
+@functools.lru_cache(maxsize=None)
+def load(database_file):
+    """Load a tabular or compiled database.
+
+    Returns a Database. Element counts and ratios of tabular databases are
+    computed while loading.
+
+    Databases are cached by path and only loaded once per process.
+
+    Arguments:
+        database_file (str): path to a database
+    """
+    if isCompiled(database_file):
+        return readCompiled(database_file)
+    masses, formulas = readTabular(database_file)
+    # sorted known masses are stored as an array for vectorized searching
+    mass = numpy.array(masses, dtype=numpy.float64)
+    return Database(mass, formulas, *parseFormulas(formulas))
+
+
+def main():
+    """Compile a tabular database from the command line."""
+    parser = argparse.ArgumentParser(
+        description="Compile a tabular formula-mass database for vkmz"
+    )
+    parser.add_argument("database", help="Path to tabular database")
+    parser.add_argument("output", help="Path to write compiled database to")
+    args = parser.parse_args()
+    compileDatabase(args.database, args.output)
+
+
+if __name__ == "__main__":
+    main()
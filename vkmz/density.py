@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+"""Density grids of predicted features
+
+A density grid is an intensity-weighted 2D histogram of van Krevelen
+coordinates. Grids are computed per sample and polarity, for several pairs of
+ratios and resolutions, so the VKD webpage can draw density instead of every
+point when zoomed out.
+"""
+
+import numpy
+from vkmz.objects import POLARITIES
+
+# (x, y) ratios of density grids
+DENSITY_AXES = (("oc", "hc"), ("nc", "hc"))
+
+# number of cells along each axis of density grids
+DENSITY_RESOLUTIONS = (32, 64, 128, 256)
+
+
+def densityGrids(store, axes=DENSITY_AXES, resolutions=DENSITY_RESOLUTIONS):
+    """Compute density grids of predicted features.
+
+    Features are placed by the ratios of their first prediction. Grids span
+    from 0 to the largest value of each ratio.
+
+    Returns a dictionary of:
+        axes (list): (x, y) ratios of grids
+        domain (dict): ratio to largest value of ratio
+        resolutions (list): resolutions of grids
+        grids (list): a dictionary for each sample, polarity, axes, and
+                      resolution, with the grid's nonzero cells (x bin *
+                      resolution + y bin) and their summed intensities
+
+    Arguments:
+        store (FeatureStore): predicted features
+        axes (list): (x, y) ratios
+        resolutions (list): number of cells along each axis
+    """
+    store.freeze()
+    names = sorted({name for pair in axes for name in pair})
+    ratios = {
+        name: numpy.array(
+            [getattr(p[0], name) for p in store.predictions], dtype=numpy.float64
+        )
+        for name in names
+    }
+    domain = {}
+    for name in names:
+        largest = float(ratios[name].max()) if len(ratios[name]) else 0.0
+        # avoid empty grid ranges
+        domain[name] = largest if largest > 0 else 1.0
+
+    feature = store.sfi_feature
+    intensity = store.sfi_intensity
+    # group intensities by sample and polarity
+    group = store.sfi_sample.astype(numpy.int64) * len(POLARITIES)
+    group += numpy.asarray(store.polarity, dtype=numpy.int64)[feature]
+    order = numpy.argsort(group, kind="stable")
+    groups, starts = numpy.unique(group[order], return_index=True)
+    ends = numpy.append(starts[1:], len(order))
+
+    grids = []
+    for g, start, end in zip(groups.tolist(), starts.tolist(), ends.tolist()):
+        rows = order[start:end]
+        sample, polarity = divmod(g, len(POLARITIES))
+        for a, (x_name, y_name) in enumerate(axes):
+            x = ratios[x_name][feature[rows]]
+            y = ratios[y_name][feature[rows]]
+            for resolution in resolutions:
+                grid, _, _ = numpy.histogram2d(
+                    x,
+                    y,
+                    bins=resolution,
+                    range=[[0, domain[x_name]], [0, domain[y_name]]],
+                    weights=intensity[rows],
+                )
+                cells = numpy.flatnonzero(grid)
+                grids.append(
+                    {
+                        "sample": store.sample_names[sample],
+                        "polarity": POLARITIES[polarity],
+                        "axes": a,
+                        "resolution": resolution,
+                        "cells": cells,
+                        "values": grid.ravel()[cells],
+                    }
+                )
+    return {
+        "axes": [list(pair) for pair in axes],
+        "domain": domain,
+        "resolutions": list(resolutions),
+        "grids": grids,
+    }
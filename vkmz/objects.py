@@ -1,4 +1,17 @@
 #!/usr/bin/env python
+"""MS data objects
+
+Samples, features, and their intensities are stored column-wise in a
+FeatureStore. Sample, SampleFeatureIntensity, and Feature objects can be created
+from a FeatureStore for code which works with individual objects.
+"""
+
+import array
+import copy
+import numpy
+
+# polarity codes used by FeatureStore
+POLARITIES = ["positive", "negative"]
 
 
 class Sample(object):
@@ -9,6 +22,8 @@ class Sample(object):
         sfis (list): SampleFeatureIntensity objects
     """
 
+    __slots__ = ("name", "sfis")
+
     def __init__(self, name):
         self.name = name
         self.sfis = []
@@ -22,6 +37,8 @@ class SampleFeatureIntensity(object):
         feature (Feature): feature with the observed intensity
     """
 
+    __slots__ = ("intensity", "feature")
+
     def __init__(self, intensity, feature):
         self.intensity = intensity
         self.feature = feature
@@ -40,6 +57,8 @@ class Feature(object):
         predictions (list): Prediction objects
     """
 
+    __slots__ = ("name", "samples", "polarity", "mz", "rt", "predictions", "charge")
+
     def __init__(self, name, samples, polarity, mz, rt, charge=None):
         self.name = name
         self.samples = [samples]
@@ -63,9 +82,22 @@ class Prediction(object):
         hc (float): hydrogen to carbon ratio
         oc (float): oxygen to carbon ratio
         nc (float): nitrogen to carbon ratio
+        adduct (str): adduct of feature's ion, see vkmz.predict.ADDUCTS, or None if
+                      adducts were not searched
     """
 
-    def __init__(self, mass, formula, delta, element_count, hc, oc, nc):
+    __slots__ = (
+        "formula",
+        "mass",
+        "delta",
+        "element_count",
+        "hc",
+        "oc",
+        "nc",
+        "adduct",
+    )
+
+    def __init__(self, mass, formula, delta, element_count, hc, oc, nc, adduct=None):
         self.formula = formula
         self.mass = mass
         self.delta = delta
@@ -73,3 +105,256 @@ class Prediction(object):
         self.hc = hc
         self.oc = oc
         self.nc = nc
+        self.adduct = adduct
+
+
+class FeatureStore(object):
+    """Column-wise store of samples, features, and intensities.
+
+    Features are stored as parallel arrays. Intensities are stored as a sparse
+    sample by feature matrix of (sample index, feature index, intensity) triplets
+    kept in the order they were added.
+
+    While reading, columns are growable arrays. freeze() converts them to numpy
+    arrays; freeze() is called by methods which need numpy arrays.
+
+    Attributes:
+        sample_names (list): sample names
+        feature_names (list): feature names
+        polarity (array): polarity code of each feature, see POLARITIES
+        mz (array): mass-to-charge ratio of each feature
+        rt (array): retention time of each feature
+        charge (array): charge of each feature, NaN if unknown
+        predictions (list): Prediction lists of each feature
+        sfi_sample (array): sample index of each intensity
+        sfi_feature (array): feature index of each intensity
+        sfi_intensity (array): intensity of each intensity
+    """
+
+    def __init__(self):
+        self.sample_names = []
+        self.sample_ids = {}
+        self.feature_names = []
+        self.feature_ids = {}
+        self.polarity = array.array("b")
+        self.mz = array.array("d")
+        self.rt = array.array("d")
+        self.charge = array.array("d")
+        self.predictions = []
+        self.sfi_sample = array.array("i")
+        self.sfi_feature = array.array("i")
+        self.sfi_intensity = array.array("d")
+
+    def addSample(self, name):
+        """Add a sample if it is new and return its index.
+
+        Arguments:
+            name (str): sample name
+        """
+        index = self.sample_ids.get(name)
+        if index is None:
+            index = len(self.sample_names)
+            self.sample_ids[name] = index
+            self.sample_names.append(name)
+        return index
+
+    def addFeature(self, name, polarity, mz, rt, charge=None):
+        """Add a feature if it is new and return its index.
+
+        Arguments:
+            name (str): feature name
+            polarity (str): ionization mode
+            mz (float): observed mass-to-charge ratio
+            rt (float): retention time
+            charge (float): electric charge
+        """
+        index = self.feature_ids.get(name)
+        if index is None:
+            index = len(self.feature_names)
+            self.feature_ids[name] = index
+            self.feature_names.append(name)
+            self.polarity.append(POLARITIES.index(polarity))
+            self.mz.append(mz)
+            self.rt.append(rt)
+            self.charge.append(numpy.nan if charge is None else charge)
+            self.predictions.append([])
+        return index
+
+    def addIntensity(self, sample, feature, intensity):
+        """Add a sample's intensity of a feature.
+
+        Arguments:
+            sample (int): sample index
+            feature (int): feature index
+            intensity (float): intensity of feature in sample
+        """
+        self.sfi_sample.append(sample)
+        self.sfi_feature.append(feature)
+        self.sfi_intensity.append(intensity)
+
+    def freeze(self):
+        """Convert growable columns to numpy arrays."""
+        for column, dtype in (
+            ("polarity", numpy.int8),
+            ("mz", numpy.float64),
+            ("rt", numpy.float64),
+            ("charge", numpy.float64),
+            ("sfi_sample", numpy.int32),
+            ("sfi_feature", numpy.int32),
+            ("sfi_intensity", numpy.float64),
+        ):
+            values = getattr(self, column)
+            if not isinstance(values, numpy.ndarray):
+                setattr(self, column, numpy.array(values, dtype=dtype))
+        return self
+
+    def sampleOrder(self):
+        """Return intensity indexes grouped by sample.
+
+        Samples are in the order they were added, as are intensities within a
+        sample.
+        """
+        self.freeze()
+        return numpy.argsort(self.sfi_sample, kind="stable")
+
+    def intensities(self, grouped=True):
+        """Iterate over intensities.
+
+        Yields (sample index, feature index, intensity) tuples. By default
+        intensities are grouped by sample, see sampleOrder(). Otherwise they are
+        in the order they were added.
+
+        Arguments:
+            grouped (bool): group intensities by sample
+        """
+        self.freeze()
+        if not grouped:
+            return zip(
+                self.sfi_sample.tolist(),
+                self.sfi_feature.tolist(),
+                self.sfi_intensity.tolist(),
+            )
+        order = self.sampleOrder()
+        return zip(
+            self.sfi_sample[order].tolist(),
+            self.sfi_feature[order].tolist(),
+            self.sfi_intensity[order].tolist(),
+        )
+
+    def filter(self, keep):
+        """Return a new FeatureStore with a subset of features.
+
+        Intensities of removed features are removed. Samples without intensities
+        are removed. Order of samples, features, and intensities is kept.
+
+        Arguments:
+            keep (array): boolean mask of features to keep
+        """
+        self.freeze()
+        keep = numpy.asarray(keep, dtype=bool)
+        kept = numpy.flatnonzero(keep)
+        feature_map = numpy.full(len(self.feature_names), -1, dtype=numpy.int32)
+        feature_map[kept] = numpy.arange(len(kept), dtype=numpy.int32)
+        sfi_keep = keep[self.sfi_feature]
+        sfi_sample = self.sfi_sample[sfi_keep]
+        samples_kept = numpy.zeros(len(self.sample_names), dtype=bool)
+        samples_kept[sfi_sample] = True
+        sample_map = numpy.cumsum(samples_kept, dtype=numpy.int32) - 1
+        store = FeatureStore()
+        store.sample_names = [
+            n for n, k in zip(self.sample_names, samples_kept.tolist()) if k
+        ]
+        store.sample_ids = {n: i for i, n in enumerate(store.sample_names)}
+        store.feature_names = [self.feature_names[i] for i in kept.tolist()]
+        store.feature_ids = {n: i for i, n in enumerate(store.feature_names)}
+        store.polarity = self.polarity[kept]
+        store.mz = self.mz[kept]
+        store.rt = self.rt[kept]
+        store.charge = self.charge[kept]
+        store.predictions = [self.predictions[i] for i in kept.tolist()]
+        store.sfi_sample = sample_map[sfi_sample]
+        store.sfi_feature = feature_map[self.sfi_feature[sfi_keep]]
+        store.sfi_intensity = self.sfi_intensity[sfi_keep]
+        return store
+
+    def filterSamples(self, keep):
+        """Return a new FeatureStore with a subset of samples.
+
+        Intensities of removed samples are removed. Features without intensities
+        are removed, see filter().
+
+        Arguments:
+            keep (array): boolean mask of samples to keep
+        """
+        self.freeze()
+        keep = numpy.asarray(keep, dtype=bool)
+        sfi_keep = keep[self.sfi_sample]
+        features_kept = numpy.zeros(len(self.feature_names), dtype=bool)
+        features_kept[self.sfi_feature[sfi_keep]] = True
+        store = copy.copy(self)
+        store.sfi_sample = self.sfi_sample[sfi_keep]
+        store.sfi_feature = self.sfi_feature[sfi_keep]
+        store.sfi_intensity = self.sfi_intensity[sfi_keep]
+        return store.filter(features_kept)
+
+    def feature(self, index):
+        """Create a Feature object of a feature.
+
+        The Feature's samples list is empty and its predictions list is shared
+        with the store.
+
+        Arguments:
+            index (int): feature index
+        """
+        charge = self.charge[index]
+        feature = Feature(
+            self.feature_names[index],
+            None,
+            POLARITIES[self.polarity[index]],
+            float(self.mz[index]),
+            float(self.rt[index]),
+            None if charge != charge else int(charge),  # NaN is unknown
+        )
+        feature.samples = []
+        feature.predictions = self.predictions[index]
+        return feature
+
+    def toObjects(self):
+        """Create Sample, SampleFeatureIntensity, and Feature objects.
+
+        Returns name-object dictionaries for samples and features, as made by
+        the vkmz.read functions.
+        """
+        self.freeze()
+        samples = {name: Sample(name) for name in self.sample_names}
+        sample_objects = list(samples.values())
+        feature_objects = [self.feature(i) for i in range(len(self.feature_names))]
+        features = {f.name: f for f in feature_objects}
+        for s, f, intensity in zip(
+            self.sfi_sample.tolist(),
+            self.sfi_feature.tolist(),
+            self.sfi_intensity.tolist(),
+        ):
+            feature = feature_objects[f]
+            feature.samples.append(self.sample_names[s])
+            sample_objects[s].sfis.append(SampleFeatureIntensity(intensity, feature))
+        return samples, features
+
+    @classmethod
+    def fromObjects(cls, samples, features):
+        """Create a FeatureStore from Sample and Feature dictionaries.
+
+        Arguments:
+            samples (dict): name-Sample dictionary
+            features (dict): name-Feature dictionary
+        """
+        store = cls()
+        for f in features.values():
+            index = store.addFeature(f.name, f.polarity, f.mz, f.rt, f.charge)
+            store.predictions[index] = f.predictions
+        for s in samples.values():
+            sample = store.addSample(s.name)
+            for sfi in s.sfis:
+                feature = store.feature_ids[sfi.feature.name]
+                store.addIntensity(sample, feature, float(sfi.intensity))
+        return store.freeze()
@@ -0,0 +1,407 @@
+#!/usr/bin/env python
+"""Flow control of a vkmz run
+
+run() reads input, predicts formulas, and writes results as described by a
+Config. It does not parse command line arguments, so it can be called from
+notebooks and long-lived worker processes.
+
+runStream() is a streaming variant of run() for large tabular input, and
+runAppend() adds results to the SQL output of an earlier run.
+
+All measure their stages in a vkmz.profiling.Profile, which is saved with
+--profile.
+"""
+
+import contextlib
+import copy
+import functools
+import numpy
+import os
+import tempfile
+from vkmz.density import densityGrids
+from vkmz.objects import FeatureStore
+from vkmz.predict import Predictor
+from vkmz.profiling import Profile
+from vkmz.read import (
+    TABULAR_READERS,
+    tabularChunks as readTabularChunks,
+    xcmsTabularStore as readXcmsTabular,
+    formulasStore as readFormulas,
+    sqlStore as readSql,
+)
+from vkmz.sqlschema import sqlAdducts
+import vkmz.write as write
+
+# record of an intensity spilled to disk by runStream()
+SPILL_RECORD = numpy.dtype(
+    [("sample", "<i4"), ("feature", "<i4"), ("intensity", "<f8")]
+)
+
+
+def run(config):
+    """Main flow control of vkmz
+
+    Read input data into a FeatureStore.
+
+    Then, make predictions for features. Features without predictions are removed
+    by default.
+
+    Finally, write results.
+
+    In sql mode, results are read from the SQL output of an earlier run and
+    written again, so its other output can be made without its input.
+
+    Returns the FeatureStore of predicted features.
+
+    Arguments:
+        config (Config): settings of run
+    """
+    if config.append:
+        return runAppend(config)
+    if config.stream:
+        return runStream(config)
+    profile = createProfile(config)
+    counters = profile.counters
+    # read input
+    with profile.stage("read"):
+        store = readInput(config, counters)
+    counters["features_created"] += len(store.feature_names)
+    if config.mode == "sql":
+        # output is labeled by adduct if the database's predictions are
+        config = copy.copy(config)
+        config.adducts = sqlAdducts(config.input)
+
+    predictor = None
+    if config.mode == "tabular" or config.mode == "w4m-xcms":
+        with profile.stage("predict"):
+            with createPredictor(config) as predictor:
+                # make predictions for all features in one batch
+                predicted = predictor.predictStore(store)
+            # remove features without a prediction, their intensities, and
+            # samples without an intensity
+            store = store.filter(predicted)
+        countPredictor(predictor, counters)
+    counters["features_predicted"] += len(store.feature_names)
+
+    # write results
+    with profile.stage("tabular"):
+        write.tabular(store, config)
+    writePayloads(store, config, profile)
+    if config.sql:
+        with profile.stage("sql"):
+            write.sql(store, config)
+    if config.parquet:
+        with profile.stage("parquet"):
+            write.parquet(store, config)
+    if config.metadata:
+        write.metadata(config)
+    if config.profile:
+        profile.write(config)
+    return store
+
+
+def runStream(config):
+    """Streaming flow control of vkmz for tabular input
+
+    Reads the tabular input in chunks of rows. Each chunk's new features are
+    predicted and the chunk's predicted rows are written to the tabular and SQL
+    outputs before the next chunk is read. Memory use is proportional to the
+    chunk size plus the number of unique features.
+
+    Tabular output rows, and SQL intensity rows, are in input order instead of
+    being grouped by sample.
+
+    Intensities of predicted rows are spilled to a compact temporary file, from
+    which the JSON and HTML outputs are written at the end.
+
+    Returns the FeatureStore of predicted features.
+
+    Arguments:
+        config (Config): settings of run
+    """
+    profile = createProfile(config)
+    counters = profile.counters
+    # samples and predicted features seen so far
+    results = FeatureStore()
+    unpredicted = set()
+    # sample name to rank of its first row
+    first_rows = {}
+    # writers are rolled back or closed if the run fails, see write.SqlWriter
+    with contextlib.ExitStack() as writers:
+        sql_writer = parquet_writer = None
+        if config.sql:
+            sql_writer = writers.enter_context(write.sqlWriter(config))
+        if config.parquet:
+            parquet_writer = writers.enter_context(write.ParquetWriter(config))
+        spill_directory = os.path.dirname(os.path.abspath(config.output))
+        with createPredictor(config) as predictor, write.openTabular(
+            config
+        ) as t_file, tempfile.TemporaryFile(dir=spill_directory) as spill:
+            t_file.write(write.tabularHeader(config.alternate, bool(config.adducts)))
+            chunks = readTabularChunks(
+                config.input,
+                config.polarity,
+                config.impute,
+                config.chunk_size,
+                counters,
+            )
+            while True:
+                with profile.stage("read"):
+                    chunk = next(chunks, None)
+                if chunk is None:
+                    break
+                # samples in order of their first row, as read by run()
+                for name in chunk.sample_names:
+                    first_rows.setdefault(name, len(first_rows))
+                with profile.stage("predict"):
+                    # only predict features not seen in earlier chunks
+                    new = numpy.array(
+                        [
+                            name not in results.feature_ids and name not in unpredicted
+                            for name in chunk.feature_names
+                        ],
+                        dtype=bool,
+                    )
+                    counters["features_created"] += int(numpy.count_nonzero(new))
+                    predicted = predictor.predictStore(chunk, new)
+                    for i, name in enumerate(chunk.feature_names):
+                        if not new[i]:
+                            known = results.feature_ids.get(name)
+                            if known is not None:
+                                chunk.predictions[i] = results.predictions[known]
+                                predicted[i] = True
+                        elif predicted[i]:
+                            f = chunk.feature(i)
+                            known = results.addFeature(
+                                f.name, f.polarity, f.mz, f.rt, f.charge
+                            )
+                            results.predictions[known] = f.predictions
+                        else:
+                            unpredicted.add(name)
+                    # remove features without a prediction, their intensities, and
+                    # samples without an intensity
+                    chunk = chunk.filter(predicted)
+                with profile.stage("tabular"):
+                    t_file.writelines(
+                        write.tabularLines(
+                            chunk,
+                            config.alternate,
+                            grouped=False,
+                            adducts=bool(config.adducts),
+                        )
+                    )
+                if sql_writer:
+                    with profile.stage("sql"):
+                        sql_writer.write(chunk, grouped=False)
+                if parquet_writer:
+                    with profile.stage("parquet"):
+                        parquet_writer.write(chunk, grouped=False)
+                sample_map = numpy.array(
+                    [results.addSample(name) for name in chunk.sample_names],
+                    dtype=numpy.int32,
+                )
+                feature_map = numpy.array(
+                    [results.feature_ids[name] for name in chunk.feature_names],
+                    dtype=numpy.int32,
+                )
+                records = numpy.empty(len(chunk.sfi_intensity), dtype=SPILL_RECORD)
+                records["sample"] = sample_map[chunk.sfi_sample]
+                records["feature"] = feature_map[chunk.sfi_feature]
+                records["intensity"] = chunk.sfi_intensity
+                records.tofile(spill)
+            spill.seek(0)
+            records = numpy.fromfile(spill, dtype=SPILL_RECORD)
+        # order samples by their first row instead of their first predicted row,
+        # which depends on the chunk size
+        order = sorted(
+            range(len(results.sample_names)),
+            key=lambda i: first_rows[results.sample_names[i]],
+        )
+        sample_map = numpy.empty(len(order), dtype=numpy.int32)
+        sample_map[order] = numpy.arange(len(order))
+        results.sample_names = [results.sample_names[i] for i in order]
+        results.sample_ids = {name: i for i, name in enumerate(results.sample_names)}
+        results.sfi_sample = sample_map[records["sample"]]
+        results.sfi_feature = records["feature"].copy()
+        results.sfi_intensity = records["intensity"].copy()
+        results.freeze()
+        countPredictor(predictor, counters)
+        counters["features_predicted"] += len(results.feature_names)
+
+        # write remaining results
+        writePayloads(results, config, profile)
+        if sql_writer:
+            with profile.stage("sql"):
+                sql_writer.close()
+        if parquet_writer:
+            with profile.stage("parquet"):
+                parquet_writer.close()
+    if config.metadata:
+        write.metadata(config)
+    if config.profile:
+        profile.write(config)
+    return results
+
+
+def runAppend(config):
+    """Flow control of vkmz adding results to the SQL output of an earlier run
+
+    Reads input like run(). Samples already in the database were added by an
+    earlier run and are removed with their intensities. Features already in the
+    database keep their predictions, so only new features are predicted. New
+    samples, features, predictions, and intensities are then added to the
+    database, see vkmz.write.SqlWriter.open().
+
+    Tabular, JSON, html, and Parquet output is written from the whole database,
+    as sql mode would, instead of only from the new samples.
+
+    Returns the FeatureStore of all results in the database.
+
+    Arguments:
+        config (Config): settings of run
+    """
+    profile = createProfile(config)
+    counters = profile.counters
+    with profile.stage("read"):
+        store = readInput(config, counters)
+    # the new rows are rolled back if the run fails, see write.SqlWriter
+    with write.sqlWriter(config) as writer:
+        new_samples = numpy.array(
+            [name not in writer.sample_ids for name in store.sample_names], dtype=bool
+        )
+        counters["samples_dropped_existing"] += len(new_samples) - int(
+            numpy.count_nonzero(new_samples)
+        )
+        store = store.filterSamples(new_samples)
+        counters["features_created"] += len(store.feature_names)
+        known = numpy.array(
+            [name in writer.feature_ids for name in store.feature_names], dtype=bool
+        )
+        counters["features_existing"] += int(numpy.count_nonzero(known))
+
+        predictor = None
+        if config.mode == "tabular" or config.mode == "w4m-xcms":
+            with profile.stage("predict"):
+                # filter() shares prediction lists, so predictions of new features
+                # are added to store
+                new = store.filter(~known)
+                predicted = known.copy()
+                with createPredictor(config) as predictor:
+                    predicted[~known] = predictor.predictStore(new)
+                store = store.filter(predicted)
+            countPredictor(predictor, counters)
+        counters["features_predicted"] += len(store.feature_names)
+        with profile.stage("sql"):
+            writer.write(store)
+            writer.close()
+
+    # write other output from the whole database
+    with profile.stage("readSql"):
+        results = readSql(config.output + ".db")
+    with profile.stage("tabular"):
+        write.tabular(results, config)
+    writePayloads(results, config, profile)
+    if config.parquet:
+        with profile.stage("parquet"):
+            write.parquet(results, config)
+    if config.metadata:
+        write.metadata(config)
+    if config.profile:
+        profile.write(config)
+    return results
+
+
+def readInput(config, counters=None):
+    """Read the input of a run into a FeatureStore
+
+    Arguments:
+        config (Config): settings of run
+        counters (Counter): counters of run, or None
+    """
+    if config.mode == "tabular":
+        readTabular = TABULAR_READERS[config.reader]
+        if config.reader == "parallel":
+            readTabular = functools.partial(readTabular, workers=config.workers)
+        return readTabular(config.input, config.polarity, config.impute, counters)
+    if config.mode == "w4m-xcms":
+        return readXcmsTabular(
+            config.sample_metadata,
+            config.variable_metadata,
+            config.data_matrix,
+            config.polarity,
+            config.impute,
+            counters,
+        )
+    if config.mode == "sql":
+        return readSql(config.input, counters)
+    # config.mode == "formula"
+    return readFormulas(config.input, config.polarity, config.impute, counters)
+
+
+def createPredictor(config):
+    """Return the Predictor of a run
+
+    Arguments:
+        config (Config): settings of run
+    """
+    return Predictor(
+        config.databasePath(),
+        config.mass_error,
+        neutral=config.neutral,
+        alternate=config.alternate,
+        workers=config.workers,
+        adducts=config.adducts,
+    )
+
+
+def createProfile(config):
+    """Return the Profile of a run
+
+    Arguments:
+        config (Config): settings of run
+    """
+    return Profile(config.output if config.cprofile else None)
+
+
+def countPredictor(predictor, counters):
+    """Add counts of features a Predictor did not predict to counters
+
+    Arguments:
+        predictor (Predictor): predictor of run
+        counters (Counter): counters of run
+    """
+    counters["features_unmatched"] += predictor.unmatched
+    counters["features_dropped_alternate"] += predictor.ambiguous
+
+
+def writePayloads(store, config, profile=None):
+    """Write JSON, density, and html output
+
+    Arguments:
+        store (FeatureStore): predicted features
+        config (Config): settings of run
+        profile (Profile): profile of run, or None
+    """
+    if profile is None:
+        profile = Profile()
+    j_objs = None
+    if config.json or config.html_payload == "json":
+        with profile.stage("generateJson"):
+            j_objs = write.generateJson(store)
+    if config.json:
+        with profile.stage("json"):
+            write.json_write(j_objs, config)
+    if config.html_payload == "binary":
+        with profile.stage("generateBinaryPayload"):
+            h_payload = write.generateBinaryPayload(store)
+    else:
+        h_payload = j_objs
+    if config.density:
+        with profile.stage("density"):
+            d_payload = write.densityPayload(densityGrids(store))
+            if config.density == "sidecar":
+                write.density(d_payload, config)
+            else:  # config.density == "embed"
+                h_payload = dict(h_payload, density=d_payload)
+    with profile.stage("html"):
+        write.html(h_payload, config)
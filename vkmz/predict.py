@@ -2,14 +2,54 @@
 """vkmz.predict module
 
 Functions to predict a MS feature's molecular structure.
-"""
 
+Predictions are made by a Predictor, which loads its database of known
+formula-mass pairs the first time it is needed.
+
+A Predictor can search several adduct hypotheses of each feature at once, see
+ADDUCTS.
+
+A Predictor with more than one worker searches large batches of features in a
+pool of processes. Workers memory-map a compiled database instead of receiving
+a pickled copy, see Predictor.pool(), and return their matches as arrays from
+which Prediction objects are made once, in the calling process.
+"""
 
+import concurrent.futures
+import functools
+import itertools
+import numpy
+import os
 import re
-from vkmz.arguments import ALTERNATE, FORMULA, MASS, MASS_ERROR, MAX_MASS_INDEX, NEUTRAL
-from vkmz.objects import Prediction
+import tempfile
+from vkmz import database
+from vkmz.compression import detectCompression
+from vkmz.objects import POLARITIES, Prediction
 
 PROTON = 1.00727646677
+# polarity of each adduct and the mass it adds to a neutral molecule per charge
+ADDUCTS = {
+    "[M+H]+": ("positive", PROTON),
+    "[M+Na]+": ("positive", 22.98922070),
+    "[M+K]+": ("positive", 38.96315791),
+    "[M+NH4]+": ("positive", 18.03382555),
+    "[M-H]-": ("negative", -PROTON),
+    "[M+Cl]-": ("negative", 34.96940126),
+    "[M+FA-H]-": ("negative", 44.99820283),
+}
+# number of parsed user formulas to memoize
+FORMULA_CACHE_SIZE = 4096
+# fewest features to predict in each task of a worker process
+WORKER_CHUNK_SIZE = 10000
+# match() merge joins masses with known masses when there are at least
+# MERGE_JOIN_MIN_KNOWN known masses and MERGE_JOIN_RATIO masses per known mass.
+# Smaller known mass arrays fit in cache and are faster to binary search, see
+# benchmarks/match.py.
+MERGE_JOIN_MIN_KNOWN = 1000000
+MERGE_JOIN_RATIO = 0.1
+
+# Predictor of a worker process, see initWorker()
+worker_predictor = None
 
 
 def adjust(mz, polarity, charge):
@@ -38,65 +78,6 @@ def adjust(mz, polarity, charge):
     return mass
 
 
-def predictInit(mass, uncertainty, left, right):
-    """Search for a matching mass within the known-mass list.
-
-    Uses binary search to match a given mass to a known mass within a given
-    uncertainty. Upon match returns known mass index.
-
-    If no match is made returns -1.
-
-    Arguments:
-        mass (float): observed neutral molecular mass in daltons
-        uncertainty (float): mass error range in daltons
-        left (int): left index of MASS list
-        right (int): right index of MASS list
-    """
-    mid = int(((right - left) / 2) + left)
-    if left <= mid <= right and mid <= MAX_MASS_INDEX:
-        delta = mass - MASS[mid]
-        if uncertainty >= abs(delta):
-            return mid
-        elif uncertainty > delta:
-            return predictInit(mass, uncertainty, left, mid - 1)
-        else:
-            return predictInit(mass, uncertainty, mid + 1, right)
-    return -1
-
-
-def predictAll(mass, uncertainty, init_index):
-    """Search for all matching masses within the known-mass list.
-
-    Checks adjacent indexes from a given index of known-masses which are within a
-    given uncertainty of a given mass.
-
-    Arguments:
-        mass (float): observed neutral mass
-        uncertainty (float): mass error range
-        init_index (int): initial index in MASS list to begin search
-    """
-    matches = [init_index]
-    i = 0
-    while init_index + i + 1 <= MAX_MASS_INDEX:
-        m = init_index + i + 1
-        delta = mass - MASS[m]
-        if uncertainty >= abs(delta):
-            matches.append(m)
-            i += 1
-        else:
-            break
-    i = 0
-    while init_index + i - 1 >= 0:
-        m = init_index + i - 1
-        delta = float(MASS[m]) - mass
-        if uncertainty >= abs(delta):
-            matches.append(m)
-            i -= 1
-        else:
-            break
-    return matches
-
-
 def parseFormula(formula):
     """Parse molecular formula by it's constituent elements.
 
@@ -139,56 +120,753 @@ def parseFormula(formula):
     return element_count, hc, oc, nc
 
 
-def predict(feature):
-    """Make predictions for a feature.
+@functools.lru_cache(maxsize=FORMULA_CACHE_SIZE)
+def parseFormulaCached(formula):
+    """Parse molecular formula, memoizing results.
+
+    Same as parseFormula(), for formulas which do not come from a database, such
+    as annotated input. The most recently used FORMULA_CACHE_SIZE formulas are
+    kept. The returned element_count dictionary is shared between calls and must
+    not be modified.
+
+    Arguments:
+        formula (string): molecular formula
+    """
+    return parseFormula(formula)
 
-    Reads a Feature as input and, if possible, returns it with a list of
-    Prediction objects.
 
-    A feature is assumed to be charged by default. The observed charged mass of
-    the feature is converted to a neutral mass through adjust(). The --neutral
-    flag disables adjustment.
+def mergeCounts(known, keys, inclusive):
+    """Count known masses below each key by merging two sorted arrays.
 
-    predictInit() returns an index for the MASS/FORMULA lists  if a known mass is
-    within the mass error uncertainty of the observed, neutral, mass.  Features
-    without a prediction are thrown out.
+    Equivalent to numpy.searchsorted(known, keys), with side "right" if inclusive
+    and "left" otherwise. Keys should be sorted, so the stable sort of both
+    arrays is a single linear merge of two runs.
 
-    On match, predictAll() searches for matches adjacent to the initial match.
+    Arguments:
+        known (array): sorted known masses
+        keys (array): masses to count known masses below
+        inclusive (bool): also count known masses equal to a key
+    """
+    # stable sorting places equal values in the order they are concatenated
+    if inclusive:
+        order = numpy.argsort(numpy.concatenate((known, keys)), kind="stable")
+        is_key = order >= len(known)
+        key_index = order[is_key] - len(known)
+    else:
+        order = numpy.argsort(numpy.concatenate((keys, known)), kind="stable")
+        is_key = order < len(keys)
+        key_index = order[is_key]
+    # known masses merged before each position
+    below = numpy.cumsum(~is_key)
+    counts = numpy.empty(len(keys), dtype=numpy.intp)
+    counts[key_index] = below[is_key]
+    return counts
 
-    By default, features with multiple predictions are thrown out unless the
-    --alternate flag is set. Alternate matches are sorted by absolute delta.
 
-    For each match an element_count dictionary is parsed and elemental ratios are
-    calculated.
+def initWorker(database_file, mass_error, neutral, alternate, adducts):
+    """Create the Predictor of a worker process.
 
-    Prediction objects are made for each match and added to the features
-    predictions list before returning the feature object.
+    Arguments:
+        database_file (str): path to a compiled database
+        mass_error (float): mass error of MS data in parts-per-million
+        neutral (bool): feature mz values are neutral masses
+        alternate (bool): keep features with multiple predictions
+        adducts (list): adducts to search, see ADDUCTS
+    """
+    global worker_predictor
+    worker_predictor = Predictor(
+        database_file, mass_error, neutral, alternate, adducts=adducts
+    )
+
+
+def predictWorker(masses, adducts, starts, subset):
+    """Search and select matches of features in a worker process.
+
+    Returns the number of matches of each feature, and the owners, matches,
+    deltas, and labels arrays of selected matches, see Predictor.selectMatches().
+    Prediction objects are made from these arrays by the parent process, see
+    Predictor.predictStore().
 
     Arguments:
-        feature (Feature): feature to make a prediction for
+        masses (array): neutral masses of features, see Predictor.adductMasses()
+        adducts (array): adduct index of each mass, or None
+        starts (array): start of each feature's masses, plus the end
+        subset (array): boolean mask of features to predict
     """
-    if NEUTRAL:
-        mass = feature.mz
-    else:
-        mass = adjust(feature.mz, feature.polarity, feature.charge)
-    # uncertainty is the mass error in parts per million
-    uncertainty = mass * MASS_ERROR / 1e6
-    init_index = predictInit(mass, uncertainty, 0, MAX_MASS_INDEX)
-    if init_index != -1:
-        matches = predictAll(mass, uncertainty, init_index)
-        # remove feature if multiple predictions are made and --alternate not set
-        if not ALTERNATE and len(matches) > 1:
-            return
-        for m in matches:
-            delta = mass - MASS[m]  # check with Stephen
-            formula = FORMULA[m]
-            element_count, hc, oc, nc = parseFormula(formula)
-            feature.predictions.append(
-                Prediction(MASS[m], formula, delta, element_count, hc, oc, nc)
+    predictor = worker_predictor
+    bounds, matches, deltas, labels = predictor.matchFeatures(masses, adducts, starts)
+    selected = predictor.selectMatches(bounds, matches, deltas, labels, subset)
+    return (numpy.diff(bounds),) + selected
+
+
+class Predictor(object):
+    """Predicts molecular formulas of features from a known formula-mass database.
+
+    The database is loaded on first use. Databases are cached by vkmz.database, so
+    Predictors sharing a database only load it once per process.
+
+    Predictors are context managers which close() on exit, so worker processes
+    and temporary files are not left behind by errors.
+
+    Attributes:
+        database (str): path to a tabular or compiled database
+        mass_error (float): mass error of MS data in parts-per-million
+        neutral (bool): feature mz values are neutral masses
+        alternate (bool): keep features with multiple predictions
+        workers (int): number of processes to make predictions with
+        adducts (list): adducts to search for each feature of a matching
+                        polarity, see ADDUCTS, or None to only protonate and
+                        deprotonate. Ignored if neutral is set.
+        unmatched (int): number of features predictStore() found no matches for
+        ambiguous (int): number of features predictStore() dropped for having
+                         multiple matches while alternate is not set
+    """
+
+    def __init__(
+        self,
+        database,
+        mass_error,
+        neutral=False,
+        alternate=False,
+        workers=1,
+        adducts=None,
+    ):
+        self.database = database
+        self.mass_error = mass_error
+        self.neutral = neutral
+        self.alternate = alternate
+        self.workers = workers
+        for adduct in adducts or []:
+            if adduct not in ADDUCTS:
+                raise ValueError(
+                    f"Unknown adduct {adduct}, choose from: {', '.join(ADDUCTS)}"
+                )
+        self.adducts = adducts
+        self.unmatched = 0
+        self.ambiguous = 0
+        # worker processes and their compiled database, see pool()
+        self.executor = None
+        self.shared_database = None
+
+    @property
+    def mass(self):
+        """Sorted array of known masses."""
+        return self.load().mass
+
+    @property
+    def formula(self):
+        """Indexable formulas of known masses."""
+        return self.load().formula
+
+    def load(self):
+        """Load Database of known masses and formulas."""
+        try:
+            return database.load(self.database)
+        except:
+            print(f"An error occurred while reading the {self.database} database.")
+            raise
+
+    def pool(self):
+        """Start worker processes on first use and return their executor.
+
+        Workers memory-map the database, so they share its pages. Tabular and
+        compressed databases are first written to a temporary compiled file, which
+        is removed by close().
+        """
+        if self.executor is None:
+            shared_database = self.database
+            if not database.isCompiled(self.database) or detectCompression(
+                self.database
+            ):
+                handle, shared_database = tempfile.mkstemp(suffix=".vkdb")
+                os.close(handle)
+                self.shared_database = shared_database
+                database.writeCompiled(self.load(), shared_database)
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.workers,
+                initializer=initWorker,
+                initargs=(
+                    shared_database,
+                    self.mass_error,
+                    self.neutral,
+                    self.alternate,
+                    self.adducts,
+                ),
+            )
+        return self.executor
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Stop worker processes and remove their temporary database, see pool()."""
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        if self.shared_database is not None:
+            os.remove(self.shared_database)
+            self.shared_database = None
+
+    def predictInit(self, mass, uncertainty, left, right):
+        """Search for a matching mass within the known-mass list.
+
+        Uses binary search to match a given mass to a known mass within a given
+        uncertainty. Upon match returns known mass index.
+
+        If no match is made returns -1.
+
+        Arguments:
+            mass (float): observed neutral molecular mass in daltons
+            uncertainty (float): mass error range in daltons
+            left (int): left index of mass list
+            right (int): right index of mass list
+        """
+        known = self.mass
+        mid = int(((right - left) / 2) + left)
+        if left <= mid <= right and mid < len(known):
+            delta = mass - known[mid]
+            if uncertainty >= abs(delta):
+                return mid
+            elif uncertainty > delta:
+                return self.predictInit(mass, uncertainty, left, mid - 1)
+            else:
+                return self.predictInit(mass, uncertainty, mid + 1, right)
+        return -1
+
+    def predictAll(self, mass, uncertainty, init_index):
+        """Search for all matching masses within the known-mass list.
+
+        Checks adjacent indexes from a given index of known-masses which are within
+        a given uncertainty of a given mass.
+
+        Arguments:
+            mass (float): observed neutral mass
+            uncertainty (float): mass error range
+            init_index (int): initial index in mass list to begin search
+        """
+        known = self.mass
+        max_index = len(known) - 1
+        matches = [init_index]
+        i = 0
+        while init_index + i + 1 <= max_index:
+            m = init_index + i + 1
+            delta = mass - known[m]
+            if uncertainty >= abs(delta):
+                matches.append(m)
+                i += 1
+            else:
+                break
+        i = 0
+        while init_index + i - 1 >= 0:
+            m = init_index + i - 1
+            delta = float(known[m]) - mass
+            if uncertainty >= abs(delta):
+                matches.append(m)
+                i -= 1
+            else:
+                break
+        return matches
+
+    def predict(self, feature):
+        """Make predictions for a feature.
+
+        Reads a Feature as input and, if possible, returns it with a list of
+        Prediction objects.
+
+        A feature is assumed to be charged by default. The observed charged mass
+        of the feature is converted to a neutral mass through adjust(). The
+        neutral attribute disables adjustment.
+
+        predictInit() returns an index for the mass/formula lists if a known mass
+        is within the mass error uncertainty of the observed, neutral, mass.
+        Features without a prediction are thrown out.
+
+        On match, predictAll() searches for matches adjacent to the initial match.
+
+        By default, features with multiple predictions are thrown out unless the
+        alternate attribute is set. Alternate matches are sorted by absolute
+        delta. Ties keep the order predictAll() finds them in: the initial
+        match, matches above it, then matches below it.
+
+        For each match the element_count dictionary and elemental ratios are
+        looked up from the database.
+
+        Prediction objects are made for each match and added to the features
+        predictions list before returning the feature object.
+
+        Arguments:
+            feature (Feature): feature to make a prediction for
+        """
+        if self.neutral:
+            mass = feature.mz
+        else:
+            mass = adjust(feature.mz, feature.polarity, feature.charge)
+        # uncertainty is the mass error in parts per million
+        uncertainty = mass * self.mass_error / 1e6
+        init_index = self.predictInit(mass, uncertainty, 0, len(self.mass) - 1)
+        if init_index != -1:
+            matches = self.predictAll(mass, uncertainty, init_index)
+            # remove feature if multiple predictions are made and alternate not set
+            if not self.alternate and len(matches) > 1:
+                return
+            known = self.load()
+            for m in matches:
+                known_mass = float(known.mass[m])
+                delta = mass - known_mass  # check with Stephen
+                formula = known.formula[m]
+                element_count = known.elementCount(m)
+                hc, oc, nc = known.ratios[m].tolist()
+                feature.predictions.append(
+                    Prediction(known_mass, formula, delta, element_count, hc, oc, nc)
+                )
+            # sort alternate matches by lowest absolute delta
+            if self.alternate and len(matches) > 1:
+                feature.predictions.sort(key=lambda m: abs(m.delta))
+            return feature
+        # no prediction was made
+        return
+
+    def neutralMasses(self, features):
+        """Convert the mz of many features to neutral masses at once.
+
+        Vectorized form of adjust(). Returns an array of neutral masses ordered
+        like the given features. The neutral attribute disables adjustment.
+
+        Arguments:
+            features (list): Feature objects
+        """
+        mz = numpy.array([f.mz for f in features], dtype=numpy.float64)
+        # if charge is not given, impute 1
+        charge = numpy.array(
+            [1 if f.charge is None else f.charge for f in features],
+            dtype=numpy.float64,
+        )
+        positive = numpy.array([f.polarity == "positive" for f in features], dtype=bool)
+        return self.neutralize(mz, positive, charge)
+
+    def neutralize(self, mz, positive, charge):
+        """Convert arrays of mz to neutral masses.
+
+        Vectorized form of adjust(). The neutral attribute disables adjustment.
+
+        Arguments:
+            mz (array): observed mass-to-charge ratios
+            positive (array): boolean array, True for positive polarity
+            charge (array): electric charges
+        """
+        if self.neutral:
+            return numpy.asarray(mz, dtype=numpy.float64)
+        charged_mass = mz / charge
+        return numpy.where(
+            positive, charged_mass - (PROTON * charge), charged_mass + (PROTON * charge)
+        )
+
+    def matchStrategy(self, count):
+        """Choose the match() strategy for a number of masses.
+
+        Returns "merge" if there are at least MERGE_JOIN_MIN_KNOWN known masses
+        and MERGE_JOIN_RATIO masses per known mass, otherwise "search".
+
+        Arguments:
+            count (int): number of masses to match
+        """
+        known = len(self.mass)
+        if known >= MERGE_JOIN_MIN_KNOWN and count >= known * MERGE_JOIN_RATIO:
+            return "merge"
+        return "search"
+
+    def match(self, masses, strategy=None):
+        """Find known masses within the mass error of many neutral masses.
+
+        Matches are searched, see searchMatches(), then the matches of each mass
+        are put in the order predict() finds them, see walkOrder().
+
+        Arguments:
+            masses (array): neutral masses
+            strategy (str): "search" or "merge", see searchMatches()
+        """
+        bounds, matches, deltas = self.searchMatches(masses, strategy)
+        matches, deltas = self.walkOrder(masses, bounds, matches, deltas)
+        return bounds, matches, deltas
+
+    def initIndexes(self, masses):
+        """Find the known mass predictInit() finds for many neutral masses.
+
+        Vectorized form of predictInit(). Every mass takes the same steps of the
+        binary search, so the match found first is the same. Returns an array of
+        known mass indexes, -1 where no known mass matches.
+
+        Arguments:
+            masses (array): neutral masses
+        """
+        known = self.mass
+        masses = numpy.asarray(masses, dtype=numpy.float64)
+        # uncertainty is the mass error in parts per million
+        uncertainty = masses * self.mass_error / 1e6
+        found = numpy.full(len(masses), -1, dtype=numpy.intp)
+        left = numpy.zeros(len(masses), dtype=numpy.intp)
+        right = numpy.full(len(masses), len(known) - 1, dtype=numpy.intp)
+        active = numpy.arange(len(masses))
+        while len(active):
+            active = active[left[active] <= right[active]]
+            mid = left[active] + (right[active] - left[active]) // 2
+            delta = masses[active] - known[mid]
+            hit = uncertainty[active] >= numpy.abs(delta)
+            lower = ~hit & (uncertainty[active] > delta)
+            higher = ~hit & ~lower
+            found[active[hit]] = mid[hit]
+            right[active[lower]] = mid[lower] - 1
+            left[active[higher]] = mid[higher] + 1
+            active = active[~hit]
+        return found
+
+    def walkOrder(self, masses, bounds, matches, deltas):
+        """Order each mass's matches like predictAll() walks them.
+
+        predictAll() starts at the match found by predictInit(), see
+        initIndexes(), walks up to the last match, then walks down from the
+        start to the first match. Returns matches and deltas in that order.
+
+        Arguments:
+            masses (array): neutral masses
+            bounds (array): start of each mass's matches, plus the end
+            matches (array): matching known mass indexes, ascending per mass
+            deltas (array): difference between the mass and each match
+        """
+        counts = numpy.diff(bounds)
+        matched = numpy.flatnonzero(counts)
+        masses = numpy.asarray(masses, dtype=numpy.float64)
+        # position of the initial match among each mass's matches
+        starts = numpy.zeros(len(counts), dtype=numpy.intp)
+        starts[matched] = self.initIndexes(masses[matched]) - matches[bounds[matched]]
+        owners = numpy.repeat(numpy.arange(len(counts)), counts)
+        offsets = numpy.arange(len(matches)) - bounds[owners]
+        starts = starts[owners]
+        ranks = numpy.where(
+            offsets >= starts, offsets - starts, counts[owners] - 1 - offsets
+        )
+        order = numpy.empty(len(matches), dtype=numpy.intp)
+        order[bounds[owners] + ranks] = numpy.arange(len(matches))
+        return matches[order], deltas[order]
+
+    def searchMatches(self, masses, strategy=None):
+        """Search for known masses within the mass error of many neutral masses.
+
+        Instead of a binary search and neighbour walk per mass, the lower and
+        upper bounds of every mass error window are located in the sorted mass
+        array. Windows are widened by a few ulps and candidates are then checked
+        with the same inclusive comparison predict() uses, so both paths agree on
+        matches at the window edges.
+
+        Window bounds are found by one of two strategies:
+            "search": numpy.searchsorted() of each bound, O(N log M)
+            "merge": masses are sorted once and window bounds are merged with the
+                     known masses, see mergeCounts(), O(N log N + M) with
+                     sequential memory access
+
+        By default, the strategy is chosen by matchStrategy(). Both strategies
+        return the same results.
+
+        Returns bounds, matches, and deltas arrays. The known mass indexes matching
+        masses[i] are matches[bounds[i]:bounds[i + 1]], in ascending order, with
+        deltas[bounds[i]:bounds[i + 1]].
+
+        Arguments:
+            masses (array): neutral masses
+            strategy (str): "search" or "merge", defaults to choosing by size
+        """
+        known = self.mass
+        masses = numpy.asarray(masses, dtype=numpy.float64)
+        # uncertainty is the mass error in parts per million
+        uncertainty = masses * self.mass_error / 1e6
+        slack = numpy.spacing(masses) * 4
+        lowers = masses - uncertainty - slack
+        uppers = masses + uncertainty + slack
+        if strategy is None:
+            strategy = self.matchStrategy(len(masses))
+        if strategy == "merge":
+            # window bounds are ordered like masses, except across binades
+            order = numpy.argsort(masses, kind="stable")
+            lefts = numpy.empty(len(masses), dtype=numpy.intp)
+            rights = numpy.empty(len(masses), dtype=numpy.intp)
+            lefts[order] = mergeCounts(known, lowers[order], inclusive=False)
+            rights[order] = mergeCounts(known, uppers[order], inclusive=True)
+        else:  # strategy == "search"
+            lefts = numpy.searchsorted(known, lowers, side="left")
+            rights = numpy.searchsorted(known, uppers, side="right")
+        # flatten candidate windows into parallel arrays of mass and known indexes
+        counts = rights - lefts
+        owners = numpy.repeat(numpy.arange(len(masses)), counts)
+        starts = numpy.repeat(lefts - numpy.cumsum(counts) + counts, counts)
+        candidates = starts + numpy.arange(counts.sum())
+        deltas = masses[owners] - known[candidates]
+        hits = uncertainty[owners] >= numpy.abs(deltas)
+        owners = owners[hits]
+        bounds = numpy.searchsorted(owners, numpy.arange(len(masses) + 1))
+        return bounds, candidates[hits], deltas[hits]
+
+    def predictMatches(self, matches, deltas, adducts=None):
+        """Create Prediction objects for the matches of a feature.
+
+        Returns a list of Prediction objects sorted by absolute delta, with ties
+        in the order of matches. The list is empty if there are no matches, or multiple matches and the alternate
+        attribute is not set.
+
+        Arguments:
+            matches (array): matching known mass indexes, see match()
+            deltas (array): difference between the mass and each match
+            adducts (array): index into the adducts attribute of each match, or
+                             None if adducts are not searched
+        """
+        # remove feature if multiple predictions are made and alternate not set
+        if len(matches) == 0 or (not self.alternate and len(matches) > 1):
+            return []
+        database = self.load()
+        matches = matches.tolist()
+        if adducts is None:
+            labels = itertools.repeat(None)
+        else:
+            labels = [self.adducts[a] for a in adducts.tolist()]
+        predictions = []
+        for m, delta, (hc, oc, nc), adduct in zip(
+            matches, deltas.tolist(), database.ratios[matches].tolist(), labels
+        ):
+            predictions.append(
+                Prediction(
+                    float(database.mass[m]),
+                    database.formula[m],
+                    delta,
+                    database.elementCount(m),
+                    hc,
+                    oc,
+                    nc,
+                    adduct,
+                )
             )
         # sort alternate matches by lowest absolute delta
-        if not ALTERNATE and len(matches) > 1:
-            feature.predictions.sort(key=lambda m: abs(m.delta))
-        return feature
-    # no prediction was made
-    return
+        if len(predictions) > 1:
+            predictions.sort(key=lambda m: abs(m.delta))
+        return predictions
+
+    def predictBatch(self, features, masses):
+        """Make predictions for many features at once.
+
+        Batch form of predict(), see match(). Neutral masses must already be
+        adjusted, see neutralMasses(). Returns a list ordered like features where
+        each item is either the Feature with its Prediction objects or None.
+
+        Arguments:
+            features (list): Feature objects
+            masses (array): neutral masses of features
+        """
+        bounds, matches, deltas = self.match(masses)
+        results = [None] * (len(bounds) - 1)
+        for i, feature in enumerate(features):
+            first, last = bounds[i], bounds[i + 1]
+            predictions = self.predictMatches(matches[first:last], deltas[first:last])
+            if predictions:
+                feature.predictions.extend(predictions)
+                results[i] = feature
+        return results
+
+    def adductMasses(self, store):
+        """Convert the mz of a store's features to neutral masses.
+
+        Without adducts, each feature has one neutral mass, see neutralize().
+        Otherwise each feature has one mass per adduct of its polarity, in the
+        order of the adducts attribute. Masses of all features and adducts are
+        computed in one batch, so they can be matched in one pass.
+
+        Returns masses, adducts, and starts arrays. The masses of feature i are
+        masses[starts[i]:starts[i + 1]], and adducts are the index into the
+        adducts attribute of each mass, or None without adducts.
+
+        Arguments:
+            store (FeatureStore): features to convert
+        """
+        store.freeze()
+        positive = store.polarity == POLARITIES.index("positive")
+        # if charge is not given, impute 1
+        charge = numpy.where(numpy.isnan(store.charge), 1.0, store.charge)
+        if not self.adducts or self.neutral:
+            masses = self.neutralize(store.mz, positive, charge)
+            return masses, None, numpy.arange(len(masses) + 1)
+        adduct_positive = numpy.array(
+            [ADDUCTS[a][0] == "positive" for a in self.adducts], dtype=bool
+        )
+        shifts = numpy.array([ADDUCTS[a][1] for a in self.adducts])
+        features = numpy.repeat(numpy.arange(len(store.mz)), len(self.adducts))
+        adducts = numpy.tile(numpy.arange(len(self.adducts)), len(store.mz))
+        keep = adduct_positive[adducts] == positive[features]
+        features = features[keep]
+        adducts = adducts[keep]
+        # same as neutralize(), with the mass of each adduct instead of a proton
+        charge = charge[features]
+        masses = store.mz[features] / charge - shifts[adducts] * charge
+        starts = numpy.searchsorted(features, numpy.arange(len(store.mz) + 1))
+        return masses, adducts, starts
+
+    def matchFeatures(self, masses, adducts, starts):
+        """Find known masses within the mass error of features' masses.
+
+        Matches all masses in one pass, see match(). Returns bounds, matches,
+        deltas, and labels arrays. The matches of feature i, under all of its
+        adducts, are matches[bounds[i]:bounds[i + 1]]. Labels are the adduct
+        index of each match, or None without adducts.
+
+        Arguments:
+            masses (array): neutral masses, see adductMasses()
+            adducts (array): adduct index of each mass, or None
+            starts (array): start of each feature's masses, plus the end
+        """
+        bounds, matches, deltas = self.match(masses)
+        labels = None
+        if adducts is not None:
+            labels = numpy.repeat(adducts, numpy.diff(bounds))
+        return bounds[starts], matches, deltas, labels
+
+    def selectMatches(self, bounds, matches, deltas, labels=None, subset=None):
+        """Select and order the matches of features which are predicted.
+
+        Vectorized form of the filtering and sorting of predictMatches(). Matches
+        of features with multiple matches are dropped unless the alternate
+        attribute is set. Selected matches are ordered by feature, then by
+        absolute delta, with ties in the order of matches.
+
+        Returns owners, matches, deltas, and labels arrays of selected matches,
+        where owners are the index of each match's feature. Labels are None if
+        labels is None.
+
+        Arguments:
+            bounds (array): start of each feature's matches, plus the end, see
+                            matchFeatures()
+            matches (array): matching known mass indexes
+            deltas (array): difference between the mass and each match
+            labels (array): adduct index of each match, or None
+            subset (array): boolean mask of features to predict, defaults to all
+        """
+        counts = numpy.diff(bounds)
+        # remove features if multiple predictions are made and alternate not set
+        selected = counts > 0 if self.alternate else counts == 1
+        if subset is not None:
+            selected &= subset
+        owners = numpy.repeat(numpy.arange(len(counts)), counts)
+        keep = selected[owners]
+        owners = owners[keep]
+        deltas = deltas[keep]
+        # sort alternate matches by lowest absolute delta, lexsort is stable
+        order = numpy.lexsort((numpy.abs(deltas), owners))
+        if labels is not None:
+            labels = labels[keep][order]
+        return owners[order], matches[keep][order], deltas[order], labels
+
+    def poolSelect(self, masses, adducts, starts, subset):
+        """Search and select matches of features in worker processes.
+
+        Features are split into contiguous chunks, each searched by a worker, see
+        predictWorker(). Returns the same arrays as predictWorker() for all
+        features.
+
+        Arguments:
+            masses (array): neutral masses, see adductMasses()
+            adducts (array): adduct index of each mass, or None
+            starts (array): start of each feature's masses, plus the end
+            subset (array): boolean mask of features to predict
+        """
+        features = len(starts) - 1
+        edges = numpy.linspace(
+            0, features, min(self.workers * 4, features // WORKER_CHUNK_SIZE) + 1
+        ).astype(numpy.intp)
+        tasks = []
+        for first, last in zip(edges[:-1].tolist(), edges[1:].tolist()):
+            tasks.append(
+                (
+                    masses[starts[first] : starts[last]],
+                    None if adducts is None else adducts[starts[first] : starts[last]],
+                    starts[first : last + 1] - starts[first],
+                    subset[first:last],
+                )
+            )
+        results = list(self.pool().map(predictWorker, *zip(*tasks)))
+        counts = numpy.concatenate([r[0] for r in results])
+        owners = numpy.concatenate(
+            [r[1] + first for r, first in zip(results, edges[:-1].tolist())]
+        )
+        matches = numpy.concatenate([r[2] for r in results])
+        deltas = numpy.concatenate([r[3] for r in results])
+        labels = None
+        if adducts is not None:
+            labels = numpy.concatenate([r[4] for r in results])
+        return counts, owners, matches, deltas, labels
+
+    def predictStore(self, store, subset=None):
+        """Make predictions for features of a FeatureStore.
+
+        Predictions are added to the store's prediction lists. Returns a boolean
+        array of features with predictions, see FeatureStore.filter(). Features
+        which are not predicted are counted in the unmatched and ambiguous
+        attributes.
+
+        Matches are searched and selected as arrays, see selectMatches(), then
+        Prediction objects are made for the selected matches. If the workers
+        attribute is above 1 and there are enough features, matches are searched
+        and selected by worker processes, see poolSelect(), and Prediction objects
+        are still made by this process.
+        Predictions are the same either way.
+
+        Arguments:
+            store (FeatureStore): features to make predictions for
+            subset (array): boolean mask of features to predict, defaults to all
+        """
+        masses, adducts, starts = self.adductMasses(store)
+        features = len(store.feature_names)
+        if subset is None:
+            subset = numpy.ones(features, dtype=bool)
+        else:
+            subset = numpy.asarray(subset, dtype=bool)
+        if self.workers > 1 and features >= 2 * WORKER_CHUNK_SIZE:
+            counts, owners, matches, deltas, labels = self.poolSelect(
+                masses, adducts, starts, subset
+            )
+        else:
+            bounds, matches, deltas, labels = self.matchFeatures(
+                masses, adducts, starts
+            )
+            counts = numpy.diff(bounds)
+            owners, matches, deltas, labels = self.selectMatches(
+                bounds, matches, deltas, labels, subset
+            )
+        predicted = numpy.zeros(features, dtype=bool)
+        predicted[owners] = True
+        candidates = int(numpy.count_nonzero(subset & (counts > 0)))
+        self.unmatched += int(numpy.count_nonzero(subset)) - candidates
+        self.ambiguous += candidates - int(numpy.count_nonzero(predicted))
+        database = self.load()
+        if labels is None:
+            labels = itertools.repeat(None)
+        else:
+            labels = [self.adducts[a] for a in labels.tolist()]
+        for i, m, known_mass, delta, (hc, oc, nc), adduct in zip(
+            owners.tolist(),
+            matches.tolist(),
+            database.mass[matches].tolist(),
+            deltas.tolist(),
+            database.ratios[matches].tolist(),
+            labels,
+        ):
+            store.predictions[i].append(
+                Prediction(
+                    known_mass,
+                    database.formula[m],
+                    delta,
+                    database.elementCount(m),
+                    hc,
+                    oc,
+                    nc,
+                    adduct,
+                )
+            )
+        return predicted
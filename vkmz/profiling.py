@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+"""Profiling of a vkmz run
+
+A Profile records the wall time, CPU time, and peak memory of each stage of a
+run, and counters such as the number of rows read and features dropped. With
+--profile, vkmz.pipeline writes them to a JSON file next to the other output.
+"""
+
+import collections
+import contextlib
+import cProfile
+import json
+import os
+import sys
+import time
+from vkmz.compression import outputPath
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+# output files of a run, by name, as suffixes of the output path
+OUTPUT_SUFFIXES = {
+    "tabular": ".tabular",
+    "json": ".json",
+    "density": "_density.json",
+    "html": ".html",
+    "sql": ".db",
+    "parquet": ".parquet",
+    "metadata": "_metadata.tabular",
+}
+
+
+def peakRss():
+    """Return the peak resident set size of this process in bytes, or None."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class Profile(object):
+    """Times, memory, and counters of the stages of a run.
+
+    Attributes:
+        stages (dict): name of stage to dictionary of calls, wall_seconds,
+                       cpu_seconds, and peak_rss_bytes, the peak resident set
+                       size of the process when the stage last ended
+        counters (Counter): name to count, see vkmz.read and
+                            vkmz.pipeline.run()
+        cprofile (str): path prefix of a cProfile dump of each stage, or None
+        profilers (dict): name of stage to cProfile.Profile
+    """
+
+    def __init__(self, cprofile=None):
+        self.stages = {}
+        self.counters = collections.Counter()
+        self.cprofile = cprofile
+        self.profilers = {}
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Measure a stage of a run.
+
+        Stages entered more than once, such as the stages of each chunk when
+        streaming, add up.
+
+        Arguments:
+            name (str): name of stage
+        """
+        profiler = None
+        if self.cprofile:
+            profiler = self.profilers.setdefault(name, cProfile.Profile())
+            profiler.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - wall
+            cpu = time.process_time() - cpu
+            if profiler is not None:
+                profiler.disable()
+            stage = self.stages.setdefault(
+                name, {"calls": 0, "wall_seconds": 0.0, "cpu_seconds": 0.0}
+            )
+            stage["calls"] += 1
+            stage["wall_seconds"] += wall
+            stage["cpu_seconds"] += cpu
+            stage["peak_rss_bytes"] = peakRss()
+
+    def outputs(self, config):
+        """Return the size in bytes of each output file of a run.
+
+        Sizes of compressed output files are their compressed sizes.
+
+        Arguments:
+            config (Config): settings of run
+        """
+        sizes = {}
+        for name, suffix in OUTPUT_SUFFIXES.items():
+            path = config.output + suffix
+            if not os.path.isfile(path):
+                path = outputPath(path, config.compress)
+            if os.path.isfile(path):
+                sizes[name] = os.path.getsize(path)
+        return sizes
+
+    def write(self, config):
+        """Write profile to a JSON file, and cProfile dumps if set.
+
+        Arguments:
+            config (Config): settings of run
+        """
+        profile = {
+            "stages": self.stages,
+            "counters": dict(self.counters),
+            "output_bytes": self.outputs(config),
+            "peak_rss_bytes": peakRss(),
+        }
+        try:
+            with open(config.output + "_profile.json", "w") as p_file:
+                json.dump(profile, p_file, indent=2)
+            for name, profiler in self.profilers.items():
+                profiler.dump_stats(f"{self.cprofile}_{name}.prof")
+        except IOError as error:
+            print("IOError while writing profile output")
+            raise
@@ -5,8 +5,11 @@ Can either parse a tabular file or W4M's XCMS tabular as input.
 Input MS data can be given in two "modes", (1) tabular or (2) Workflow4Metabolomics'
 XCMS for Galaxy (W4M-XCMS) files.
 
+Input is read into a column-wise FeatureStore. Functions returning Sample and
+Feature objects are kept for code which works with individual objects.
+
 Tabular mode requires a single tabular file as input and  must include the columns
-"sample_name", "polarity", "mz", "rt", and "intensity". Each row represents a 
+"sample_name", "polarity", "mz", "rt", and "intensity". Each row represents a
 feature. Optionally a "charge" column can exist.
 
 W4M-XCMS mode requires the sample metadata, variable metadata, and data matrix
@@ -16,14 +19,43 @@ variable metadata file if it has been annotated with CAMERA.
 If feature charge information is present, features without charge information
 will be removed. If CAMERA annotation is present, only monoisotopic features
 will be kept.
-"""
 
+Readers of FeatureStores count rows read and rows or features dropped by charge
+filtering in an optional collections.Counter, see vkmz.profiling.
+
+Input files may be gzip- or zstd-compressed, see vkmz.compression.
 
+Results of earlier runs can be read back from their SQL output, see sqlStore().
+"""
+
+import ast
+import collections
+import concurrent.futures
 import csv
+import io
+import itertools
+import mmap
+import numpy
+import os
 import re
-from vkmz.arguments import IMPUTE, POLARITY
-from vkmz.objects import Sample, SampleFeatureIntensity, Feature, Prediction
-from vkmz.predict import parseFormula
+import sqlite3
+from vkmz.compression import detectCompression, openInput
+from vkmz.objects import POLARITIES, FeatureStore, Prediction
+from vkmz.predict import parseFormulaCached
+from vkmz.sqlschema import sqlAdducts, sqlTables
+
+# columns of tabular input, in the order of indexTabular()
+TABULAR_COLUMNS = ("sample_name", "polarity", "mz", "rt", "intensity", "charge")
+# tabular columns parsed as numbers
+NUMERIC_COLUMNS = {"mz", "rt", "intensity"}
+# number of rows csvColumns() splits into columns at once
+COLUMN_BLOCK_ROWS = 10000
+# smallest number of bytes parsed by a process, see parallelTabularStore()
+PARALLEL_RANGE_BYTES = 1 << 22
+# data matrix values of missing intensities
+MISSING_INTENSITIES = {"NA", "#DIV/0!", "0"}
+# number of data matrix cells read at once, see dataMatrixStore()
+MATRIX_BLOCK_CELLS = 1000000
 
 
 def polaritySanitizer(polarity):
@@ -46,11 +78,36 @@ def polaritySanitizer(polarity):
     return polarity
 
 
-def formulas(formulas_file):
-    samples = {}
-    features = {}
+def formulas(formulas_file, force_polarity=None, impute=False):
+    """Read an annotated formula file and create objects.
+
+    See formulasStore(). Results in two name-object dictionaries for samples and
+    features.
+
+    Arguments:
+        formulas_file (str): path to input formula file
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+    """
+    return formulasStore(formulas_file, force_polarity, impute).toObjects()
+
+
+def formulasStore(formulas_file, force_polarity=None, impute=False, counters=None):
+    """Read an annotated formula file into a FeatureStore.
+
+    Reads the same columns as tabular mode and a "formula" column. Each row's
+    formula is added to its feature as a Prediction.
+
+    Arguments:
+        formulas_file (str): path to input formula file
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+        counters (Counter): counters of run, counts "rows_read", or None
+    """
+    store = FeatureStore()
+    rows = 0
     try:
-        with open(formulas_file, "r") as f:
+        with openInput(formulas_file, "r") as f:
             tabular_data = csv.reader(f, delimiter="\t")
             header = next(tabular_data)
             (
@@ -60,56 +117,50 @@ def formulas(formulas_file):
                 rt_index,
                 intensity_index,
                 charge_index,
-            ) = indexTabular(header)
+            ) = indexTabular(header, force_polarity)
             formula_index = header.index("formula")
             for row in tabular_data:
+                rows += 1
                 charge = None
                 if charge_index:
                     charge = row[charge_index]
-                    if charge == "" and IMPUTE == False:
+                    if charge == "" and impute == False:
                         keep = False
-                    elif charge == "" and IMPUTE == True:
+                    elif charge == "" and impute == True:
                         charge = None
                     else:  # convert from string
                         charge = int(charge)
                 sample_name = row[sample_name_index]
-                if POLARITY:
-                    polarity = POLARITY
+                if force_polarity:
+                    polarity = force_polarity
                 else:
                     polarity = polaritySanitizer(row[polarity_index])
                 mz = float(row[mz_index])
                 rt = float(row[rt_index])
                 feature_name = f"{polarity}-{rt}-{mz}"
                 intensity = float(row[intensity_index])
-                if sample_name not in samples:
-                    samples[sample_name] = Sample(sample_name)
-                if feature_name not in features:
-                    feature = Feature(
-                        feature_name, sample_name, polarity, mz, rt, charge
-                    )
-                    features[feature_name] = feature
-                else:
-                    feature = features[feature_name]
-                    feature.samples.append(sample_name)
-                sfi = SampleFeatureIntensity(intensity, feature)
+                sample = store.addSample(sample_name)
+                feature = store.addFeature(feature_name, polarity, mz, rt, charge)
                 formula = row[formula_index]
-                element_count, hc, oc, nc = parseFormula(formula)
+                element_count, hc, oc, nc = parseFormulaCached(formula)
                 delta = 0
-                feature.predictions.append(
+                store.predictions[feature].append(
                     Prediction(mz, formula, delta, element_count, hc, oc, nc)
                 )
-                print(feature.predictions)
-                samples[sample_name].sfis.append(sfi)
+                store.addIntensity(sample, feature, intensity)
     except IOError:
         print(f"Error while reading {formulas_file}.")
         raise
-    return samples, features
+    if counters is not None:
+        counters["rows_read"] += rows
+    return store.freeze()
 
 
-def indexTabular(header):
+def indexTabular(header, force_polarity=None):
     try:
         sample_name_index = header.index("sample_name")
-        if not POLARITY:  # --polarity argument is not used
+        polarity_index = None
+        if not force_polarity:  # --polarity argument is not used
             polarity_index = header.index("polarity")
         mz_index = header.index("mz")
         rt_index = header.index("rt")
@@ -118,12 +169,10 @@ def indexTabular(header):
         if charge_index:
             charge_index = header.index("charge")
     except ValueError:
-        print(
-            """An expected column was not found in the tabular file.
+        print("""An expected column was not found in the tabular file.
             The tabular file must contain columns named: "sample_name",
             "polarity", "mz", "rt", and "intensity".'
-            """
-        )
+            """)
         raise
     return (
         sample_name_index,
@@ -135,7 +184,7 @@ def indexTabular(header):
     )
 
 
-def tabular(tabular_file):
+def tabular(tabular_file, force_polarity=None, impute=False):
     """Read a tabular file and create objects.
 
     Reads columns named "sample_name", "polarity", "mz", "rt", and "intensity"
@@ -150,11 +199,31 @@ def tabular(tabular_file):
 
     Arguments:
         tabular_file (str): path to input tabular file
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+    """
+    return tabularStore(tabular_file, force_polarity, impute).toObjects()
+
+
+def tabularRows(tabular_file, force_polarity=None, impute=False, counters=None):
+    """Read a tabular file row by row.
+
+    Yields a (sample name, feature name, polarity, mz, rt, charge, intensity)
+    tuple for each row kept. Rows without charge information are skipped unless
+    charge is imputed.
+
+    Counts "rows_read" and "rows_dropped_charge" in counters once all rows are
+    read.
+
+    Arguments:
+        tabular_file (str): path to input tabular file
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+        counters (Counter): counters of run, or None
     """
-    samples = {}
-    features = {}
+    rows = dropped = 0
     try:
-        with open(tabular_file, "r") as f:
+        with openInput(tabular_file, "r") as f:
             tabular_data = csv.reader(f, delimiter="\t")
             header = next(tabular_data)
             (
@@ -164,49 +233,502 @@ def tabular(tabular_file):
                 rt_index,
                 intensity_index,
                 charge_index,
-            ) = indexTabular(header)
+            ) = indexTabular(header, force_polarity)
             for row in tabular_data:
+                rows += 1
                 # TODO: add charge sanitization function
                 keep = True
                 charge = None
                 if charge_index:
                     charge = row[charge_index]
-                    if charge == "" and IMPUTE == False:
+                    if charge == "" and impute == False:
                         keep = False
-                    elif charge == "" and IMPUTE == True:
+                    elif charge == "" and impute == True:
                         charge = None
                     else:  # convert from string
                         charge = int(charge)
                 if keep:
                     sample_name = row[sample_name_index]
-                    if POLARITY:
-                        polarity = POLARITY
+                    if force_polarity:
+                        polarity = force_polarity
                     else:
                         polarity = polaritySanitizer(row[polarity_index])
                     mz = float(row[mz_index])
                     rt = float(row[rt_index])
                     feature_name = f"{polarity}-{rt}-{mz}"
                     intensity = float(row[intensity_index])
-                    if sample_name not in samples:
-                        samples[sample_name] = Sample(sample_name)
-                    if feature_name not in features:
-                        feature = Feature(
-                            feature_name, sample_name, polarity, mz, rt, charge
-                        )
-                        features[feature_name] = feature
-                    else:
-                        feature = features[feature_name]
-                        feature.samples.append(sample_name)
-                    sfi = SampleFeatureIntensity(intensity, feature)
-                    samples[sample_name].sfis.append(sfi)
+                    yield sample_name, feature_name, polarity, mz, rt, charge, intensity
+                else:
+                    dropped += 1
     except IOError:
         print(f"Error while reading {tabular_file}.")
         raise
-    return samples, features
+    if counters is not None:
+        counters["rows_read"] += rows
+        counters["rows_dropped_charge"] += dropped
 
 
-# TODO: break up function
-def xcmsTabular(sample_file, variable_file, matrix_file):
+def tabularStore(tabular_file, force_polarity=None, impute=False, counters=None):
+    """Read a tabular file into a FeatureStore.
+
+    Column-wise form of tabular(), which avoids creating an object for each row.
+
+    Arguments:
+        tabular_file (str): path to input tabular file
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+        counters (Counter): counters of run, see tabularRows(), or None
+    """
+    store = FeatureStore()
+    for row in tabularRows(tabular_file, force_polarity, impute, counters):
+        sample_name, feature_name, polarity, mz, rt, charge, intensity = row
+        sample = store.addSample(sample_name)
+        feature = store.addFeature(feature_name, polarity, mz, rt, charge)
+        store.addIntensity(sample, feature, intensity)
+    return store.freeze()
+
+
+def columnarTabularStore(
+    tabular_file, force_polarity=None, impute=False, counters=None
+):
+    """Read a tabular file into a FeatureStore column by column.
+
+    Columnar form of tabularStore(), which makes the same FeatureStore. Whole
+    columns are parsed at once, see tabularColumns(), and samples and features
+    are found by grouping columns, see columnsStore().
+
+    If a file cannot be parsed by columns, it is read by tabularStore() instead.
+
+    Arguments:
+        tabular_file (str): path to input tabular file
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+        counters (Counter): counters of run, see tabularRows(), or None
+    """
+    try:
+        columns = tabularColumns(tabular_file, force_polarity)
+    except ColumnParseError:
+        return tabularStore(tabular_file, force_polarity, impute, counters)
+    return columnsStore(columns, force_polarity, impute, counters)
+
+
+class ColumnParseError(ValueError):
+    """A column parser could not parse a tabular file."""
+
+
+def tabularColumns(tabular_file, force_polarity=None, parser=None):
+    """Parse the columns of a tabular file read by vkmz.
+
+    Returns a dictionary of column name to column, see csvColumns().
+
+    Arguments:
+        tabular_file (str): path to input tabular file
+        force_polarity (str): polarity of all features, overrides input polarity
+        parser (function): column parser, see COLUMN_PARSERS, defaults to
+                           defaultColumnParser()
+    """
+    if parser is None:
+        parser = defaultColumnParser()
+    try:
+        with openInput(tabular_file, "rb") as h_file:
+            header = tabularHeaderColumns(h_file.readline(), force_polarity)
+            return parser(h_file, *header)
+    except IOError:
+        print(f"Error while reading {tabular_file}.")
+        raise
+
+
+def tabularHeaderColumns(line, force_polarity=None):
+    """Return the width of a tabular header and the indexes of columns to read.
+
+    Returns the number of columns, and a dictionary of column name to index of
+    the columns read by vkmz, see indexTabular().
+
+    Arguments:
+        line (bytes): header line
+        force_polarity (str): polarity of all features, overrides input polarity
+    """
+    header = next(csv.reader([line.decode().rstrip("\r\n")], delimiter="\t"), [])
+    indexes = indexTabular(header, force_polarity)
+    columns = {}
+    for name, index in zip(TABULAR_COLUMNS, indexes):
+        # a charge column is only read if its index is truthy, see tabularRows()
+        if index is not None and (name != "charge" or index):
+            columns[name] = index
+    return len(header), columns
+
+
+def csvColumns(h_file, width, columns):
+    """Parse columns of tabular rows with the csv module.
+
+    Returns a dictionary of column name to column. Numeric columns ("mz", "rt",
+    and "intensity") are float64 arrays. Text columns are (codes, values) tuples
+    of an int32 array of codes and a list of the distinct values they index.
+
+    Raises ColumnParseError if a row is too short or a numeric value cannot be
+    parsed, see columnarTabularStore().
+
+    Column parsers have the signature of this function. Other parsers are
+    listed in COLUMN_PARSERS.
+
+    Arguments:
+        h_file (file): binary file positioned after the header
+        width (int): number of columns in the header
+        columns (dict): column name to index of columns to parse
+    """
+    rows = csv.reader(io.TextIOWrapper(h_file, encoding="utf-8"), delimiter="\t")
+    # columns are converted a block of rows at a time, as long lists of strings
+    # slow down garbage collection
+    blocks = {name: [] for name in columns}
+    codes = {name: {} for name in columns if name not in NUMERIC_COLUMNS}
+    try:
+        while True:
+            block = list(itertools.islice(rows, COLUMN_BLOCK_ROWS))
+            if not block:
+                break
+            for name, index in columns.items():
+                values = [row[index] for row in block]
+                if name in NUMERIC_COLUMNS:
+                    values = numpy.array(values, dtype=object).astype(numpy.float64)
+                else:
+                    ids = codes[name]
+                    values = numpy.fromiter(
+                        (ids.setdefault(v, len(ids)) for v in values),
+                        dtype=numpy.int32,
+                        count=len(values),
+                    )
+                blocks[name].append(values)
+    except (IndexError, ValueError) as error:
+        # rows may be dropped later for lacking charge, so leave errors to the
+        # row reader, which only converts rows it keeps
+        raise ColumnParseError(str(error)) from error
+    parsed = {}
+    for name, values in blocks.items():
+        dtype = numpy.float64 if name in NUMERIC_COLUMNS else numpy.int32
+        values = numpy.concatenate(values) if values else numpy.zeros(0, dtype)
+        if name in NUMERIC_COLUMNS:
+            parsed[name] = values
+        else:
+            parsed[name] = (values, list(codes[name]))
+    return parsed
+
+
+def arrowColumns(h_file, width, columns):
+    """Parse columns of tabular rows with pyarrow.
+
+    Columns are parsed in parallel C++ threads, and text columns are dictionary
+    encoded while parsing. Raises ColumnParseError if pyarrow cannot parse the
+    rows, for instance if rows have a different number of columns than the
+    header or are blank, as csvColumns() does. See csvColumns().
+
+    Arguments:
+        h_file (file): binary file positioned after the header
+        width (int): number of columns in the header
+        columns (dict): column name to index of columns to parse
+    """
+    import pyarrow
+    import pyarrow.csv
+
+    text = pyarrow.dictionary(pyarrow.int32(), pyarrow.string())
+    types = {
+        str(index): pyarrow.float64() if name in NUMERIC_COLUMNS else text
+        for name, index in columns.items()
+    }
+    try:
+        table = pyarrow.csv.read_csv(
+            h_file,
+            read_options=pyarrow.csv.ReadOptions(
+                column_names=[str(i) for i in range(width)]
+            ),
+            # blank rows are too short, as they are for csvColumns()
+            parse_options=pyarrow.csv.ParseOptions(
+                delimiter="\t", ignore_empty_lines=False
+            ),
+            convert_options=pyarrow.csv.ConvertOptions(
+                column_types=types,
+                include_columns=list(types),
+                null_values=[],
+                strings_can_be_null=False,
+                quoted_strings_can_be_null=False,
+            ),
+        )
+    except pyarrow.ArrowInvalid as error:
+        raise ColumnParseError(str(error)) from error
+    table = table.unify_dictionaries()
+    parsed = {}
+    for name, index in columns.items():
+        column = table.column(str(index))
+        if name in NUMERIC_COLUMNS:
+            parsed[name] = column.to_numpy()
+            continue
+        codes = numpy.zeros(0, dtype=numpy.int32)
+        values = []
+        if column.num_chunks:
+            codes = numpy.concatenate([c.indices.to_numpy() for c in column.chunks])
+            values = column.chunk(0).dictionary.to_pylist()
+        parsed[name] = (codes.astype(numpy.int32, copy=False), values)
+    return parsed
+
+
+def defaultColumnParser():
+    """Return arrowColumns() if pyarrow is installed, otherwise csvColumns()."""
+    try:
+        import pyarrow.csv
+    except ImportError:
+        return csvColumns
+    return arrowColumns
+
+
+def columnsStore(columns, force_polarity=None, impute=False, counters=None):
+    """Group parsed tabular columns into a FeatureStore.
+
+    Makes the same FeatureStore as reading the rows with tabularStore(). Polarity
+    and charge values are sanitized once per distinct value. Features are rows
+    with the same polarity, rt, and mz, and are found by sorting rows by them
+    instead of building a feature name for every row.
+
+    Arguments:
+        columns (dict): column name to column, see csvColumns()
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+        counters (Counter): counters of run, see tabularRows(), or None
+    """
+    store = FeatureStore()
+    mz = columns["mz"]
+    rt = columns["rt"]
+    intensity = columns["intensity"]
+    samples, sample_names = columns["sample_name"]
+    rows = len(mz)
+    keep = None
+    charge = numpy.full(rows, numpy.nan)
+    if "charge" in columns:
+        codes, values = columns["charge"]
+        # rows without charge information are removed unless charge is imputed
+        keep = numpy.array([v != "" or impute for v in values], dtype=bool)[codes]
+        values = [numpy.nan if v == "" else int(v) for v in values]
+        charge = numpy.array(values, dtype=numpy.float64)[codes]
+    if force_polarity:
+        polarity = numpy.full(rows, POLARITIES.index(force_polarity), numpy.int8)
+    else:
+        codes, values = columns["polarity"]
+        sanitized = numpy.zeros(len(values), dtype=numpy.int8)
+        used = codes if keep is None else codes[keep]
+        for code in numpy.unique(used).tolist():
+            sanitized[code] = POLARITIES.index(polaritySanitizer(values[code]))
+        polarity = sanitized[codes]
+    dropped = 0
+    if keep is not None and not keep.all():
+        dropped = rows - int(numpy.count_nonzero(keep))
+        mz, rt, intensity = mz[keep], rt[keep], intensity[keep]
+        samples, charge, polarity = samples[keep], charge[keep], polarity[keep]
+    if counters is not None:
+        counters["rows_read"] += rows
+        counters["rows_dropped_charge"] += dropped
+    # samples in order of their first row
+    codes, firsts = numpy.unique(samples, return_index=True)
+    sample_map = numpy.zeros(len(sample_names), dtype=numpy.int32)
+    for code in codes[numpy.argsort(firsts)].tolist():
+        sample_map[code] = store.addSample(sample_names[code])
+    # features are rows with the same polarity, rt, and mz, compared by their
+    # bits like feature names compare their text, and are in order of their
+    # first row
+    rt_bits = numpy.where(numpy.isnan(rt), numpy.nan, rt).view(numpy.int64)
+    mz_bits = numpy.where(numpy.isnan(mz), numpy.nan, mz).view(numpy.int64)
+    order = numpy.lexsort((mz_bits, rt_bits, polarity))
+    new = numpy.ones(len(order), dtype=bool)
+    new[1:] = (
+        (numpy.diff(polarity[order]) != 0)
+        | (numpy.diff(rt_bits[order]) != 0)
+        | (numpy.diff(mz_bits[order]) != 0)
+    )
+    group = numpy.cumsum(new) - 1
+    group_rows = order[new]
+    ranks = numpy.empty(len(group_rows), dtype=numpy.int32)
+    ranks[numpy.argsort(group_rows)] = numpy.arange(len(group_rows))
+    feature = numpy.empty(len(order), dtype=numpy.int32)
+    feature[order] = ranks[group]
+    feature_rows = numpy.sort(group_rows)
+    store.polarity = polarity[feature_rows]
+    store.mz = mz[feature_rows]
+    store.rt = rt[feature_rows]
+    store.charge = charge[feature_rows]
+    store.feature_names = [
+        f"{POLARITIES[p]}-{r}-{m}"
+        for p, r, m in zip(
+            store.polarity.tolist(), store.rt.tolist(), store.mz.tolist()
+        )
+    ]
+    store.feature_ids = {name: i for i, name in enumerate(store.feature_names)}
+    store.predictions = [[] for _ in store.feature_names]
+    store.sfi_sample = sample_map[samples]
+    store.sfi_feature = feature
+    store.sfi_intensity = intensity
+    return store.freeze()
+
+
+def parallelTabularStore(
+    tabular_file, force_polarity=None, impute=False, counters=None, workers=None
+):
+    """Read a tabular file into a FeatureStore with several processes.
+
+    Parallel form of columnarTabularStore(), which makes the same FeatureStore.
+    The file is memory-mapped and split at newlines into one byte range per
+    worker, see tabularRanges(). Each process parses the columns of a range,
+    see parseRange(). The columns of all ranges are joined in file order, see
+    concatenateColumns(), and grouped by feature and sample by columnsStore().
+
+    Files which are compressed, too small to split, or hold quoted values, which
+    may span lines, are read by columnarTabularStore() instead.
+
+    Arguments:
+        tabular_file (str): path to input tabular file
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+        counters (Counter): counters of run, see tabularRows(), or None
+        workers (int): number of processes, defaults to the number of CPUs
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    ranges = []
+    try:
+        if workers > 1 and detectCompression(tabular_file) is None:
+            with open(tabular_file, "rb") as h_file:
+                ranges = tabularRanges(h_file, workers)
+    except IOError:
+        print(f"Error while reading {tabular_file}.")
+        raise
+    if len(ranges) < 2:
+        return columnarTabularStore(tabular_file, force_polarity, impute, counters)
+    parser = defaultColumnParser()
+    with concurrent.futures.ProcessPoolExecutor(max_workers=len(ranges)) as pool:
+        futures = [
+            pool.submit(parseRange, tabular_file, start, end, force_polarity, parser)
+            for start, end in ranges
+        ]
+        try:
+            parts = [future.result() for future in futures]
+        except ColumnParseError:
+            return tabularStore(tabular_file, force_polarity, impute, counters)
+    return columnsStore(concatenateColumns(parts), force_polarity, impute, counters)
+
+
+def tabularRanges(h_file, parts):
+    """Split the rows of a tabular file into byte ranges at newlines.
+
+    Returns a list of (start, end) byte offsets of up to parts ranges of about
+    equal size, and of about PARALLEL_RANGE_BYTES or more. The header is not
+    part of any range. Returns an empty list if rows could hold quoted values.
+
+    Arguments:
+        h_file (file): binary tabular file
+        parts (int): largest number of ranges
+    """
+    if os.fstat(h_file.fileno()).st_size == 0:
+        return []
+    with mmap.mmap(h_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        size = len(buffer)
+        # quoted values may hold newlines, which would split rows
+        if buffer.find(b'"') != -1:
+            return []
+        first = buffer.find(b"\n") + 1
+        if first == 0:
+            return []
+        parts = max(min(parts, (size - first) // PARALLEL_RANGE_BYTES), 1)
+        bounds = [first]
+        for part in range(1, parts):
+            end = buffer.find(b"\n", first + (size - first) * part // parts) + 1
+            if end == 0:
+                break
+            if end > bounds[-1]:
+                bounds.append(end)
+        if size > bounds[-1]:
+            bounds.append(size)
+    return list(zip(bounds, bounds[1:]))
+
+
+def parseRange(tabular_file, start, end, force_polarity=None, parser=None):
+    """Parse the columns of a byte range of a tabular file's rows.
+
+    Runs in a worker process of parallelTabularStore(). Returns a dictionary of
+    column name to column, see csvColumns().
+
+    Arguments:
+        tabular_file (str): path to input tabular file
+        start (int): byte offset of the range's first row
+        end (int): byte offset after the range's last row
+        force_polarity (str): polarity of all features, overrides input polarity
+        parser (function): column parser, see COLUMN_PARSERS, defaults to
+                           defaultColumnParser()
+    """
+    if parser is None:
+        parser = defaultColumnParser()
+    with open(tabular_file, "rb") as h_file:
+        with mmap.mmap(h_file.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+            line = buffer[: buffer.find(b"\n") + 1]
+            header = tabularHeaderColumns(line, force_polarity)
+            rows = io.BytesIO(buffer[start:end])
+    return parser(rows, *header)
+
+
+def concatenateColumns(parts):
+    """Join columns parsed from consecutive ranges of a file.
+
+    Codes of text columns are renumbered into one list of distinct values.
+
+    Arguments:
+        parts (list): dictionaries of column name to column, see csvColumns()
+    """
+    columns = {}
+    for name in parts[0]:
+        if name in NUMERIC_COLUMNS:
+            columns[name] = numpy.concatenate([part[name] for part in parts])
+            continue
+        ids = {}
+        codes = []
+        for part_codes, values in (part[name] for part in parts):
+            renumber = numpy.array(
+                [ids.setdefault(v, len(ids)) for v in values], dtype=numpy.int32
+            )
+            codes.append(renumber[part_codes])
+        columns[name] = (numpy.concatenate(codes), list(ids))
+    return columns
+
+
+def tabularChunks(
+    tabular_file, force_polarity=None, impute=False, chunk_size=100000, counters=None
+):
+    """Read a tabular file in chunks of rows.
+
+    Yields a FeatureStore for every chunk_size rows. Each FeatureStore only holds
+    the samples and features of its own rows, so memory use is bounded by
+    chunk_size.
+
+    Arguments:
+        tabular_file (str): path to input tabular file
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+        chunk_size (int): number of rows per chunk
+        counters (Counter): counters of run, see tabularRows(), or None
+    """
+    store = FeatureStore()
+    rows = 0
+    for row in tabularRows(tabular_file, force_polarity, impute, counters):
+        sample_name, feature_name, polarity, mz, rt, charge, intensity = row
+        sample = store.addSample(sample_name)
+        feature = store.addFeature(feature_name, polarity, mz, rt, charge)
+        store.addIntensity(sample, feature, intensity)
+        rows += 1
+        if rows == chunk_size:
+            yield store.freeze()
+            store = FeatureStore()
+            rows = 0
+    if rows:
+        yield store.freeze()
+
+
+def xcmsTabular(
+    sample_file, variable_file, matrix_file, force_polarity=None, impute=False
+):
     """Read W4M's XCMS tabular files and return a list of features.
 
     Reads sample metadata to create a dictionary of sample ids keys with,
@@ -222,19 +744,47 @@ def xcmsTabular(sample_file, variable_file, matrix_file):
         sample_file (str): path to input sample metadata file
         variable_file (str): path to input variable metadata file
         matrix_file (str): path to input data matrix file
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+    """
+    return xcmsTabularStore(
+        sample_file, variable_file, matrix_file, force_polarity, impute
+    ).toObjects()
+
+
+# TODO: break up function
+def xcmsTabularStore(
+    sample_file,
+    variable_file,
+    matrix_file,
+    force_polarity=None,
+    impute=False,
+    counters=None,
+):
+    """Read W4M's XCMS tabular files into a FeatureStore.
+
+    Column-wise form of xcmsTabular(), which avoids creating an object for each
+    intensity. The data matrix is read by dataMatrixStore(), which also counts
+    rows read and features dropped in counters.
+
+    Arguments:
+        sample_file (str): path to input sample metadata file
+        variable_file (str): path to input variable metadata file
+        matrix_file (str): path to input data matrix file
+        force_polarity (str): polarity of all features, overrides input polarity
+        impute (bool): impute a charge of "1" for missing charge information
+        counters (Counter): counters of run, or None
     """
-    samples = {}
-    features = {}
     # extract sample polarities
     try:
         polarity = {}
-        with open(sample_file, "r") as f:
+        with openInput(sample_file, "r") as f:
             sample_data = csv.reader(f, delimiter="\t")
             next(sample_data)  # skip header
             for row in sample_data:
                 sample = row[0]
-                if POLARITY:
-                    polarity[sample] = POLARITY
+                if force_polarity:
+                    polarity[sample] = force_polarity
                 else:
                     polarity[sample] = polaritySanitizer(row[2])
     except IOError:
@@ -244,7 +794,7 @@ def xcmsTabular(sample_file, variable_file, matrix_file):
     try:
         mz_rt = {}
         charges = {}
-        with open(variable_file, "r") as f:
+        with openInput(variable_file, "r") as f:
             variable_data = csv.reader(f, delimiter="\t")
             header = next(variable_data)
             mz_index = header.index("mz")
@@ -276,56 +826,225 @@ def xcmsTabular(sample_file, variable_file, matrix_file):
                 #       need multi-charge, + &, - test data
                 # parse monoisotopic charge
                 charges[c] = 1
-            elif IMPUTE:
+            elif impute:
                 charges[c] = 1
             else:
                 charges[c] = "remove"
-    # extract intensity and build Feature objects
+    return dataMatrixStore(matrix_file, polarity, mz_rt, charges, counters)
+
+
+def dataMatrixStore(matrix_file, polarity, mz_rt, charges, counters=None):
+    """Read a W4M-XCMS data matrix into a FeatureStore.
+
+    The matrix is read in blocks of rows. The cells of each block are masked
+    as missing ("NA", "#DIV/0!", or "0") and converted to intensities at once,
+    and polarity and charge are looked up once per feature instead of once per
+    cell.
+
+    Samples, features, and intensities are added in the order they are first
+    observed, reading the matrix row by row.
+
+    Counts data matrix rows in counters as "rows_read", and features removed by
+    CAMERA or missing charge information as "features_dropped_charge".
+
+    Arguments:
+        matrix_file (str): path to input data matrix file
+        polarity (dict): sample name to polarity
+        mz_rt (dict): feature name to (mz, rt) tuple
+        charges (dict): feature name to charge, None, or "remove"
+        counters (Counter): counters of run, or None
+    """
+    store = FeatureStore()
+    rows = dropped = 0
+    # feature name, and (row, column, intensity) of intensities, of each block
+    names = []
+    cell_rows = []
+    cell_columns = []
+    cell_values = []
     try:
-        with open(matrix_file, "r") as f:
+        with openInput(matrix_file, "r") as f:
             matrix_data = csv.reader(f, delimiter="\t")
             header = next(matrix_data)  # list of samples
             # remove empty columns
             # required for W4M-XCMS 1.7
             # TODO: check W4M-XCMS 3.0
             header = [x for x in header if x != ""]
-            for row in matrix_data:
-                # remove empty columns
-                row = [x for x in row if x != ""]
-                feature_name = row[0]
-                i = 1
-                while i < len(row):
-                    feature_charge = charges[feature_name]
-                    # if CAMERA data exists, remove non-monoisotopic features
-                    if feature_charge == "remove":
-                        break
-                    intensity = row[i]  # keep as string type for test
-                    if intensity not in {"NA", "#DIV/0!", "0"}:
-                        sample_name = header[i]
-                        if sample_name not in samples:
-                            samples[sample_name] = Sample(sample_name)
-                        if feature_name not in features:
-                            feature_polarity = polarity[sample_name]
-                            feature_mz = mz_rt[feature_name][0]
-                            feature_rt = mz_rt[feature_name][1]
-                            intensity = float(intensity)
-                            feature = Feature(
-                                feature_name,
-                                sample_name,
-                                feature_polarity,
-                                feature_mz,
-                                feature_rt,
-                                feature_charge,
+            # rows have a feature name column even if the header is empty, so
+            # intensities of an empty header raise IndexError as header[i] would
+            width = max(len(header), 1)
+            block_rows = max(MATRIX_BLOCK_CELLS // width, 1)
+            while True:
+                block = list(itertools.islice(matrix_data, block_rows))
+                if not block:
+                    break
+                rows += len(block)
+                kept = []
+                for row in block:
+                    # remove empty columns
+                    if "" in row:
+                        row = [x for x in row if x != ""]
+                    if len(row) < width:
+                        row = row + ["NA"] * (width - len(row))
+                    elif len(row) > width:
+                        extra = not MISSING_INTENSITIES.issuperset(row[width:])
+                        if extra and charges[row[0]] != "remove":
+                            raise IndexError(
+                                f"Feature {row[0]} has more intensities than samples"
                             )
-                            features[feature_name] = feature
-                        else:
-                            feature = features[feature_name]
-                            feature.samples.append(sample_name)
-                        samples[sample_name].sfis.append(
-                            SampleFeatureIntensity(intensity, feature)
-                        )
-                    i += 1
+                        row = row[:width]
+                    kept.append(row)
+                cells = numpy.array(kept, dtype=object)[:, 1:]
+                present = numpy.ones(cells.shape, dtype=bool)
+                for missing in MISSING_INTENSITIES:
+                    present &= cells != missing
+                # if CAMERA data exists, remove non-monoisotopic features, looking
+                # up the charges of features with intensities only
+                for i in numpy.flatnonzero(present.any(axis=1)).tolist():
+                    if charges[kept[i][0]] == "remove":
+                        dropped += 1
+                        present[i] = False
+                block_row, block_column = numpy.nonzero(present)
+                cell_rows.append(block_row + len(names))
+                cell_columns.append(block_column + 1)  # header index
+                cell_values.append(cells[block_row, block_column].astype(numpy.float64))
+                names.extend(row[0] for row in kept)
     except IOError:
         print(f"Error while reading the XCMS tabular file {matrix_file}.")
         raise
-    return samples, features
+    if counters is not None:
+        counters["rows_read"] += rows
+        counters["features_dropped_charge"] += dropped
+    if not cell_rows:
+        return store.freeze()
+    cell_row = numpy.concatenate(cell_rows)
+    cell_column = numpy.concatenate(cell_columns)
+    for column in numpy.unique(cell_column).tolist():
+        if header[column] not in polarity:
+            raise KeyError(header[column])
+    # samples in order of their first intensity
+    columns, firsts = numpy.unique(cell_column, return_index=True)
+    column_sample = numpy.zeros(width, dtype=numpy.int32)
+    column_polarity = numpy.zeros(width, dtype=numpy.int8)
+    for column in columns[numpy.argsort(firsts)].tolist():
+        column_sample[column] = store.addSample(header[column])
+        column_polarity[column] = POLARITIES.index(polarity[header[column]])
+    # features in order of their first intensity, with the polarity of the first
+    # sample observing them
+    row_feature = numpy.zeros(len(names), dtype=numpy.int32)
+    feature_rows, firsts = numpy.unique(cell_row, return_index=True)
+    feature_firsts = []
+    for row, first in zip(feature_rows.tolist(), firsts.tolist()):
+        name = names[row]
+        index = store.feature_ids.get(name)
+        if index is None:
+            index = len(store.feature_names)
+            store.feature_ids[name] = index
+            store.feature_names.append(name)
+            feature_firsts.append(first)
+        row_feature[row] = index
+    store.polarity = column_polarity[cell_column[feature_firsts]]
+    store.mz = numpy.array(
+        [mz_rt[n][0] for n in store.feature_names], dtype=numpy.float64
+    )
+    store.rt = numpy.array(
+        [mz_rt[n][1] for n in store.feature_names], dtype=numpy.float64
+    )
+    store.charge = numpy.array(
+        [charges[n] for n in store.feature_names], dtype=numpy.float64
+    )
+    store.predictions = [[] for _ in store.feature_names]
+    store.sfi_sample = column_sample[cell_column]
+    store.sfi_feature = row_feature[cell_row]
+    store.sfi_intensity = numpy.concatenate(cell_values)
+    return store.freeze()
+
+
+def sqlStore(database_file, counters=None):
+    """Read the results in a vkmz SQL database into a FeatureStore.
+
+    Reads databases written with and without --normalized-sql. Samples,
+    features, intensities, and each feature's predictions are in the order they
+    were written, so output written from the store is that of the runs which
+    wrote the database.
+
+    Counts intensities read in counters as "rows_read".
+
+    Arguments:
+        database_file (str): path to SQL database
+        counters (Counter): counters of run, or None
+    """
+    store = FeatureStore()
+    try:
+        # sqlite3 would create a missing database
+        with open(database_file, "rb"):
+            pass
+        con = sqlite3.connect(database_file)
+    except IOError:
+        print(f"Error while reading {database_file}.")
+        raise
+    c = con.cursor()
+    sample_index = {}
+    for i, name in c.execute("SELECT Id, Name FROM Sample ORDER BY Id"):
+        sample_index[i] = store.addSample(name)
+    feature_index = {}
+    for i, name, polarity, mz, rt, charge in c.execute(
+        "SELECT Id, Name, Polarity, Mz, Rt, Charge FROM Feature ORDER BY Id"
+    ):
+        feature_index[i] = store.addFeature(name, polarity, mz, rt, charge)
+    adduct = "Adduct" if sqlAdducts(database_file) is not None else "NULL"
+    element_counts = None
+    if sqlTables(con) >= {"Formula", "ElementCount"}:  # --normalized-sql
+        element_counts = collections.defaultdict(dict)
+        for formula_id, element, count in c.execute(
+            "SELECT FormulaId, Element, Count FROM ElementCount ORDER BY rowid"
+        ):
+            element_counts[formula_id][element] = count
+        rows = c.execute(f"""
+            SELECT FeatureId, Formula, Mass, Delta, FormulaId, Hc, Oc, Nc, {adduct}
+            FROM Prediction JOIN Formula ON Formula.Id = FormulaId
+            ORDER BY Prediction.Id
+            """).fetchall()
+    else:
+        rows = c.execute(f"""
+            SELECT FeatureId, Formula, Mass, Delta, ElementCount, Hc, Oc, Nc, {adduct}
+            FROM Prediction ORDER BY Id
+            """).fetchall()
+        # masses are stored as text and element counts as the text of a dict
+        element_counts = {}
+        for counts in set(row[4] for row in rows):
+            element_counts[counts] = ast.literal_eval(counts)
+    for feature_id, formula, mass, delta, counts, hc, oc, nc, label in rows:
+        store.predictions[feature_index[feature_id]].append(
+            Prediction(
+                float(mass), formula, delta, element_counts[counts], hc, oc, nc, label
+            )
+        )
+    intensities = c.execute(
+        "SELECT SampleId, FeatureId, Intensity FROM SampleFeatureIntensity "
+        "ORDER BY Id"
+    ).fetchall()
+    con.close()
+    store.freeze()
+    if intensities:
+        sample_id, feature_id, intensity = zip(*intensities)
+        store.sfi_sample = numpy.array(
+            [sample_index[i] for i in sample_id], dtype=numpy.int32
+        )
+        store.sfi_feature = numpy.array(
+            [feature_index[i] for i in feature_id], dtype=numpy.int32
+        )
+        store.sfi_intensity = numpy.array(intensity, dtype=numpy.float64)
+    if counters is not None:
+        counters["rows_read"] += len(intensities)
+    return store
+
+
+# column parsers of columnarTabularStore(), see csvColumns()
+COLUMN_PARSERS = {"arrow": arrowColumns, "csv": csvColumns}
+
+# tabular readers by name, all make the same FeatureStore
+TABULAR_READERS = {
+    "columnar": columnarTabularStore,
+    "parallel": parallelTabularStore,
+    "csv": tabularStore,
+}
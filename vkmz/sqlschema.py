@@ -0,0 +1,47 @@
+#!/usr/bin/env python
+"""Schema of vkmz SQL databases
+
+Helpers shared by the SQL writers, see vkmz.write.SqlWriter, and the SQL
+reader, see vkmz.read.sqlStore(), to find which schema and adducts a database
+was written with.
+"""
+
+import sqlite3
+
+
+def sqlAdducts(database_file):
+    """Return the adducts of predictions in a vkmz SQL database.
+
+    Returns a sorted list of the adducts searched, or None if the database was
+    written without --adducts. Databases without an Adduct table return the
+    adducts predictions are labeled with.
+
+    Arguments:
+        database_file (str): path to SQL database
+    """
+    con = sqlite3.connect(database_file)
+    try:
+        columns = [row[1] for row in con.execute("PRAGMA table_info(Prediction)")]
+        if "Adduct" not in columns:
+            return None
+        if "Adduct" in sqlTables(con):
+            return sorted(a for (a,) in con.execute("SELECT DISTINCT Name FROM Adduct"))
+        return sorted(
+            a for (a,) in con.execute("SELECT DISTINCT Adduct FROM Prediction") if a
+        )
+    finally:
+        con.close()
+
+
+def sqlTables(con):
+    """Return the names of tables in a SQL database.
+
+    Arguments:
+        con (Connection): database connection
+    """
+    return {
+        name
+        for (name,) in con.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table'"
+        )
+    }
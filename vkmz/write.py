@@ -1,346 +1,1134 @@
 #!/usr/bin/env python
 """output modes
 
-vkmz always outputs tabular and html files. Optionally, vkmz can output JSON
-and SQL as well.
+vkmz always outputs tabular and html files. Optionally, vkmz can output JSON,
+SQL, and Parquet as well.
+
+Tabular and JSON output is compressed with --compress, see vkmz.compression.
 """
 
+import base64
 import csv
+import functools
+import itertools
 import json
+import numpy
 import os
 import re
 import sqlite3
-from vkmz.arguments import (
-    ALTERNATE,
-    IMPUTE,
-    DATABASE,
-    JSON,
-    MASS_ERROR,
-    METADATA,
-    MODE,
-    NEUTRAL,
-    OUTPUT,
-    POLARITY,
-    PREFIX,
-    SQL,
-)
-
-
-def tabular(samples):
+from vkmz.compression import openOutput, outputPath
+from vkmz.objects import POLARITIES
+from vkmz.sqlschema import sqlAdducts, sqlTables
+
+# number of rows inserted per executemany() call by SqlWriter
+SQL_BATCH_SIZE = 50000
+# maximum number of rows per Parquet row group
+PARQUET_ROW_GROUP_SIZE = 100000
+
+
+def tabularHeader(alternate=False, adducts=False):
+    """Return the header line of tabular output
+
+    Arguments:
+        alternate (bool): add a column of alternate predictions
+        adducts (bool): add a column of predicted adducts
+    """
+    t_header = (
+        "sample_name\tfeature_name\tpolarity\tmz\trt\tintensity\t"
+        "predicted_mass\tpredicted_delta\tpredicted_formula\t"
+        "predicted_element_count\tpredicted_hc\tpredicted_oc\t"
+        "predicted_nc\n"
+    )
+    if adducts:
+        t_header = t_header[:-1] + "\tpredicted_adduct\n"
+    if alternate:
+        t_header = t_header[:-1] + "\talternate_predictions\n"
+    return t_header
+
+
+def tabularLines(store, alternate=False, grouped=True, adducts=False):
+    """Yield lines of tabular output
+
+    Arguments:
+        store (FeatureStore): predicted features
+        alternate (bool): add a column of alternate predictions
+        grouped (bool): group lines by sample, see FeatureStore.intensities()
+        adducts (bool): add a column of predicted adducts
+    """
+    polarity = [POLARITIES[p] for p in store.polarity.tolist()]
+    mz = store.mz.tolist()
+    rt = store.rt.tolist()
+    for s, f, intensity in store.intensities(grouped):
+        predictions = store.predictions[f]
+        p = predictions[0]
+        t_row = (
+            f"{store.sample_names[s]}\t{store.feature_names[f]}\t"
+            f"{polarity[f]}\t{mz[f]}\t{rt[f]}\t"
+            f"{intensity}\t{p.mass}\t{p.delta}\t{p.formula}\t"
+            f"{p.element_count}\t{p.hc}\t{p.oc}\t{p.nc}\n"
+        )
+        if adducts:
+            t_row = t_row[:-1] + f"\t{p.adduct}\n"
+        if alternate and len(predictions) > 1:
+            t_append = []
+            for a in predictions[1:]:
+                if adducts:
+                    t_append.append((a.mass, a.formula, a.delta, a.adduct))
+                else:
+                    t_append.append((a.mass, a.formula, a.delta))
+            t_row = t_row[:-1] + "\t" + str(t_append) + "\n"
+        yield t_row
+
+
+def tabular(store, config):
     """Write results to tabular
 
     Arguments:
-        samples (dict): predicted-Samples
+        store (FeatureStore): predicted features
+        config (Config): settings of run
     """
     try:
-        with open(OUTPUT + ".tabular", "w") as t_file:
-            t_header = (
-                "sample_name\tfeature_name\tpolarity\tmz\trt\tintensity\t"
-                "predicted_mass\tpredicted_delta\tpredicted_formula\t"
-                "predicted_element_count\tpredicted_hc\tpredicted_oc\t"
-                "predicted_nc\n"
+        with openTabular(config) as t_file:
+            t_file.writelines(tabularHeader(config.alternate, bool(config.adducts)))
+            t_file.writelines(
+                tabularLines(store, config.alternate, adducts=bool(config.adducts))
             )
-            if ALTERNATE:
-                t_header = t_header[:-1] + "\talternate_predictions\n"
-            t_file.writelines(t_header)
-            for s in samples.values():
-                for sfi in s.sfis:
-                    f = sfi.feature
-                    p = f.predictions[0]
-                    t_row = (
-                        f"{s.name}\t{f.name}\t{f.polarity}\t{f.mz}\t{f.rt}\t"
-                        f"{sfi.intensity}\t{p.mass}\t{p.delta}\t{p.formula}\t"
-                        f"{p.element_count}\t{p.hc}\t{p.oc}\t{p.nc}\n"
-                    )
-                    if ALTERNATE and len(f.predictions) > 1:
-                        t_append = []
-                        for a in f.predictions[1:]:
-                            t_append.append((a.mass, a.formula, a.delta))
-                        t_row = t_row[:-1] + "\t" + str(t_append) + "\n"
-                    t_file.writelines(t_row)
     except IOError as error:
         print("IOError while writing tabular output")
         raise
 
 
-# TODO: write JSON per feature instead of per feature intensity
-#       requires js update
-def generateJson(samples):
-    """Convert results to JSON
+def openTabular(config):
+    """Open the tabular output file of a run for writing
+
+    Arguments:
+        config (Config): settings of run
+    """
+    path = outputPath(config.output + ".tabular", config.compress)
+    return openOutput(path, config.compress)
+
+
+def generateJson(store):
+    """Convert results to a JSON payload
 
-    Creates a JSON object as a sting for each feature.
+    Returns a dictionary of three parts, so that features and their predictions
+    are stored once instead of once per intensity:
 
-    At the end of the function, JSON objects are concatenated and the resulting
-    string is returned.
+        samples: list of sample names
+        features: table of feature name, polarity, mz, rt, and prediction lists
+        intensities: table of sample index, feature index, and intensity
+
+    Tables are dictionaries of equal length lists. Intensities are grouped by
+    sample, see FeatureStore.intensities(). Predictions have an "adduct" key if
+    adducts were searched.
 
     Arguments:
-        samples (dict): of predicted-Samples
+        store (FeatureStore): predicted features
     """
-    j_objs = []
-    for s in samples.values():
-        j_obj = []
-        for sfi in s.sfis:
-            f = sfi.feature
-            j_obj = {}
-            j_obj["sample_name"] = s.name
-            j_obj["feature_name"] = f.name
-            j_obj["polarity"] = f.polarity
-            j_obj["mz"] = f.mz
-            j_obj["rt"] = f.rt
-            j_obj["intensity"] = float(sfi.intensity)
-            j_obj["prediction"] = []
-            for p in f.predictions:
-                prediction = {}
-                prediction["mass"] = p.mass
-                prediction["delta"] = p.delta
-                prediction["formula"] = p.formula
-                prediction["hc"] = p.hc
-                prediction["oc"] = p.oc
-                prediction["nc"] = p.nc
-                element_count = {}
-                prediction["element_count"] = p.element_count
-                j_obj["prediction"].append(prediction)
-            j_objs.append(j_obj)
-    return j_objs
-
-
-def json_write(j_objs):
+    predictions = []
+    for feature_predictions in store.predictions:
+        j_predictions = []
+        for p in feature_predictions:
+            j_prediction = {
+                "mass": p.mass,
+                "delta": p.delta,
+                "formula": p.formula,
+                "hc": p.hc,
+                "oc": p.oc,
+                "nc": p.nc,
+                "element_count": p.element_count,
+            }
+            if p.adduct is not None:
+                j_prediction["adduct"] = p.adduct
+            j_predictions.append(j_prediction)
+        predictions.append(j_predictions)
+    order = store.sampleOrder()
+    return {
+        "samples": list(store.sample_names),
+        "features": {
+            "name": list(store.feature_names),
+            "polarity": [POLARITIES[p] for p in store.polarity.tolist()],
+            "mz": store.mz.tolist(),
+            "rt": store.rt.tolist(),
+            "prediction": predictions,
+        },
+        "intensities": {
+            "sample": store.sfi_sample[order].tolist(),
+            "feature": store.sfi_feature[order].tolist(),
+            "intensity": store.sfi_intensity[order].tolist(),
+        },
+    }
+
+
+def json_write(j_objs, config):
     """Write results to JSON
 
     Arguments:
-        json (str): predicted-features in json format
+        j_objs (dict): JSON payload, see generateJson()
+        config (Config): settings of run
     """
     try:
-        with open(OUTPUT + ".json", "w") as j_file:
+        path = outputPath(config.output + ".json", config.compress)
+        with openOutput(path, config.compress) as j_file:
             json.dump(j_objs, j_file, indent=4)
     except IOError as error:
         print("IOError while writing JSON output: %s" % error.strerror)
 
 
-def html(j_objs):
+def densityPayload(density):
+    """Convert density grids for the html webpage or a sidecar file
+
+    Returns density with each grid's cells and values as typed arrays, see
+    encodeArray().
+
+    Arguments:
+        density (dict): density grids, see vkmz.density.densityGrids()
+    """
+    grids = []
+    for grid in density["grids"]:
+        grid = dict(grid)
+        grid["cells"] = encodeArray(grid["cells"], "<u4")
+        grid["values"] = encodeArray(grid["values"], "<f4")
+        grids.append(grid)
+    return dict(density, grids=grids)
+
+
+def density(d_payload, config):
+    """Write density grids to a sidecar JSON file
+
+    Arguments:
+        d_payload (dict): density grids, see densityPayload()
+        config (Config): settings of run
+    """
+    try:
+        path = outputPath(config.output + "_density.json", config.compress)
+        with openOutput(path, config.compress) as d_file:
+            json.dump(d_payload, d_file)
+    except IOError as error:
+        print("IOError while writing density output: %s" % error.strerror)
+        raise
+
+
+class ParquetWriter(object):
+    """Write results to a Parquet file incrementally
+
+    Requires pyarrow. Each row is a sample-feature intensity with the columns of
+    tabular output, plus charge, as typed columns: sample, feature, polarity, and
+    formula strings are dictionary encoded and element counts are a map column.
+    With the --alternate flag, alternate predictions are a list of structs. With
+    the --adducts option, predictions have a dictionary encoded adduct.
+
+    Rows are written in row groups of up to PARQUET_ROW_GROUP_SIZE rows.
+
+    Attributes:
+        config (Config): settings of run
+        pa (module): pyarrow
+        schema (Schema): schema of rows
+        writer (ParquetWriter): pyarrow.parquet writer, None once closed
+    """
+
+    def __init__(self, config):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            print("Parquet output requires pyarrow: pip install pyarrow")
+            raise
+        self.config = config
+        self.pa = pa = pyarrow
+        strings = pa.dictionary(pa.int32(), pa.string())
+        fields = [
+            ("sample_name", strings),
+            ("feature_name", strings),
+            ("polarity", pa.dictionary(pa.int8(), pa.string())),
+            ("mz", pa.float64()),
+            ("rt", pa.float64()),
+            ("charge", pa.int32()),
+            ("intensity", pa.float64()),
+            ("predicted_mass", pa.float64()),
+            ("predicted_delta", pa.float64()),
+            ("predicted_formula", strings),
+            ("predicted_element_count", pa.map_(pa.string(), pa.int32())),
+            ("predicted_hc", pa.float64()),
+            ("predicted_oc", pa.float64()),
+            ("predicted_nc", pa.float64()),
+        ]
+        if config.adducts:
+            fields.append(("predicted_adduct", pa.dictionary(pa.int8(), pa.string())))
+        if config.alternate:
+            alternate = [
+                ("mass", pa.float64()),
+                ("formula", pa.string()),
+                ("delta", pa.float64()),
+            ]
+            if config.adducts:
+                alternate.append(("adduct", pa.string()))
+            fields.append(("alternate_predictions", pa.list_(pa.struct(alternate))))
+        self.schema = pa.schema(fields)
+        self.writer = pyarrow.parquet.ParquetWriter(
+            config.output + ".parquet", self.schema
+        )
+
+    def featureColumns(self, store):
+        """Return feature-level columns of a store
+
+        Returns a dict of column name to array with one value per feature.
+
+        Arguments:
+            store (FeatureStore): predicted features
+        """
+        pa = self.pa
+        predictions = [p[0] for p in store.predictions]
+        formulas = {}
+        formula_index = [
+            formulas.setdefault(p.formula, len(formulas)) for p in predictions
+        ]
+        charge = numpy.asarray(store.charge)
+        columns = {
+            "feature_name": pa.DictionaryArray.from_arrays(
+                pa.array(numpy.arange(len(predictions), dtype=numpy.int32)),
+                pa.array(store.feature_names, pa.string()),
+            ),
+            "polarity": pa.DictionaryArray.from_arrays(
+                pa.array(numpy.asarray(store.polarity, dtype=numpy.int8)),
+                pa.array(POLARITIES, pa.string()),
+            ),
+            "mz": pa.array(numpy.asarray(store.mz), pa.float64()),
+            "rt": pa.array(numpy.asarray(store.rt), pa.float64()),
+            "charge": pa.array(
+                numpy.nan_to_num(charge).astype(numpy.int32), mask=numpy.isnan(charge)
+            ),
+            "predicted_mass": pa.array([p.mass for p in predictions], pa.float64()),
+            "predicted_delta": pa.array([p.delta for p in predictions], pa.float64()),
+            "predicted_formula": pa.DictionaryArray.from_arrays(
+                pa.array(formula_index, pa.int32()),
+                pa.array(list(formulas), pa.string()),
+            ),
+            "predicted_element_count": pa.array(
+                [list(p.element_count.items()) for p in predictions],
+                self.schema.field("predicted_element_count").type,
+            ),
+            "predicted_hc": pa.array([p.hc for p in predictions], pa.float64()),
+            "predicted_oc": pa.array([p.oc for p in predictions], pa.float64()),
+            "predicted_nc": pa.array([p.nc for p in predictions], pa.float64()),
+        }
+        if self.config.adducts:
+            # labels of the predictions, which may not be the adducts searched by
+            # this run, e.g. in sql mode
+            adducts = {}
+            adduct_index = [
+                adducts.setdefault(p.adduct, len(adducts)) for p in predictions
+            ]
+            columns["predicted_adduct"] = pa.DictionaryArray.from_arrays(
+                pa.array(adduct_index, pa.int8()),
+                pa.array(list(adducts), pa.string()),
+            )
+        if self.config.alternate:
+            columns["alternate_predictions"] = pa.array(
+                [
+                    [
+                        {
+                            "mass": a.mass,
+                            "formula": a.formula,
+                            "delta": a.delta,
+                            "adduct": a.adduct,
+                        }
+                        for a in p[1:]
+                    ]
+                    or None
+                    for p in store.predictions
+                ],
+                self.schema.field("alternate_predictions").type,
+            )
+        return columns
+
+    def write(self, store, grouped=True):
+        """Write intensities of a store
+
+        Arguments:
+            store (FeatureStore): predicted features
+            grouped (bool): group rows by sample, see FeatureStore.intensities()
+        """
+        pa = self.pa
+        store.freeze()
+        features = self.featureColumns(store)
+        samples = pa.array(store.sample_names, pa.string())
+        order = store.sampleOrder() if grouped else numpy.arange(len(store.sfi_sample))
+        for start in range(0, len(order), PARQUET_ROW_GROUP_SIZE):
+            rows = order[start : start + PARQUET_ROW_GROUP_SIZE]
+            feature_index = pa.array(store.sfi_feature[rows])
+            columns = []
+            for name in self.schema.names:
+                if name == "sample_name":
+                    column = pa.DictionaryArray.from_arrays(
+                        pa.array(store.sfi_sample[rows].astype(numpy.int32)), samples
+                    )
+                elif name == "intensity":
+                    column = pa.array(store.sfi_intensity[rows], pa.float64())
+                else:
+                    column = features[name].take(feature_index)
+                columns.append(column)
+            self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Finish and close Parquet file, if it is open"""
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+def parquet(store, config):
+    """Write results to Parquet
+
+    Arguments:
+        store (FeatureStore): predicted features
+        config (Config): settings of run
+    """
+    with ParquetWriter(config) as writer:
+        writer.write(store)
+
+
+def generateBinaryPayload(store):
+    """Convert results to a binary payload for the html webpage
+
+    Returns a dictionary with the tables of generateJson(), except:
+    numeric columns are typed arrays, see encodeArray(), strings are indexes into
+    a table of unique strings, and predictions are one table with each feature's
+    first prediction at its prediction_offset. Element counts are left out.
+    Predictions have an adduct column if adducts were searched. Intensities are
+    in drawing order, largest first, so the webpage does not sort them.
+
+    Arguments:
+        store (FeatureStore): predicted features
+    """
+    strings = {}
+
+    def index(values):
+        indexes = [strings.setdefault(v, len(strings)) for v in values]
+        return encodeArray(indexes, indexType(len(strings)))
+
+    p_offsets = numpy.zeros(len(store.predictions) + 1, dtype="<u4")
+    numpy.cumsum([len(p) for p in store.predictions], out=p_offsets[1:])
+    predictions = [
+        p for feature_predictions in store.predictions for p in feature_predictions
+    ]
+    order = store.sampleOrder()
+    order = order[numpy.argsort(-store.sfi_intensity[order], kind="stable")]
+    payload = {
+        "format": "binary",
+        "samples": index(store.sample_names),
+        "features": {
+            "name": index(store.feature_names),
+            "polarity": index(POLARITIES[p] for p in store.polarity.tolist()),
+            "mz": encodeArray(store.mz, "<f8"),
+            "rt": encodeArray(store.rt, "<f8"),
+            "prediction_offset": encodeArray(p_offsets, "<u4"),
+        },
+        "predictions": {
+            "formula": index(p.formula for p in predictions),
+            "mass": encodeArray([p.mass for p in predictions], "<f8"),
+            "delta": encodeArray([p.delta for p in predictions], "<f8"),
+            "hc": encodeArray([p.hc for p in predictions], "<f4"),
+            "oc": encodeArray([p.oc for p in predictions], "<f4"),
+            "nc": encodeArray([p.nc for p in predictions], "<f4"),
+        },
+        "intensities": {
+            "sample": encodeArray(
+                store.sfi_sample[order], indexType(len(store.sample_names))
+            ),
+            "feature": encodeArray(
+                store.sfi_feature[order], indexType(len(store.feature_names))
+            ),
+            "intensity": encodeArray(store.sfi_intensity[order], "<f8"),
+        },
+    }
+    if any(p.adduct is not None for p in predictions):
+        payload["predictions"]["adduct"] = index(p.adduct for p in predictions)
+    payload["strings"] = list(strings)
+    return payload
+
+
+# JavaScript typed array of each numpy dtype used by encodeArray()
+TYPED_ARRAYS = {
+    "u1": "Uint8Array",
+    "<u2": "Uint16Array",
+    "<u4": "Uint32Array",
+    "<f4": "Float32Array",
+    "<f8": "Float64Array",
+}
+
+
+def encodeArray(values, dtype):
+    """Return values as a typed array for the html webpage
+
+    Returns a dictionary of the JavaScript typed array type and the array's
+    little-endian bytes in base64.
+
+    Arguments:
+        values (iterable): numbers
+        dtype (str): numpy dtype of array, a key of TYPED_ARRAYS
+    """
+    data = numpy.asarray(values, dtype=dtype).tobytes()
+    return {"type": TYPED_ARRAYS[dtype], "data": base64.b64encode(data).decode("ascii")}
+
+
+def indexType(count):
+    """Return the smallest unsigned dtype of indexes into a table
+
+    Arguments:
+        count (int): number of rows in table
+    """
+    if count <= 2**8:
+        return "u1"
+    elif count <= 2**16:
+        return "<u2"
+    return "<u4"
+
+
+@functools.lru_cache(maxsize=None)
+def htmlTemplate(template_file):
+    """Return the parts of the html template before and after its payload line
+
+    Templates are read and split once per process.
+
+    Arguments:
+        template_file (str): path to template
+    """
+    with open(template_file, "r", encoding="utf-8") as h_template:
+        template = h_template.read()
+    placeholder = re.search("^var payload.*$", template, flags=re.M)
+    return template[: placeholder.start()], template[placeholder.end() :]
+
+
+def html(j_objs, config):
     """Write results to html webpage
 
+    The webpage joins the payload's tables and draws large features first. If
+    the payload has a "density" key, see densityPayload(), the webpage draws
+    density grids when zoomed out.
+
     Arguments:
-        json (str): predicted-features in json format
+        j_objs (dict): JSON payload, see generateJson(), or binary payload, see
+                       generateBinaryPayload()
+        config (Config): settings of run
     """
-    # sort list by intensity
-    # reduces overlap by drawing large features first
-    j_objs = sorted(j_objs, key=lambda k: k["intensity"], reverse=True)
     try:
-        with open(
-            os.path.join(PREFIX, "d3.html"), "r", encoding="utf-8"
-        ) as h_template, open(OUTPUT + ".html", "w", encoding="utf-8") as h_file:
-            j_utf8 = "var data = " + json.dumps(j_objs)
-            for line in h_template:
-                line = re.sub("^var data.*$", j_utf8, line, flags=re.M)
-                h_file.write(line)
+        head, tail = htmlTemplate(os.path.join(config.prefix, "d3.html"))
+        with open(config.output + ".html", "w", encoding="utf-8") as h_file:
+            h_file.write(head)
+            h_file.write("var payload = ")
+            h_file.write(json.dumps(j_objs))
+            h_file.write(tail)
     except IOError as error:
         print("IOError while writing HTML output or reading HTML template")
         raise
 
 
-def metadata():
+def metadata(config):
     """Write VKMZ parameters to tabular file
 
-    Saves argument-generated constants from vkmz.arguments
+    Saves settings of run
+
+    Arguments:
+        config (Config): settings of run
     """
-    if METADATA:
+    if config.metadata:
         try:
-            with open(OUTPUT + "_metadata.tabular", "w") as m_file:
+            with open(config.output + "_metadata.tabular", "w") as m_file:
                 metadata = (
                     f"Mode\tMass\tOutput\tJSON\tSQL\tPolarity\t"
                     f"Neutral\tDatabase\tPrefix\tCharge\n"
-                    f"{MODE}\t{MASS_ERROR}\t{OUTPUT}\t{SQL}\t{POLARITY}\t"
-                    f"{NEUTRAL}\t{DATABASE}\t{PREFIX}\t{IMPUTE}\n"
+                    f"{config.mode}\t{config.mass_error}\t{config.output}\t"
+                    f"{config.json}\t{config.sql}\t{config.polarity}\t{config.neutral}\t"
+                    f"{config.database}\t{config.prefix}\t{config.impute}\n"
                 )
                 m_file.write(metadata)
         except IOError as error:
             print("IOError while writing metadata output: %s" % error.strerror)
 
 
-def sql(samples, features):
-    """Write results to sqlit3 database
+class SqlWriter(object):
+    """Write results to sqlit3 database incrementally
 
-    If the --metadata flag is set, vkmz.argument constants will be written to a
-    table.
+    Results can be written in several parts, e.g., one FeatureStore per chunk of
+    input. Samples and features are identified by name; each is inserted the
+    first time it is written and reused by later parts.
 
-    Arguments:
-        samples (dict): predicted-Samples
-        features (dict): predicted-Features
+    If the --metadata flag is set, settings of run will be written to a table
+    when the writer is closed.
+
+    The database is bulk loaded: all parts are written in one transaction with
+    journaling and syncing disabled, and indexes are created when the writer is
+    closed. An interrupted run leaves an unusable database, as it would leave
+    incomplete tabular and HTML output.
+
+    With --append, results are added to an existing database instead, see
+    open(). Samples and features already in the database are reused.
+
+    Used as a context manager, the writer is closed on success and rolled back,
+    see abort(), if the run fails.
+
+    Attributes:
+        config (Config): settings of run
+        con (Connection): database connection, None once closed
+        journaled (bool): results are added to an existing database, see open()
+        sample_ids (dict): sample name to Sample Id
+        feature_ids (dict): feature name to Feature Id
     """
-    con = sqlite3.connect(OUTPUT + ".db")
-    c = con.cursor()
-    # create tables
-    c.execute(
-        """
-        CREATE TABLE Sample (
-            Id INTEGER PRIMARY KEY,
-            Name TEXT
-            )
-        """
-    )
-    c.execute(
-        """
-        CREATE TABLE Feature (
-            Id INTEGER PRIMARY KEY,
-            Name TEXT,
-            Polarity TEXT,
-            Mz REAL,
-            Rt REAL,
-            Charge INTEGER
+
+    def __init__(self, config):
+        self.config = config
+        self.sample_ids = {}
+        self.feature_ids = {}
+        self.journaled = False
+        if config.append and os.path.isfile(config.output + ".db"):
+            self.open()
+            return
+        # transactions are managed explicitly
+        self.con = sqlite3.connect(config.output + ".db", isolation_level=None)
+        self.con.execute("PRAGMA journal_mode = OFF")
+        self.con.execute("PRAGMA synchronous = OFF")
+        self.con.execute("BEGIN")
+        self.create()
+        if config.adducts:
+            # predictions are only labeled by adduct if adducts are searched
+            self.con.execute("ALTER TABLE Prediction ADD COLUMN Adduct TEXT")
+            # adducts searched, checked by open() when appending
+            self.con.execute("CREATE TABLE Adduct (Name TEXT)")
+            self.con.executemany(
+                "INSERT INTO Adduct (Name) VALUES (?)",
+                [(adduct,) for adduct in config.adducts],
             )
+
+    def open(self):
+        """Open an existing database to add results to
+
+        Results are added in one journaled transaction, so an interrupted run
+        leaves the database as it was. Existing indexes are updated as rows are
+        added.
         """
-    )
-    c.execute(
-        """
-        CREATE TABLE Prediction (
-            Id INTEGER PRIMARY KEY AUTOINCREMENT,
-            Formula TEXT,
-            Mass TEXT,
-            Delta REAL,
-            ElementCount TEXT,
-            Hc REAL,
-            Oc REAL,
-            Nc REAL,
-            FeatureId INTEGER,
-            FOREIGN KEY(FeatureId) REFERENCES Feature(Id)
+        path = self.config.output + ".db"
+        adducts = sqlAdducts(path)
+        searched = sorted(set(self.config.adducts)) if self.config.adducts else None
+        if adducts != searched:
+            written = f"--adducts {' '.join(adducts)}" if adducts else "no --adducts"
+            raise ValueError(
+                f"{path} was written with {written}, append to it with the same "
+                "adducts"
             )
+        self.con = sqlite3.connect(path, isolation_level=None)
+        self.con.execute("BEGIN IMMEDIATE")
+        self.journaled = True
+        self.load()
+
+    def load(self):
+        """Read Ids of samples and features of an existing database"""
+        c = self.con.cursor()
+        self.sample_ids = {
+            name: i for i, name in c.execute("SELECT Id, Name FROM Sample")
+        }
+        self.feature_ids = {
+            name: i for i, name in c.execute("SELECT Id, Name FROM Feature")
+        }
+
+    def create(self):
+        """Create tables"""
+        c = self.con.cursor()
+        c.execute("""
+            CREATE TABLE Sample (
+                Id INTEGER PRIMARY KEY,
+                Name TEXT
+                )
+            """)
+        c.execute("""
+            CREATE TABLE Feature (
+                Id INTEGER PRIMARY KEY,
+                Name TEXT,
+                Polarity TEXT,
+                Mz REAL,
+                Rt REAL,
+                Charge INTEGER
+                )
+            """)
+        c.execute("""
+            CREATE TABLE Prediction (
+                Id INTEGER PRIMARY KEY AUTOINCREMENT,
+                Formula TEXT,
+                Mass TEXT,
+                Delta REAL,
+                ElementCount TEXT,
+                Hc REAL,
+                Oc REAL,
+                Nc REAL,
+                FeatureId INTEGER,
+                FOREIGN KEY(FeatureId) REFERENCES Feature(Id)
+                )
+            """)
+        c.execute("""
+            CREATE TABLE SampleFeatureIntensity (
+                Id INTEGER PRIMARY KEY AUTOINCREMENT,
+                Intensity REAL,
+                SampleId INTEGER,
+                FeatureId INTEGER,
+                FOREIGN KEY(SampleId) REFERENCES Sample(Id),
+                FOREIGN KEY(FeatureId) REFERENCES Feature(Id)
+                )
+            """)
+
+    def insertPredictions(self, columns, rows):
+        """Insert Prediction rows, with their adducts if adducts are searched
+
+        Arguments:
+            columns (list): Prediction columns of rows, except Adduct
+            rows (list): (parameter tuple, Prediction) pairs
         """
-    )
-    c.execute(
-        """
-        CREATE TABLE SampleFeatureIntensity (
-            Id INTEGER PRIMARY KEY AUTOINCREMENT,
-            Intensity REAL,
-            SampleId INTEGER,
-            FeatureId INTEGER,
-            FOREIGN KEY(SampleId) REFERENCES Sample(Id),
-            FOREIGN KEY(FeatureId) REFERENCES Feature(Id)
-            )
+        if self.config.adducts:
+            columns = columns + ["Adduct"]
+            rows = (values + (p.adduct,) for values, p in rows)
+        else:
+            rows = (values for values, p in rows)
+        self.insert(
+            f"INSERT INTO Prediction ({', '.join(columns)}) "
+            f"VALUES ({', '.join('?' * len(columns))})",
+            rows,
+        )
+
+    def insert(self, statement, rows):
+        """Insert rows in batches of SQL_BATCH_SIZE
+
+        Arguments:
+            statement (str): INSERT statement
+            rows (iterable): parameter tuples of statement
         """
-    )
-    # add Sample values
-    s_sql = []
-    i = 1  # unique Id
-    for sample_name in samples.keys():
-        s_sql.append((i, sample_name))
-        i += 1
-    c.executemany(
+        c = self.con.cursor()
+        rows = iter(rows)
+        while True:
+            batch = list(itertools.islice(rows, SQL_BATCH_SIZE))
+            if not batch:
+                break
+            c.executemany(statement, batch)
+
+    def write(self, store, grouped=True):
+        """Write samples, features, predictions, and intensities of a store
+
+        Arguments:
+            store (FeatureStore): predicted features
+            grouped (bool): group intensities by sample, see
+                            FeatureStore.intensities()
         """
-        INSERT INTO Sample (
-            Id,
-            Name
-            )
-        VALUES (?, ?)
-        """,
-        (s_sql),
-    )
-    # add Feature and Prediction values
-    f_sql = []
-    p_sql = []
-    i = 1
-    for f in features.values():
-        f_sql.append((i, f.name, f.polarity, f.mz, f.rt, f.charge))
-        for p in f.predictions:
-            p_sql.append(
-                (p.formula, p.mass, p.delta, str(p.element_count), p.hc, p.oc, p.nc, i)
-            )
-        i += 1
-    c.executemany(
+        # add Sample values
+        s_sql = []
+        s_ids = []
+        for sample_name in store.sample_names:
+            if sample_name not in self.sample_ids:
+                i = len(self.sample_ids) + 1  # unique Id
+                self.sample_ids[sample_name] = i
+                s_sql.append((i, sample_name))
+            s_ids.append(self.sample_ids[sample_name])
+        self.insert(
+            """
+            INSERT INTO Sample (
+                Id,
+                Name
+                )
+            VALUES (?, ?)
+            """,
+            (s_sql),
+        )
+        # add Feature and Prediction values
+        f_sql = []
+        new_features = []
+        f_ids = []
+        for index, feature_name in enumerate(store.feature_names):
+            if feature_name not in self.feature_ids:
+                i = len(self.feature_ids) + 1
+                self.feature_ids[feature_name] = i
+                f = store.feature(index)
+                f_sql.append((i, f.name, f.polarity, f.mz, f.rt, f.charge))
+                new_features.append((i, f))
+            f_ids.append(self.feature_ids[feature_name])
+        self.insert(
+            """
+            INSERT INTO Feature (
+                Id,
+                Name,
+                Polarity,
+                Mz,
+                Rt,
+                Charge
+                )
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (f_sql),
+        )
+        self.writePredictions(new_features)
+        # add SampleFeatureIntensity values, mapping store indexes to Ids
+        store.freeze()
+        order = store.sampleOrder() if grouped else slice(None)
+        s_ids = numpy.array(s_ids, dtype=numpy.int64)
+        f_ids = numpy.array(f_ids, dtype=numpy.int64)
+        sfi_sql = zip(
+            store.sfi_intensity[order].tolist(),
+            s_ids[store.sfi_sample[order]].tolist(),
+            f_ids[store.sfi_feature[order]].tolist(),
+        )
+        self.insert(
+            """
+            INSERT INTO SampleFeatureIntensity (
+                 Intensity,
+                 SampleId,
+                 FeatureId
+                 )
+            VALUES (?,  ?, ?)
+            """,
+            (sfi_sql),
+        )
+
+    def writePredictions(self, features):
+        """Write predictions of newly written features
+
+        Arguments:
+            features (list): (Feature Id, Feature) tuples
         """
-        INSERT INTO Feature (
-            Id,
-            Name,
-            Polarity,
-            Mz,
-            Rt,
-            Charge
+        p_sql = []
+        for i, f in features:
+            for p in f.predictions:
+                p_sql.append(
+                    (
+                        (
+                            p.formula,
+                            p.mass,
+                            p.delta,
+                            str(p.element_count),
+                            p.hc,
+                            p.oc,
+                            p.nc,
+                            i,
+                        ),
+                        p,
+                    )
+                )
+        self.insertPredictions(
+            ["Formula", "Mass", "Delta", "ElementCount", "Hc", "Oc", "Nc", "FeatureId"],
+            p_sql,
+        )
+
+    def createIndexes(self):
+        """Create indexes of loaded tables"""
+        c = self.con.cursor()
+        # indexes of appended databases already exist
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS PredictionFeatureId ON Prediction (FeatureId)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS SampleFeatureIntensitySampleId "
+            "ON SampleFeatureIntensity (SampleId)"
+        )
+        c.execute(
+            "CREATE INDEX IF NOT EXISTS SampleFeatureIntensityFeatureId "
+            "ON SampleFeatureIntensity (FeatureId)"
+        )
+
+    def close(self):
+        """Write metadata, create indexes, commit, and close database"""
+        if self.con is None:
+            return
+        config = self.config
+        c = self.con.cursor()
+        # indexes are built once, after loading, instead of updated per row
+        self.createIndexes()
+        if config.metadata:
+            # add Metadata table and values, a row per run
+            c.execute("""
+                CREATE TABLE IF NOT EXISTS Metadata (
+                    Mode,
+                    MassError,
+                    Output,
+                    Json,
+                    Sql,
+                    Polarity,
+                    Neutral,
+                    Database,
+                    Prefix,
+                    Charge
+                    )
+                """)
+            c.execute(
+                """
+                INSERT INTO Metadata (
+                     Mode,
+                     MassError,
+                     Output,
+                     Json,
+                     Sql,
+                     Polarity,
+                     Neutral,
+                     Database,
+                     Prefix,
+                     Charge
+                     )
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    config.mode,
+                    config.mass_error,
+                    config.output,
+                    config.json,
+                    config.sql,
+                    config.polarity,
+                    config.neutral,
+                    config.database,
+                    config.prefix,
+                    config.impute,
+                ),
             )
-        VALUES (?, ?, ?, ?, ?, ?)
-        """,
-        (f_sql),
-    )
-    c.executemany(
+        c.execute("COMMIT")
+        self.con.close()
+        self.con = None
+
+    def abort(self):
+        """Roll back results written so far and close database
+
+        An appended database is left as it was. A new database is written without
+        a journal, so it cannot be rolled back and is left incomplete, as an
+        interrupted run would leave it.
         """
-        INSERT INTO Prediction (
-            Formula,
-            Mass,
-            Delta,
-            ElementCount,
-            Hc,
-            Oc,
-            Nc,
-            FeatureId
-            )
-        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
-        """,
-        (p_sql),
-    )
-    # add SampleFeatureIntensity values
-    sfi_sql = []
-    s_id = 1
-    for sample in samples.values():
-        for sfi in sample.sfis:
-            f_id = list(features).index(sfi.feature.name) + 1
-            sfi_sql.append((sfi.intensity, s_id, f_id))
-        s_id += 1
-    c.executemany(
+        if self.con is None:
+            return
+        if self.journaled and self.con.in_transaction:
+            self.con.execute("ROLLBACK")
+        self.con.close()
+        self.con = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+
+class NormalizedSqlWriter(SqlWriter):
+    """Write results to a normalized, indexed sqlite3 database incrementally
+
+    Sample, Feature, and SampleFeatureIntensity tables are the same as those of
+    SqlWriter. Predicted formulas are stored once per mass in a Formula table with
+    a REAL Mass column, their element counts in an ElementCount table, and
+    predictions link features to formulas with their Delta. A formula can have
+    several masses in formula mode, where the mass of a prediction is its
+    feature's mz.
+
+    FormulaRegion is an R-tree of each formula's (Oc, Hc, Nc) point for van
+    Krevelen region queries. R-tree coordinates are 32-bit floats rounded
+    outwards, so search for overlapping boxes and filter on Formula's ratios for
+    exact boundaries, e.g.:
+
+        SELECT Formula.* FROM FormulaRegion JOIN Formula USING (Id)
+        WHERE MaxOc >= 0.2 AND MinOc <= 0.6 AND MaxHc >= 1.0 AND MinHc <= 2.0
+        AND Oc BETWEEN 0.2 AND 0.6 AND Hc BETWEEN 1.0 AND 2.0
+
+    Attributes:
+        formula_ids (dict): (formula, mass) to Formula Id
+    """
+
+    def __init__(self, config):
+        self.formula_ids = {}
+        super().__init__(config)
+
+    def load(self):
+        """Read Ids of samples, features, and formulas of an existing database"""
+        super().load()
+        c = self.con.cursor()
+        self.formula_ids = {
+            (formula, mass): i
+            for i, formula, mass in c.execute("SELECT Id, Formula, Mass FROM Formula")
+        }
+
+    def create(self):
+        """Create tables"""
+        c = self.con.cursor()
+        c.execute("""
+            CREATE TABLE Sample (
+                Id INTEGER PRIMARY KEY,
+                Name TEXT
+                )
+            """)
+        c.execute("""
+            CREATE TABLE Feature (
+                Id INTEGER PRIMARY KEY,
+                Name TEXT,
+                Polarity TEXT,
+                Mz REAL,
+                Rt REAL,
+                Charge INTEGER
+                )
+            """)
+        c.execute("""
+            CREATE TABLE Formula (
+                Id INTEGER PRIMARY KEY,
+                Formula TEXT,
+                Mass REAL,
+                Hc REAL,
+                Oc REAL,
+                Nc REAL
+                )
+            """)
+        c.execute("""
+            CREATE TABLE ElementCount (
+                FormulaId INTEGER,
+                Element TEXT,
+                Count INTEGER,
+                FOREIGN KEY(FormulaId) REFERENCES Formula(Id)
+                )
+            """)
+        c.execute("""
+            CREATE TABLE Prediction (
+                Id INTEGER PRIMARY KEY AUTOINCREMENT,
+                Delta REAL,
+                FeatureId INTEGER,
+                FormulaId INTEGER,
+                FOREIGN KEY(FeatureId) REFERENCES Feature(Id),
+                FOREIGN KEY(FormulaId) REFERENCES Formula(Id)
+                )
+            """)
+        c.execute("""
+            CREATE TABLE SampleFeatureIntensity (
+                Id INTEGER PRIMARY KEY AUTOINCREMENT,
+                Intensity REAL,
+                SampleId INTEGER,
+                FeatureId INTEGER,
+                FOREIGN KEY(SampleId) REFERENCES Sample(Id),
+                FOREIGN KEY(FeatureId) REFERENCES Feature(Id)
+                )
+            """)
+        c.execute("""
+            CREATE VIRTUAL TABLE FormulaRegion USING rtree(
+                Id,
+                MinOc, MaxOc,
+                MinHc, MaxHc,
+                MinNc, MaxNc
+                )
+            """)
+
+    def writePredictions(self, features):
+        """Write predictions, and formulas not yet written, of new features
+
+        Arguments:
+            features (list): (Feature Id, Feature) tuples
         """
-        INSERT INTO SampleFeatureIntensity (
-             Intensity,
-             SampleId,
-             FeatureId
-             )
-        VALUES (?,  ?, ?)
-        """,
-        (sfi_sql),
-    )
-    if METADATA:
-        # add Metadata table and values
-        c.execute(
+        formula_sql = []
+        element_sql = []
+        region_sql = []
+        p_sql = []
+        for i, f in features:
+            for p in f.predictions:
+                formula_id = self.formula_ids.get((p.formula, p.mass))
+                if formula_id is None:
+                    formula_id = len(self.formula_ids) + 1
+                    self.formula_ids[(p.formula, p.mass)] = formula_id
+                    formula_sql.append(
+                        (formula_id, p.formula, p.mass, p.hc, p.oc, p.nc)
+                    )
+                    for element, count in p.element_count.items():
+                        element_sql.append((formula_id, element, count))
+                    region_sql.append((formula_id, p.oc, p.oc, p.hc, p.hc, p.nc, p.nc))
+                p_sql.append(((p.delta, i, formula_id), p))
+        self.insert(
             """
-            CREATE TABLE Metadata (
-                Mode,
-                MassError,
-                Output,
-                Json,
-                Sql,
-                Polarity,
-                Neutral,
-                Database,
-                Prefix,
-                Charge
+            INSERT INTO Formula (
+                Id,
+                Formula,
+                Mass,
+                Hc,
+                Oc,
+                Nc
                 )
+            VALUES (?, ?, ?, ?, ?, ?)
+            """,
+            (formula_sql),
+        )
+        self.insert(
             """
+            INSERT INTO ElementCount (
+                FormulaId,
+                Element,
+                Count
+                )
+            VALUES (?, ?, ?)
+            """,
+            (element_sql),
         )
-        c.execute(
+        self.insert(
             """
-            INSERT INTO Metadata (
-                 Mode,
-                 MassError,
-                 Output,
-                 Json,
-                 Sql,
-                 Polarity,
-                 Neutral,
-                 Database,
-                 Directory,
-                 Impute
-                 )
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            INSERT INTO FormulaRegion (
+                Id,
+                MinOc, MaxOc,
+                MinHc, MaxHc,
+                MinNc, MaxNc
+                )
+            VALUES (?, ?, ?, ?, ?, ?, ?)
             """,
+            (region_sql),
+        )
+        self.insertPredictions(["Delta", "FeatureId", "FormulaId"], p_sql)
+
+    def createIndexes(self):
+        """Create indexes of loaded tables"""
+        c = self.con.cursor()
+        for index, table, columns in [
+            ("SampleName", "Sample", "Name"),
+            ("FeatureName", "Feature", "Name"),
+            ("FeatureMz", "Feature", "Mz"),
+            ("FormulaFormula", "Formula", "Formula"),
+            ("FormulaMass", "Formula", "Mass"),
+            ("ElementCountFormulaId", "ElementCount", "FormulaId"),
+            ("ElementCountElement", "ElementCount", "Element, Count"),
+            ("PredictionFeatureId", "Prediction", "FeatureId"),
+            ("PredictionFormulaId", "Prediction", "FormulaId"),
+            ("SampleFeatureIntensitySampleId", "SampleFeatureIntensity", "SampleId"),
             (
-                MODE,
-                MASS_ERROR,
-                OUTPUT,
-                JSON,
-                SQL,
-                POLARITY,
-                NEUTRAL,
-                DATABASE,
-                PREFIX,
-                IMPUTE,
+                "SampleFeatureIntensityFeatureId",
+                "SampleFeatureIntensity",
+                "FeatureId",
             ),
-        )
-    con.commit()
-    con.close()
+        ]:
+            c.execute(f"CREATE INDEX IF NOT EXISTS {index} ON {table} ({columns})")
+
+
+def sqlWriter(config):
+    """Return the SQL writer of a run
+
+    Appended databases keep their schema, with or without --normalized-sql.
+
+    Arguments:
+        config (Config): settings of run
+    """
+    normalized = config.normalized_sql
+    if config.append and os.path.isfile(config.output + ".db"):
+        con = sqlite3.connect(config.output + ".db")
+        normalized = "Formula" in sqlTables(con)
+        con.close()
+    if normalized:
+        return NormalizedSqlWriter(config)
+    return SqlWriter(config)
+
+
+def sql(store, config):
+    """Write results to sqlit3 database
+
+    If the --metadata flag is set, settings of run will be written to a table.
+
+    Arguments:
+        store (FeatureStore): predicted features
+        config (Config): settings of run
+    """
+    with sqlWriter(config) as writer:
+        writer.write(store)